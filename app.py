@@ -1,4 +1,7 @@
 # Fisheries System - Production Version for Railway
+# Thread budget OpenCV/BLAS per gunicorn worker, harus sebelum numpy di-import (face_models)
+from thread_budget import apply_thread_budget
+apply_thread_budget()
 from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
 from functools import wraps
 import os
@@ -7,7 +10,10 @@ from kapal_models import db, Kapal, LogistikKapal, init_kapal_database, get_kapa
 from budidaya_models import PermintaanBenih, StokBenih, DistribusiBenih, init_budidaya_database, get_budidaya_analytics
 from tangkap_models import TripPenangkapan, HasilTangkapan, init_tangkap_database, get_tangkap_analytics
 from pdspkp_models import PermohonanSertifikasiProduk, LaporanMonitoringMutu, init_pdspkp_database, get_pdspkp_analytics
-from opencv_face_system import face_system
+from face_models import init_face_database
+from face_service import get_face_system, get_enrolled_users, get_face_engine_stats, is_face_system_loaded, warm_up_face_system
+from face_metrics import StageTimer, face_metrics
+from face_audit import face_audit_writer
 from datetime import datetime, date, timedelta
 import json
 
@@ -34,6 +40,13 @@ init_kapal_database(app)
 init_budidaya_database(app)
 init_tangkap_database(app)
 init_pdspkp_database(app)
+init_face_database(app)
+face_audit_writer.init_app(app)
+
+# Face engine dibuat lazy saat request face pertama; FACE_WARMUP=1 untuk load saat worker boot
+if os.environ.get('FACE_WARMUP') == '1':
+    with app.app_context():
+        warm_up_face_system()
 
 # Production User Database
 DEMO_USERS = {
@@ -61,6 +74,12 @@ DEMO_USERS = {
     'dhika': {'password': 'dhika123', 'role': 'admin', 'full_name': 'Dhika Admin'}
 }
 
+# Content-Type untuk upload image binary (tanpa base64)
+FACE_IMAGE_MIMETYPES = ('image/jpeg', 'image/png', 'application/octet-stream')
+
+# Maksimal frame per request di /api/face/recognize/batch
+MAX_FACE_BATCH_FRAMES = int(os.environ.get('MAX_FACE_BATCH_FRAMES', 10))
+
 # Decorator untuk proteksi role
 def require_role(required_role):
     def decorator(f):
@@ -104,7 +123,7 @@ def login():
             flash(f'Login berhasil! Selamat datang, {DEMO_USERS[username]["full_name"]} ({DEMO_USERS[username]["role"]}).')
             
             # Check if user needs face enrollment
-            if username not in face_system.get_enrolled_users():
+            if username not in get_enrolled_users():
                 flash('Untuk keamanan tambahan, silakan daftarkan wajah Anda untuk face login!')
                 return redirect(url_for('face_enrollment_page'))
             
@@ -210,7 +229,7 @@ def dashboard_pdspkp():
 def dashboard_admin():
     try:
         analytics = get_kapal_analytics()
-        enrolled_users = face_system.get_enrolled_users()
+        enrolled_users = get_enrolled_users()
         
         stats = {
             'total_users': len(DEMO_USERS),
@@ -232,19 +251,29 @@ def dashboard_admin():
 def api_face_users():
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
-    enrolled_users = face_system.get_enrolled_users()
+    enrolled_users = get_enrolled_users()
     return jsonify({
         'success': True,
         'users': enrolled_users,
         'count': len(enrolled_users)
     })
 
+@app.route('/api/face/metrics')
+@require_role('admin')
+def api_face_metrics():
+    return jsonify({
+        'success': True,
+        'engine': get_face_engine_stats(),
+        'audit': face_audit_writer.stats(),
+        'stages': face_metrics.percentiles()
+    })
+
 @app.route('/api/face/delete/<username>', methods=['DELETE'])
 @require_role('admin')
 def api_delete_face_user(username):
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
-    result = face_system.delete_user(username)
+    result = get_face_system().delete_user(username)
     return jsonify(result)
 
 # Face Recognition Routes
@@ -261,8 +290,7 @@ def face_login_page():
 @require_role('any')
 def api_enroll_face():
     try:
-        data = request.get_json()
-        image_data = data.get('image_data')
+        image_data = get_face_image_payload()
         
         if not image_data:
             return jsonify({'success': False, 'message': 'No image data provided'})
@@ -273,7 +301,7 @@ def api_enroll_face():
             'full_name': session.get('full_name', username)
         }
         
-        result = face_system.enroll_face(username, image_data, user_info)
+        result = get_face_system().enroll_face(username, image_data, user_info)
         return jsonify(result)
         
     except Exception as e:
@@ -282,35 +310,133 @@ def api_enroll_face():
 @app.route('/api/face/recognize', methods=['POST'])
 def api_recognize_face():
     try:
-        data = request.get_json()
-        image_data = data.get('image_data')
+        image_data = get_face_image_payload()
         
         if not image_data:
             return jsonify({'success': False, 'message': 'No image data provided'})
         
-        result = face_system.recognize_face(image_data)
+        timer = StageTimer()
+        result = get_face_system().recognize_face(image_data, timer=timer)
+        login_face_user(result)
+        record_face_recognition(result, timer)
         
-        if result['success']:
-            username = result['user']['username']
-            
-            if username in DEMO_USERS:
-                session['user_id'] = username
-                session['username'] = username
-                session['role'] = DEMO_USERS[username]['role']
-                session['full_name'] = DEMO_USERS[username]['full_name']
-                session['login_method'] = 'face_recognition'
-                
-                result['redirect_url'] = url_for('welcome')
-                result['message'] = f"Welcome back, {DEMO_USERS[username]['full_name']}!"
-            else:
-                result['success'] = False
-                result['message'] = 'User not found in system'
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Recognition error: {str(e)}'})
+
+@app.route('/api/face/verify', methods=['POST'])
+def api_verify_face():
+    """
+    1:1 face login: username di-claim (?username=, form field, atau JSON 'username'),
+    face hanya dibandingkan dengan template user tersebut.
+    Tanpa username -> fallback ke 1:N identification seperti /api/face/recognize
+    """
+    try:
+        image_data = get_face_image_payload()
+        
+        if not image_data:
+            return jsonify({'success': False, 'message': 'No image data provided'})
+        
+        username = (request.args.get('username') or request.form.get('username')
+                    or (request.get_json(silent=True) or {}).get('username') or '').strip()
+        
+        timer = StageTimer()
+        if username:
+            result = get_face_system().verify_face(username, image_data, timer=timer)
+        else:
+            result = get_face_system().recognize_face(image_data, timer=timer)
+        login_face_user(result)
+        record_face_recognition(result, timer)
+        
+        return jsonify(result)
+    
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Verification error: {str(e)}'})
+
+@app.route('/api/face/recognize/batch', methods=['POST'])
+def api_recognize_face_batch():
+    try:
+        if request.mimetype == 'multipart/form-data':
+            images = [upload.read() for upload in request.files.getlist('images')]
+        else:
+            images = (request.get_json(silent=True) or {}).get('images') or []
+        
+        if not images:
+            return jsonify({'success': False, 'message': 'No image data provided'})
+        
+        if len(images) > MAX_FACE_BATCH_FRAMES:
+            return jsonify({'success': False, 'message': f'Too many frames (max {MAX_FACE_BATCH_FRAMES})'}), 413
+        
+        timer = StageTimer()
+        result = get_face_system().recognize_faces_batch(images, timer=timer)
+        login_face_user(result)
+        record_face_recognition(result, timer)
         
         return jsonify(result)
         
     except Exception as e:
         return jsonify({'success': False, 'message': f'Recognition error: {str(e)}'})
 
+def get_face_image_payload():
+    """
+    Ambil image dari request face API:
+    - raw body image/jpeg / image/png / application/octet-stream (Blob dari canvas.toBlob)
+    - multipart/form-data dengan field 'image'
+    - JSON {'image_data': <base64 data URL>} (legacy)
+    Returns: bytes-like (binary path) atau base64 string
+    """
+    if request.mimetype in FACE_IMAGE_MIMETYPES:
+        return request.get_data(cache=False)
+    
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        return upload.read() if upload else None
+    
+    data = request.get_json(silent=True) or {}
+    return data.get('image_data')
+
+def record_face_recognition(result, timer):
+    """
+    Catat timing per stage ke rolling metrics + FaceRecognitionLog
+    Breakdown dikembalikan di response jika request memakai ?debug=1
+    Log row di-queue ke face_audit_writer (bulk insert di background, tanpa commit per request)
+    """
+    timings = timer.as_dict()
+    face_metrics.record(timings)
+    if request.args.get('debug') == '1':
+        result['timings'] = timings
+    
+    face_audit_writer.submit_log(
+        username=result['user']['username'] if result['success'] else None,
+        recognized=result['success'],
+        confidence_score=result.get('confidence'),
+        ip_address=request.remote_addr,
+        user_agent=request.user_agent.string[:500],
+        processing_time_ms=int(round(timings['total'])),
+        error_message=None if result['success'] else result.get('message')
+    )
+
+def login_face_user(result):
+    """Create session dari hasil face recognition yang sukses"""
+    if not result['success']:
+        return
+    
+    username = result['user']['username']
+    
+    if username in DEMO_USERS:
+        session['user_id'] = username
+        session['username'] = username
+        session['role'] = DEMO_USERS[username]['role']
+        session['full_name'] = DEMO_USERS[username]['full_name']
+        session['login_method'] = 'face_recognition'
+        
+        result['redirect_url'] = url_for('welcome')
+        result['message'] = f"Welcome back, {DEMO_USERS[username]['full_name']}!"
+    else:
+        result['success'] = False
+        result['message'] = 'User not found in system'
+
 # ==================== BUDIDAYA ROUTES ====================
 
 @app.route('/budidaya/permintaan/add', methods=['GET', 'POST'])
@@ -599,7 +725,7 @@ def logout():
 @app.route('/status')
 def status():
     analytics = get_kapal_analytics()
-    enrolled_users = face_system.get_enrolled_users()
+    enrolled_users = get_enrolled_users()
     
     return jsonify({
         'status': 'OK',
@@ -608,6 +734,7 @@ def status():
         'kapal_count': analytics['total_kapal'],
         'enrolled_faces': len(enrolled_users),
         'face_system_ready': True,
+        'face_system_loaded': is_face_system_loaded(),
         'environment': 'production' if os.environ.get('DATABASE_URL') else 'development'
     })
 
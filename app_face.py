@@ -7,7 +7,8 @@ from kapal_models import db, Kapal, LogistikKapal, init_kapal_database, get_kapa
 from budidaya_models import PermintaanBenih, StokBenih, DistribusiBenih, init_budidaya_database, get_budidaya_analytics
 from tangkap_models import TripPenangkapan, HasilTangkapan, init_tangkap_database, get_tangkap_analytics
 from pdspkp_models import PermohonanSertifikasiProduk, LaporanMonitoringMutu, init_pdspkp_database, get_pdspkp_analytics
-from opencv_face_system import face_system
+from face_models import init_face_database
+from face_service import get_face_system, get_enrolled_users, is_face_system_loaded
 from datetime import datetime, date, timedelta
 import json
 
@@ -26,6 +27,7 @@ init_kapal_database(app)
 init_budidaya_database(app)
 init_tangkap_database(app)
 init_pdspkp_database(app)
+init_face_database(app)  # Tabel face_registry (registry default FACE_REGISTRY_BACKEND=database)
 
 # User database (demo users)
 DEMO_USERS = {
@@ -96,7 +98,7 @@ def login():
             flash(f'Login berhasil! Selamat datang, {DEMO_USERS[username]["full_name"]} ({DEMO_USERS[username]["role"]}).')
             
             # Check if user needs face enrollment
-            if username not in face_system.get_enrolled_users():
+            if username not in get_enrolled_users():
                 flash('Untuk keamanan tambahan, silakan daftarkan wajah Anda untuk face login!')
                 return redirect(url_for('face_enrollment_page'))
             
@@ -198,7 +200,7 @@ def dashboard_pdspkp():
 @require_role('admin')
 def dashboard_admin():
     analytics = get_kapal_analytics()
-    enrolled_users = face_system.get_enrolled_users()
+    enrolled_users = get_enrolled_users()
     
     stats = {
         'total_users': len(DEMO_USERS),
@@ -226,6 +228,24 @@ def face_login_page():
     """
     return render_template('face_login.html')
 
+# Content-Type untuk upload image binary (tanpa base64)
+FACE_IMAGE_MIMETYPES = ('image/jpeg', 'image/png', 'application/octet-stream')
+
+def get_face_image_payload():
+    """
+    Ambil image dari request face API: raw image body, multipart field 'image',
+    atau JSON {'image_data': <base64 data URL>} (legacy)
+    """
+    if request.mimetype in FACE_IMAGE_MIMETYPES:
+        return request.get_data(cache=False)
+    
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        return upload.read() if upload else None
+    
+    data = request.get_json(silent=True) or {}
+    return data.get('image_data')
+
 @app.route('/api/face/enroll', methods=['POST'])
 @require_role('any')
 def api_enroll_face():
@@ -233,8 +253,7 @@ def api_enroll_face():
     API untuk enroll face
     """
     try:
-        data = request.get_json()
-        image_data = data.get('image_data')
+        image_data = get_face_image_payload()
         
         if not image_data:
             return jsonify({'success': False, 'message': 'No image data provided'})
@@ -246,7 +265,7 @@ def api_enroll_face():
         }
         
         # Enroll face
-        result = face_system.enroll_face(username, image_data, user_info)
+        result = get_face_system().enroll_face(username, image_data, user_info)
         
         return jsonify(result)
         
@@ -259,14 +278,13 @@ def api_recognize_face():
     API untuk face recognition login
     """
     try:
-        data = request.get_json()
-        image_data = data.get('image_data')
+        image_data = get_face_image_payload()
         
         if not image_data:
             return jsonify({'success': False, 'message': 'No image data provided'})
         
         # Recognize face
-        result = face_system.recognize_face(image_data)
+        result = get_face_system().recognize_face(image_data)
         
         if result['success']:
             username = result['user']['username']
@@ -297,7 +315,7 @@ def api_face_users():
     """
     API untuk get enrolled users (admin only)
     """
-    enrolled_users = face_system.get_enrolled_users()
+    enrolled_users = get_enrolled_users()
     return jsonify({
         'success': True,
         'users': enrolled_users,
@@ -310,7 +328,7 @@ def api_delete_face_user(username):
     """
     API untuk delete enrolled user (admin only)
     """
-    result = face_system.delete_user(username)
+    result = get_face_system().delete_user(username)
     return jsonify(result)
 
 # ==================== KAPAL ROUTES ====================
@@ -790,7 +808,7 @@ def logout():
 @app.route('/status')
 def status():
     analytics = get_kapal_analytics()
-    enrolled_users = face_system.get_enrolled_users()
+    enrolled_users = get_enrolled_users()
     
     return jsonify({
         'status': 'OK',
@@ -798,7 +816,8 @@ def status():
         'session_active': 'user_id' in session,
         'kapal_count': analytics['total_kapal'],
         'enrolled_faces': len(enrolled_users),
-        'face_system_ready': True
+        'face_system_ready': True,
+        'face_system_loaded': is_face_system_loaded()
     })
 
 if __name__ == '__main__':
@@ -0,0 +1,76 @@
+# Benchmark: cold-start worker (import app) dan latency request face pertama
+#
+# Setiap sample dijalankan di subprocess baru supaya import cache bersih,
+# sama seperti gunicorn worker yang baru di-fork/restart.
+#
+# Usage:
+#   python benchmarks/bench_cold_start.py --repeat 5
+#   FACE_WARMUP=1 python benchmarks/bench_cold_start.py   # bandingkan dengan warm-up saat boot
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+# Add project directory to Python path
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD_SCRIPT = r'''
+import json, sys, time
+start = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - start) * 1000
+cv2_loaded = 'cv2' in sys.modules
+
+client = app.app.test_client()
+start = time.perf_counter()
+client.get('/status')
+status_ms = (time.perf_counter() - start) * 1000
+
+first_face_ms = None
+if len(sys.argv) > 1:
+    with open(sys.argv[1], 'rb') as f:
+        image = f.read()
+    start = time.perf_counter()
+    client.post('/api/face/recognize', data=image, content_type='image/jpeg')
+    first_face_ms = (time.perf_counter() - start) * 1000
+
+print(json.dumps({'import_ms': import_ms, 'cv2_after_import': cv2_loaded,
+                  'status_ms': status_ms, 'first_face_ms': first_face_ms}))
+'''
+
+def run_once(image_path):
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        env['DATABASE_URL'] = 'sqlite:///' + os.path.join(directory, 'bench.db')
+        env['PYTHONPATH'] = PROJECT_DIR
+        command = [sys.executable, '-c', CHILD_SCRIPT] + ([image_path] if image_path else [])
+        output = subprocess.run(command, cwd=PROJECT_DIR, env=env, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def describe(label, values):
+    values = np.array([value for value in values if value is not None])
+    if len(values):
+        print(f"   {label:<14}: mean={values.mean():7.1f} ms  min={values.min():7.1f} ms  max={values.max():7.1f} ms")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Worker cold-start benchmark')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--image', default=None, help='JPEG untuk request face pertama (default: faces_data/*.jpg)')
+    args = parser.parse_args()
+
+    image_path = args.image
+    if image_path is None:
+        candidates = sorted(glob.glob(os.path.join(PROJECT_DIR, 'faces_data', '*.jpg')))
+        image_path = candidates[0] if candidates else None
+
+    samples = [run_once(image_path) for _ in range(args.repeat)]
+    print(f"\n== cold start ({args.repeat} runs, FACE_WARMUP={os.environ.get('FACE_WARMUP', '0')})")
+    describe('import app', [s['import_ms'] for s in samples])
+    describe('GET /status', [s['status_ms'] for s in samples])
+    describe('first face req', [s['first_face_ms'] for s in samples])
+    print(f"   cv2 loaded after import: {samples[0]['cv2_after_import']}")
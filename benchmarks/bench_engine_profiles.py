@@ -0,0 +1,136 @@
+# Benchmark: latency / accuracy per face engine profile (face_engine.ENGINE_PROFILES)
+#
+# Semua profile dijalankan lewat interface yang sama (enroll_face / recognize_face /
+# verify_face / delete_user), dengan gallery augmentasi foto faces_data/ seperti
+# face_pipeline.py. Database = SQLite di temp dir (dlib profile simpan encoding di
+# tabel face_data). Profile dlib di-skip jika face_recognition tidak ter-install.
+#
+# Output: tabel per profile + profile termurah (recognize p50) yang accuracy-nya >= --min-accuracy
+#
+# Usage:
+#   python benchmarks/bench_engine_profiles.py --gallery 50 --queries 50 --min-accuracy 0.9
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+# Add project directory to Python path
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from face_engine import ENGINE_PROFILES, create_face_engine
+from face_metrics import StageMetrics, StageTimer
+from face_pipeline import augment, encode_jpeg, load_sources
+
+def create_bench_app(directory):
+    from flask import Flask
+    from face_models import init_face_database
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    init_face_database(app)
+    return app
+
+def run_profile(name, sources, args, directory):
+    """Returns: dict hasil, atau {'skipped': alasan}"""
+    rng = np.random.default_rng(args.seed)
+    faces_dir = os.path.join(directory, name)
+    try:
+        if ENGINE_PROFILES[name]['engine'] == 'opencv':
+            engine = create_face_engine(name, faces_dir=faces_dir)
+        else:
+            engine = create_face_engine(name)
+    except ImportError as e:
+        return {'skipped': f'{e}'}
+
+    # Enroll: satu user per slot gallery, sumber foto berputar
+    user_sources = {}
+    enroll_metrics = StageMetrics()
+    for user_id in range(args.gallery):
+        source_index = user_id % len(sources)
+        username = f'bench_{user_id:05d}'
+        timer = StageTimer()
+        result = engine.enroll_face(username, encode_jpeg(augment(sources[source_index][1], rng)), timer=timer)
+        enroll_metrics.record(timer.as_dict())
+        if result['success']:
+            user_sources[username] = source_index
+    if not user_sources:
+        return {'skipped': 'no enrollment succeeded'}
+
+    # Identify (1:N): benar jika user hasil match berasal dari foto sumber yang sama
+    usernames = sorted(user_sources)
+    recognize_metrics = StageMetrics()
+    correct = 0
+    for _ in range(args.queries):
+        username = usernames[int(rng.integers(0, len(usernames)))]
+        timer = StageTimer()
+        result = engine.recognize_face(encode_jpeg(augment(sources[user_sources[username]][1], rng)),
+                                       confidence_threshold=0, timer=timer)
+        recognize_metrics.record(timer.as_dict())
+        matched = result.get('user', {}).get('username')
+        correct += int(matched is not None and user_sources.get(matched) == user_sources[username])
+
+    # Verify (1:1) dengan threshold default: genuine harus accept, impostor harus reject
+    verify_metrics = StageMetrics()
+    genuine = impostor = 0
+    for _ in range(args.queries):
+        username = usernames[int(rng.integers(0, len(usernames)))]
+        other = usernames[int(rng.integers(0, len(usernames)))]
+        timer = StageTimer()
+        genuine += int(engine.verify_face(username, encode_jpeg(augment(sources[user_sources[username]][1], rng)),
+                                          timer=timer)['success'])
+        verify_metrics.record(timer.as_dict())
+        if user_sources[other] != user_sources[username]:
+            impostor += int(not engine.verify_face(other, encode_jpeg(augment(sources[user_sources[username]][1], rng)))['success'])
+        else:
+            impostor += 1
+
+    for username in usernames:
+        engine.delete_user(username)
+
+    return {
+        'enrolled': len(user_sources) / args.gallery,
+        'enroll_p50': enroll_metrics.percentiles()['total']['p50'],
+        'recognize': recognize_metrics.percentiles()['total'],
+        'verify_p50': verify_metrics.percentiles()['total']['p50'],
+        'accuracy': correct / args.queries,
+        'genuine_accept': genuine / args.queries,
+        'impostor_reject': impostor / args.queries,
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Face engine profile latency/accuracy benchmark')
+    parser.add_argument('--faces-dir', default=os.path.join(PROJECT_DIR, 'faces_data'))
+    parser.add_argument('--profiles', nargs='+', default=[name for name in ENGINE_PROFILES if name != 'opencv'])
+    parser.add_argument('--gallery', type=int, default=50)
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--min-accuracy', type=float, default=0.9)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    sources = load_sources(args.faces_dir)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_bench_app(directory)
+        with app.app_context():
+            for name in args.profiles:
+                print(f"[BENCH] profile {name} gallery={args.gallery}")
+                results[name] = run_profile(name, sources, args, directory)
+
+    print(f"\n{'profile':20} {'enroll':>8} {'rec p50':>8} {'rec p95':>8} {'verify':>8} {'acc':>6} {'gen.acc':>8} {'imp.rej':>8}")
+    for name, result in results.items():
+        if 'skipped' in result:
+            print(f"{name:20} skipped: {result['skipped']}")
+            continue
+        print(f"{name:20} {result['enroll_p50']:6.1f}ms {result['recognize']['p50']:6.1f}ms"
+              f" {result['recognize']['p95']:6.1f}ms {result['verify_p50']:6.1f}ms {result['accuracy']:6.2f}"
+              f" {result['genuine_accept']:8.2f} {result['impostor_reject']:8.2f}")
+
+    eligible = [(result['recognize']['p50'], name) for name, result in results.items()
+                if 'skipped' not in result and result['accuracy'] >= args.min_accuracy]
+    if eligible:
+        print(f"\nCheapest profile with accuracy >= {args.min_accuracy}: FACE_ENGINE={min(eligible)[1]}")
+    else:
+        print(f"\nNo profile reached accuracy >= {args.min_accuracy}")
@@ -0,0 +1,99 @@
+# Benchmark: coarse-to-fine vs full-resolution parameter ladder di OpenCVFaceSystem.detect_faces
+#
+# Frame test dibuat dari foto di faces_data/: face crop ditempel di background 640x480
+# (ada wajah, 180-300px), face crop kecil 32-60px (recall coarse pass untuk wajah jauh)
+# dan background saja (tanpa wajah, kasus paling mahal untuk ladder).
+#
+# Usage:
+#   python benchmarks/bench_face_detection.py --repeat 5
+import argparse
+import glob
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+# Add project directory to Python path
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from opencv_face_system import OpenCVFaceSystem
+
+FRAME_SIZE = (640, 480)
+
+def background(rng):
+    noise = rng.integers(60, 200, (FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+    return cv2.GaussianBlur(noise, (31, 31), 0)
+
+def paste_face(face, side, rng):
+    frame = background(rng)
+    x = int(rng.integers(0, FRAME_SIZE[0] - side))
+    y = int(rng.integers(0, FRAME_SIZE[1] - side))
+    frame[y:y + side, x:x + side] = cv2.resize(face, (side, side))
+    return frame
+
+def build_frames(faces_dir, rng):
+    face_frames, small_frames, empty_frames = [], [], []
+    for path in sorted(glob.glob(os.path.join(faces_dir, '*.jpg'))):
+        face = cv2.imread(path)
+        if face is None:
+            continue
+        face_frames.append((os.path.basename(path), paste_face(face, int(rng.integers(180, 300)), rng)))
+        small_frames.append((os.path.basename(path), paste_face(face, int(rng.integers(32, 60)), rng)))
+        empty_frames.append(('empty', background(rng)))
+    return face_frames, small_frames, empty_frames
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / union if union else 0.0
+
+def time_mode(system, frames, mode, repeat):
+    timings, results = [], []
+    for _, frame in frames:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            faces = system.detect_faces(frame, mode=mode)
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+        results.append(faces)
+    return np.array(timings), results
+
+def report(label, frames, system, repeat):
+    ladder_ms, ladder_faces = time_mode(system, frames, 'ladder', repeat)
+    coarse_ms, coarse_faces = time_mode(system, frames, 'coarse', repeat)
+
+    ladder_hits = sum(len(faces) > 0 for faces in ladder_faces)
+    coarse_hits = sum(len(faces) > 0 for faces in coarse_faces)
+    overlaps = [iou(l[0], c[0]) for l, c in zip(ladder_faces, coarse_faces) if len(l) and len(c)]
+
+    print(f"\n== {label} ({len(frames)} frames)")
+    print(f"   ladder : mean={ladder_ms.mean():7.1f} ms  p95={np.percentile(ladder_ms, 95):7.1f} ms  detected={ladder_hits}")
+    print(f"   coarse : mean={coarse_ms.mean():7.1f} ms  p95={np.percentile(coarse_ms, 95):7.1f} ms  detected={coarse_hits}")
+    print(f"   speedup: {ladder_ms.mean() / coarse_ms.mean():.1f}x", end='')
+    if overlaps:
+        print(f"  mean IoU vs ladder={np.mean(overlaps):.2f}")
+    else:
+        print()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Face detection coarse-to-fine benchmark')
+    parser.add_argument('--faces-dir', default=os.path.join(PROJECT_DIR, 'faces_data'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    system = OpenCVFaceSystem(faces_dir=args.faces_dir)
+    face_frames, small_frames, empty_frames = build_frames(args.faces_dir, rng)
+
+    report('frames with face', face_frames, system, args.repeat)
+    report('frames with small face (32-60px)', small_frames, system, args.repeat)
+    report('frames without face', empty_frames, system, args.repeat)
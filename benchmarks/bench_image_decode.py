@@ -0,0 +1,125 @@
+# Benchmark: decode + preprocess + detect + ROI, BGR pipeline lama vs grayscale-first
+#
+# JPEG test dibuat dari foto di faces_data/ di beberapa resolusi (webcam sampai foto HP).
+# Pipeline lama direplikasi di sini (decode BGR, cvtColor di preprocess, detect dan ROI)
+# supaya bisa dibandingkan di run yang sama. Alokasi diukur dengan tracemalloc
+# (numpy/cv2 array ikut ter-trace).
+#
+# Usage:
+#   python benchmarks/bench_image_decode.py --repeat 5
+import argparse
+import glob
+import os
+import sys
+import tracemalloc
+
+import cv2
+import numpy as np
+
+# Add project directory to Python path
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from face_metrics import NULL_TIMER, StageTimer
+from opencv_face_system import OpenCVFaceSystem
+
+FRAME_SIZES = [(640, 480), (1280, 720), (1920, 1080), (4032, 3024)]
+
+def build_jpegs(faces_dir, size, rng):
+    jpegs = []
+    for path in sorted(glob.glob(os.path.join(faces_dir, '*.jpg'))):
+        face = cv2.imread(path)
+        if face is None:
+            continue
+        width, height = size
+        frame = cv2.GaussianBlur(rng.integers(60, 200, (height, width, 3), dtype=np.uint8), (31, 31), 0)
+        side = int(min(width, height) * 0.5)
+        x, y = (width - side) // 2, (height - side) // 2
+        frame[y:y + side, x:x + side] = cv2.resize(face, (side, side))
+        jpegs.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    return jpegs
+
+def legacy_decode(system, image_bytes):
+    """Decode + preprocess sebelum grayscale-first: full BGR decode, cvtColor untuk brightness"""
+    image = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    height, width = image.shape[:2]
+    if width > 1024 or height > 1024:
+        scale = min(1024 / width, 1024 / height)
+        image = cv2.resize(image, (int(width * scale), int(height * scale)))
+    if np.mean(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)) < 80:
+        image = cv2.convertScaleAbs(image, alpha=1.3, beta=30)
+    return image
+
+def legacy_pipeline(system, image_bytes, timer):
+    """Pipeline sebelum grayscale-first: decode BGR, 3x cvtColor"""
+    with timer.stage('decode'):
+        image = legacy_decode(system, image_bytes)
+    with timer.stage('detect'):
+        faces = system.detect_faces_coarse_to_fine(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+    if len(faces) == 0:
+        return None
+    with timer.stage('roi'):
+        x, y, w, h = faces[0]
+        x, y = max(0, x - 20), max(0, y - 20)
+        roi = image[y:y + min(image.shape[0] - y, h + 40), x:x + min(image.shape[1] - x, w + 40)]
+        return cv2.resize(cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY), (200, 200))
+
+def current_pipeline(system, image_bytes, timer):
+    with timer.stage('decode'):
+        image = system.load_image(image_bytes)
+    with timer.stage('detect'):
+        faces = system.detect_faces(image, mode='coarse')
+    if len(faces) == 0:
+        return None
+    with timer.stage('roi'):
+        return system.extract_face_roi(image, faces[0])
+
+def measure(pipeline, decode, system, jpegs, repeat):
+    """Returns: (ms per stage, peak alloc decode saja, peak alloc full pipeline, ROIs)"""
+    stages = {'decode': [], 'detect': [], 'roi': []}
+    rois = []
+    for image_bytes in jpegs:
+        best = {}
+        for _ in range(repeat):
+            timer = StageTimer()
+            roi = pipeline(system, image_bytes, timer)
+            for name, ms in timer.stages.items():
+                best[name] = min(best.get(name, ms), ms)
+        for name in stages:
+            stages[name].append(best.get(name, 0.0))
+        rois.append(roi)
+
+    decode_peaks, pipeline_peaks = [], []
+    for image_bytes in jpegs:
+        tracemalloc.start()
+        decode(system, image_bytes)
+        decode_peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        tracemalloc.start()
+        pipeline(system, image_bytes, NULL_TIMER)
+        pipeline_peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return ({name: np.array(values) for name, values in stages.items()},
+            np.array(decode_peaks), np.array(pipeline_peaks), rois)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Grayscale-first decode benchmark')
+    parser.add_argument('--faces-dir', default=os.path.join(PROJECT_DIR, 'faces_data'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(11)
+    system = OpenCVFaceSystem(faces_dir=args.faces_dir)
+
+    for size in FRAME_SIZES:
+        jpegs = build_jpegs(args.faces_dir, size, rng)
+        legacy = measure(legacy_pipeline, legacy_decode, system, jpegs, args.repeat)
+        gray = measure(current_pipeline, lambda system, data: system.load_image(data), system, jpegs, args.repeat)
+
+        print(f"\n== {size[0]}x{size[1]} ({len(jpegs)} JPEGs, {np.mean([len(j) for j in jpegs]) / 1024:.0f} KB avg)")
+        for label, (stages, decode_peak, pipeline_peak, rois) in (('legacy BGR', legacy), ('gray-first', gray)):
+            print(f"   {label}: decode={stages['decode'].mean():6.1f} ms  detect={stages['detect'].mean():6.1f} ms"
+                  f"  roi={stages['roi'].mean():5.2f} ms  peak alloc decode={decode_peak.mean() / 2**20:5.2f} MB"
+                  f"  pipeline={pipeline_peak.mean() / 2**20:5.2f} MB  detected={sum(r is not None for r in rois)}")
+        print(f"   decode speedup {legacy[0]['decode'].mean() / gray[0]['decode'].mean():.2f}x,"
+              f" peak alloc -{(1 - gray[2].mean() / legacy[2].mean()) * 100:.0f}%")
@@ -0,0 +1,76 @@
+# Benchmark: sharded template matching, scaling thread count 1..N
+#
+# Gallery sintetis (template 200x200 zero-mean unit-norm) ditulis ke FaceGalleryStore
+# di temp dir sehingga matching berjalan atas memmap seperti di production.
+# Shortlist dimatikan supaya yang diukur full 1:N pass.
+#
+# Usage:
+#   python benchmarks/bench_match_threads.py --gallery 4096 16384 --threads 1 2 4 8
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+# Add project directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from opencv_face_system import TEMPLATE_SIZE, OpenCVFaceSystem
+
+def synthetic_templates(size, rng, chunk=1024):
+    dim = TEMPLATE_SIZE[0] * TEMPLATE_SIZE[1]
+    matrix = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, chunk):
+        block = rng.standard_normal((min(chunk, size - start), dim), dtype=np.float32)
+        block -= block.mean(axis=1, keepdims=True)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        matrix[start:start + len(block)] = block
+    return matrix
+
+def time_batch(system, rois, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        usernames, scores = system.match_templates_batch(rois)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best, usernames, scores
+
+def run(size, threads, batch, repeat, rng):
+    with tempfile.TemporaryDirectory() as tmp:
+        system = OpenCVFaceSystem(faces_dir=tmp)
+        system.shortlist_k = 0
+        matrix = synthetic_templates(size, rng)
+        system.gallery.replace_all([f'user{i:06d}' for i in range(size)], matrix)
+        truth = rng.choice(size, batch, replace=False)
+        rois = [np.clip(matrix[i].reshape(TEMPLATE_SIZE[1], TEMPLATE_SIZE[0]) * 2000 + 128, 0, 255).astype(np.uint8)
+                for i in truth]
+        del matrix
+
+        print(f"\n== gallery={size} ({size * TEMPLATE_SIZE[0] * TEMPLATE_SIZE[1] * 4 / 2**20:.0f} MB) batch={batch}"
+              f" cpus={os.cpu_count()}")
+        baseline = None
+        for count in threads:
+            system.match_threads = count
+            time_batch(system, rois[:1], 1)  # warm page cache + thread pool
+            single_ms, usernames, scores = time_batch(system, rois[:1], repeat)
+            batch_ms, usernames, scores = time_batch(system, rois, repeat)
+            correct = np.mean(np.argmax(scores, axis=1) == truth)
+            if baseline is None:
+                baseline = (single_ms, batch_ms)
+            print(f"   threads={count:<3}: 1 query={single_ms:8.1f} ms ({baseline[0] / single_ms:4.2f}x)"
+                  f"  {batch} queries={batch_ms:8.1f} ms ({baseline[1] / batch_ms:4.2f}x)  top-1={correct:.2f}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sharded template matching thread scaling benchmark')
+    parser.add_argument('--gallery', type=int, nargs='+', default=[4096, 16384])
+    parser.add_argument('--threads', type=int, nargs='+',
+                        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument('--batch', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    for size in args.gallery:
+        run(size, args.threads, args.batch, args.repeat, rng)
@@ -0,0 +1,121 @@
+# Benchmark: p50/p99 recognition latency under concurrent load, library default threads
+# vs thread budget (thread_budget.py)
+#
+# Setiap mode menjalankan --workers child process (seperti gunicorn worker) yang masing-masing
+# melayani --clients request thread bersamaan. Thread budget dipasang saat import, jadi
+# setiap mode butuh process baru. Gallery = copy faces_data di temp dir, frame = JPEG 640x480
+# berisi foto faces_data.
+#
+# Usage:
+#   python benchmarks/bench_thread_budget.py --workers 2 --clients 4 --requests 40
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+MODES = {
+    'default': {'FACE_THREAD_BUDGET': '0'},
+    'budget': {'FACE_THREAD_BUDGET': '1'},
+}
+
+def build_frames(faces_dir):
+    import glob
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(3)
+    frames = []
+    for path in sorted(glob.glob(os.path.join(faces_dir, '*.jpg'))):
+        face = cv2.imread(path)
+        if face is None:
+            continue
+        frame = cv2.GaussianBlur(rng.integers(60, 200, (480, 640, 3), dtype=np.uint8), (31, 31), 0)
+        frame[140:340, 220:420] = cv2.resize(face, (200, 200))
+        frames.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes())
+    return frames
+
+def run_child(args):
+    """Satu 'worker': budget -> engine -> --clients thread yang mulai bersamaan di start_at"""
+    from thread_budget import apply_thread_budget
+    apply_thread_budget(workers=args.workers)
+    from opencv_face_system import OpenCVFaceSystem
+
+    system = OpenCVFaceSystem(faces_dir=args.faces_dir)
+    frames = build_frames(args.faces_dir)
+    for frame in frames[:2]:
+        system.recognize_face(frame)  # warm-up
+
+    latencies = []
+    lock = threading.Lock()
+    def client(offset):
+        for index in range(args.requests):
+            start = time.perf_counter()
+            system.recognize_face(frames[(offset + index) % len(frames)])
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+
+    time.sleep(max(0.0, args.start_at - time.time()))
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print('RESULT ' + json.dumps(latencies))
+
+def run_mode(mode, args, faces_dir):
+    env = dict(os.environ, **MODES[mode])
+    start_at = time.time() + args.startup
+    command = [sys.executable, os.path.abspath(__file__), '--child', '--faces-dir', faces_dir,
+               '--workers', str(args.workers), '--clients', str(args.clients),
+               '--requests', str(args.requests), '--start-at', str(start_at)]
+    children = [subprocess.Popen(command, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+                for _ in range(args.workers)]
+    latencies = []
+    for child in children:
+        output, _ = child.communicate()
+        for line in output.splitlines():
+            if line.startswith('RESULT '):
+                latencies.extend(json.loads(line[len('RESULT '):]))
+    wall = time.time() - start_at
+    return latencies, wall
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Thread budget concurrent recognition latency benchmark')
+    parser.add_argument('--faces-dir', default=os.path.join(PROJECT_DIR, 'faces_data'))
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--clients', type=int, default=4, help='Concurrent requests per worker')
+    parser.add_argument('--requests', type=int, default=40, help='Requests per client')
+    parser.add_argument('--startup', type=float, default=15.0, help='Detik untuk child load engine')
+    parser.add_argument('--child', action='store_true')
+    parser.add_argument('--start-at', type=float, default=0.0)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        sys.exit(0)
+
+    import numpy as np
+    from thread_budget import compute_thread_budget
+    budget = compute_thread_budget(args.workers)
+    print(f"CPUs={budget['cpus']} workers={args.workers} clients/worker={args.clients}"
+          f" budget={budget['threads']} threads/worker")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        faces_dir = os.path.join(tmp, 'faces')
+        shutil.copytree(args.faces_dir, faces_dir)
+        for mode in MODES:
+            latencies, wall = run_mode(mode, args, faces_dir)
+            if not latencies:
+                print(f"   {mode:8}: no results (increase --startup?)")
+                continue
+            latencies = np.array(latencies)
+            print(f"   {mode:8}: p50={np.percentile(latencies, 50):7.1f} ms  p95={np.percentile(latencies, 95):7.1f} ms"
+                  f"  p99={np.percentile(latencies, 99):7.1f} ms  throughput={len(latencies) / wall:6.1f} req/s"
+                  f"  ({len(latencies)} requests)")
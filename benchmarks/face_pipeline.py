@@ -0,0 +1,258 @@
+# Face pipeline benchmark suite dengan synthetic load
+#
+# Gallery 10 / 100 / 1.000 / 10.000 user dibuat dengan augmentasi foto di faces_data/
+# (random crop, brightness shift, noise), lalu workload enroll + recognize dijalankan
+# terhadap OpenCVFaceSystem (per engine) dan FaceRecognitionSystem (jika dlib tersedia).
+#
+# Output JSON (key stabil, sorted) supaya hasil antar run bisa di-diff:
+#   python benchmarks/face_pipeline.py --sizes 10 100 1000 10000 --output benchmarks/results/face_pipeline.json
+#
+# Template engine juga dijalankan dengan two-stage shortlist untuk setiap --shortlist-k
+# (key opencv_template_shortlist<k>), supaya trade-off accuracy vs latency 'match'
+# terlihat di samping full matching (opencv_template).
+# Setiap --templates K > 1 menjalankan engine dengan K augmented template per user
+# (key opencv_<engine>_templates<K>) untuk melihat efek multi-template ke accuracy dan 'match'.
+#
+# Catatan:
+#   - accuracy = match jatuh ke user yang berasal dari foto sumber yang sama dengan query
+#   - peak_rss_mb = ru_maxrss proses (monotonic: puncak sampai titik itu)
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+# Add project directory to Python path
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from face_metrics import StageMetrics, StageTimer
+from opencv_face_system import OpenCVFaceSystem
+
+def load_sources(faces_dir):
+    sources = []
+    for path in sorted(glob.glob(os.path.join(faces_dir, '*.jpg'))):
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if image is not None:
+            sources.append((os.path.basename(path), image))
+    if not sources:
+        raise SystemExit(f"No source JPEGs found in {faces_dir}")
+    return sources
+
+def augment(face_gray, rng):
+    """Random crop (85-100%), brightness shift (+-40) dan gaussian noise"""
+    height, width = face_gray.shape
+    crop = rng.uniform(0.85, 1.0)
+    crop_h, crop_w = int(height * crop), int(width * crop)
+    y = int(rng.integers(0, height - crop_h + 1))
+    x = int(rng.integers(0, width - crop_w + 1))
+    image = cv2.resize(face_gray[y:y + crop_h, x:x + crop_w], (width, height)).astype(np.float32)
+    image += rng.uniform(-40, 40)
+    image += rng.normal(0, rng.uniform(0, 8), image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+def encode_jpeg(face_gray):
+    return cv2.imencode('.jpg', cv2.cvtColor(face_gray, cv2.COLOR_GRAY2BGR))[1].tobytes()
+
+def build_gallery(directory, size, sources, rng, templates=1):
+    """Tulis face files (templates per user) + users.json; return mapping username -> source index"""
+    users = {}
+    user_sources = {}
+    for user_id in range(size):
+        source_index = user_id % len(sources)
+        username = f"bench_{user_id:05d}"
+        face_files = [f"{username}_{index}.jpg" for index in range(templates)]
+        for face_file in face_files:
+            cv2.imwrite(os.path.join(directory, face_file), augment(sources[source_index][1], rng))
+        users[username] = {
+            'user_id': user_id,
+            'face_file': face_files[-1],
+            'face_files': face_files,
+            'enrolled_at': datetime(2025, 1, 1).isoformat(),
+            'user_info': {'source': sources[source_index][0]}
+        }
+        user_sources[username] = source_index
+    with open(os.path.join(directory, 'users.json'), 'w') as f:
+        json.dump(users, f)
+    return user_sources
+
+def peak_rss_mb():
+    # Linux: KB, macOS: bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def summarize(durations, metrics, extra=None):
+    total = float(np.sum(durations)) if durations else 0.0
+    summary = {
+        'operations': len(durations),
+        'ops_per_sec': round(len(durations) / total, 3) if total else None,
+        'latency_ms': metrics.percentiles(),
+    }
+    summary.update(extra or {})
+    return summary
+
+def bench_opencv(engine, size, sources, args, rng, shortlist_k=0, templates=1):
+    os.environ['FACE_RECOGNITION_ENGINE'] = engine
+    with tempfile.TemporaryDirectory() as directory:
+        user_sources = build_gallery(directory, size, sources, rng, templates)
+
+        start = time.perf_counter()
+        system = OpenCVFaceSystem(faces_dir=directory)
+        build_s = time.perf_counter() - start
+
+        # shortlist_k=0 -> full matching; selain itu shortlist untuk semua ukuran gallery
+        system.shortlist_k = shortlist_k
+        system.shortlist_min_gallery = 0
+        thumbnails_s = None
+        if shortlist_k:
+            start = time.perf_counter()
+            generation, _, _, _, matrix = system.gallery.versioned_snapshot()
+            system.gallery_thumbnails(generation, matrix)
+            thumbnails_s = round(time.perf_counter() - start, 3)
+
+        # Recognize workload: augmentasi baru dari foto sumber user acak
+        metrics, durations, correct = StageMetrics(), [], 0
+        for _ in range(args.queries):
+            username = f"bench_{int(rng.integers(0, size)):05d}"
+            query = encode_jpeg(augment(sources[user_sources[username]][1], rng))
+            timer = StageTimer()
+            result = system.recognize_face(query, confidence_threshold=0, timer=timer)
+            metrics.record(timer.as_dict())
+            durations.append(timer.total_ms / 1000)
+            matched = result.get('user', {}).get('username')
+            correct += int(matched is not None and user_sources.get(matched) == user_sources[username])
+        recognize = summarize(durations, metrics, {'accuracy': round(correct / args.queries, 4)})
+
+        # Enroll workload: user baru di atas gallery yang sudah ada
+        metrics, durations, enrolled = StageMetrics(), [], 0
+        for index in range(args.enrolls):
+            source_index = int(rng.integers(0, len(sources)))
+            timer = StageTimer()
+            result = system.enroll_face(f"new_{index:04d}", encode_jpeg(augment(sources[source_index][1], rng)),
+                                        timer=timer)
+            metrics.record(timer.as_dict())
+            durations.append(timer.total_ms / 1000)
+            enrolled += int(result['success'])
+        enroll = summarize(durations, metrics, {'success_rate': round(enrolled / max(args.enrolls, 1), 4)})
+
+    return {
+        'build_s': round(build_s, 3),
+        'thumbnails_s': thumbnails_s,
+        'templates': system.gallery.template_count,
+        'recognize': recognize,
+        'enroll': enroll,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def bench_dlib(size, sources, args, rng):
+    try:
+        from face_recognition_core import FaceRecognitionSystem
+        from face_models import FaceEncodingIndex
+    except ImportError as e:
+        return {'skipped': f'face_recognition not available: {e}'}
+    if size > args.dlib_max_gallery:
+        return {'skipped': f'gallery larger than --dlib-max-gallery ({args.dlib_max_gallery})'}
+
+    system = FaceRecognitionSystem()
+    index = FaceEncodingIndex(backend='exact')
+    index.loaded = True  # Gallery dibangun in-memory, tanpa database
+    index.refresh_interval = float('inf')  # Tidak cek perubahan ke database
+
+    # Enroll workload = extract encoding + insert ke index
+    metrics, durations, user_sources = StageMetrics(), [], {}
+    for user_id in range(size):
+        source_index = user_id % len(sources)
+        image = cv2.cvtColor(augment(sources[source_index][1], rng), cv2.COLOR_GRAY2RGB)
+        timer = StageTimer()
+        with timer.stage('encode'):
+            encoding = system.extract_face_encoding(image)
+        if encoding is not None:
+            with timer.stage('index'):
+                index.upsert(user_id, user_id, encoding)
+            user_sources[user_id] = source_index
+        metrics.record(timer.as_dict())
+        durations.append(timer.total_ms / 1000)
+    enroll = summarize(durations, metrics, {'success_rate': round(len(user_sources) / size, 4)})
+
+    # Recognize workload = extract encoding + 1:N search
+    metrics, durations, correct = StageMetrics(), [], 0
+    for _ in range(args.queries):
+        source_index = int(rng.integers(0, len(sources)))
+        image = cv2.cvtColor(augment(sources[source_index][1], rng), cv2.COLOR_GRAY2RGB)
+        timer = StageTimer()
+        with timer.stage('encode'):
+            encoding = system.extract_face_encoding(image)
+        matches = []
+        if encoding is not None:
+            with timer.stage('match'):
+                matches = index.search(encoding, k=1)
+        metrics.record(timer.as_dict())
+        durations.append(timer.total_ms / 1000)
+        correct += int(bool(matches) and user_sources.get(matches[0][0]) == source_index)
+    recognize = summarize(durations, metrics, {'accuracy': round(correct / args.queries, 4)})
+
+    return {'recognize': recognize, 'enroll': enroll, 'peak_rss_mb': peak_rss_mb()}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Face pipeline benchmark suite')
+    parser.add_argument('--faces-dir', default=os.path.join(PROJECT_DIR, 'faces_data'))
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--opencv-engines', nargs='+', default=['template', 'lbph'])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--enrolls', type=int, default=10)
+    parser.add_argument('--shortlist-k', type=int, nargs='*', default=[5, 20, 50])
+    parser.add_argument('--templates', type=int, nargs='*', default=[3], help='Template per user (selain 1)')
+    parser.add_argument('--dlib-max-gallery', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--output', default=os.path.join(PROJECT_DIR, 'benchmarks', 'results', 'face_pipeline.json'))
+    args = parser.parse_args()
+
+    sources = load_sources(args.faces_dir)
+    results = {}
+    for size in args.sizes:
+        for engine in args.opencv_engines:
+            print(f"[BENCH] opencv/{engine} gallery={size}")
+            results.setdefault(f'opencv_{engine}', {})[str(size)] = bench_opencv(
+                engine, size, sources, args, np.random.default_rng(args.seed))
+            for templates in args.templates:
+                if templates <= 1:
+                    continue
+                print(f"[BENCH] opencv/{engine} templates={templates} gallery={size}")
+                results.setdefault(f'opencv_{engine}_templates{templates}', {})[str(size)] = bench_opencv(
+                    engine, size, sources, args, np.random.default_rng(args.seed), templates=templates)
+            if engine != 'template':
+                continue
+            for k in args.shortlist_k:
+                print(f"[BENCH] opencv/{engine} shortlist k={k} gallery={size}")
+                results.setdefault(f'opencv_{engine}_shortlist{k}', {})[str(size)] = bench_opencv(
+                    engine, size, sources, args, np.random.default_rng(args.seed), shortlist_k=k)
+        print(f"[BENCH] face_recognition gallery={size}")
+        results.setdefault('face_recognition', {})[str(size)] = bench_dlib(
+            size, sources, args, np.random.default_rng(args.seed))
+
+    report = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__,
+            'cpu_count': os.cpu_count(),
+            'args': {key: value for key, value in vars(args).items() if key != 'output'},
+        },
+        'results': results,
+    }
+
+    directory = os.path.dirname(args.output)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"[OK] Benchmark results written to {args.output}")
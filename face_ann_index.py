@@ -0,0 +1,247 @@
+# Approximate Nearest Neighbour index untuk face encodings (IVF-Flat, NumPy only)
+import hashlib
+import os
+import tempfile
+import threading
+import numpy as np
+
+def arrays_checksum(*arrays):
+    """SHA-1 dari isi array (untuk validasi file index yang terpotong / rusak)"""
+    digest = hashlib.sha1()
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+class IVFFlatIndex:
+    """
+    IVF-Flat index untuk face encodings 128-d
+    Fungsi: Coarse quantization dengan k-means -> setiap encoding masuk ke satu
+    inverted list. Query hanya discan di n_probe list terdekat, bukan seluruh gallery.
+    """
+
+    def __init__(self, dim=128, n_lists=None, n_probe=8, train_iterations=10, seed=0):
+        """
+        Args:
+            dim (int): Dimensi encoding
+            n_lists (int): Jumlah coarse cluster (None = otomatis ~sqrt(N))
+            n_probe (int): Jumlah list yang discan per query (trade-off recall vs latency)
+            train_iterations (int): Iterasi k-means saat train
+            seed (int): Seed untuk inisialisasi centroid
+        """
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_iterations = train_iterations
+        self.seed = seed
+        self.centroids = np.empty((0, dim), dtype=np.float32)
+        self.lists = []          # list of dict(face_ids, user_ids, vectors)
+        self.id_to_list = {}     # face_id -> list index
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.id_to_list)
+
+    @property
+    def trained(self):
+        return len(self.centroids) > 0
+
+    def _empty_list(self):
+        return {
+            'face_ids': np.empty(0, dtype=np.int64),
+            'user_ids': np.empty(0, dtype=np.int64),
+            'vectors': np.empty((0, self.dim), dtype=np.float32),
+        }
+
+    def _nearest_centroids(self, vectors, count=1):
+        """Index centroid terdekat untuk setiap vector (squared euclidean)"""
+        centroid_norms = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        squared = centroid_norms[np.newaxis, :] - 2.0 * (vectors @ self.centroids.T)
+        if count == 1:
+            return np.argmin(squared, axis=1)
+        count = min(count, len(self.centroids))
+        nearest = np.argpartition(squared, count - 1, axis=1)[:, :count]
+        return nearest
+
+    def train(self, face_ids, user_ids, vectors):
+        """
+        Build index dari nol: k-means centroids + isi inverted lists
+
+        Args:
+            face_ids, user_ids: parallel id arrays
+            vectors: float32 matrix (N x dim)
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        face_ids = np.asarray(face_ids, dtype=np.int64)
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        count = len(vectors)
+        if count == 0:
+            with self._lock:
+                self.centroids = np.empty((0, self.dim), dtype=np.float32)
+                self.lists = []
+                self.id_to_list = {}
+            return
+
+        n_lists = self.n_lists or max(1, int(np.sqrt(count)))
+        n_lists = min(n_lists, count)
+        rng = np.random.default_rng(self.seed)
+        centroids = vectors[rng.choice(count, n_lists, replace=False)].copy()
+
+        # Lloyd iterations; cluster kosong di-reseed ke vector acak
+        for _ in range(self.train_iterations):
+            centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+            assignment = np.argmin(centroid_norms[np.newaxis, :] - 2.0 * (vectors @ centroids.T), axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, vectors)
+            counts = np.bincount(assignment, minlength=n_lists)
+            empty = counts == 0
+            centroids[~empty] = sums[~empty] / counts[~empty, np.newaxis]
+            if empty.any():
+                centroids[empty] = vectors[rng.choice(count, int(empty.sum()), replace=False)]
+
+        with self._lock:
+            self.centroids = centroids.astype(np.float32)
+            assignment = self._nearest_centroids(vectors)
+            lists = []
+            id_to_list = {}
+            for list_index in range(n_lists):
+                members = np.flatnonzero(assignment == list_index)
+                lists.append({
+                    'face_ids': face_ids[members],
+                    'user_ids': user_ids[members],
+                    'vectors': vectors[members],
+                })
+                for face_id in face_ids[members].tolist():
+                    id_to_list[face_id] = list_index
+            self.lists = lists
+            self.id_to_list = id_to_list
+
+    def add(self, face_id, user_id, vector):
+        """Insert / replace satu encoding ke inverted list terdekat (tanpa retrain)"""
+        vector = np.asarray(vector, dtype=np.float32).reshape(1, self.dim)
+        self.remove(face_id)
+        with self._lock:
+            if not self.trained:
+                self.centroids = vector.copy()
+                self.lists = [self._empty_list()]
+            list_index = int(self._nearest_centroids(vector)[0])
+            inverted = self.lists[list_index]
+            self.lists[list_index] = {
+                'face_ids': np.append(inverted['face_ids'], face_id),
+                'user_ids': np.append(inverted['user_ids'], user_id),
+                'vectors': np.vstack([inverted['vectors'], vector]),
+            }
+            self.id_to_list[face_id] = list_index
+
+    def remove(self, face_id):
+        """Hapus satu encoding dari inverted list-nya"""
+        with self._lock:
+            list_index = self.id_to_list.pop(face_id, None)
+            if list_index is None:
+                return False
+            inverted = self.lists[list_index]
+            keep = inverted['face_ids'] != face_id
+            self.lists[list_index] = {
+                'face_ids': inverted['face_ids'][keep],
+                'user_ids': inverted['user_ids'][keep],
+                'vectors': inverted['vectors'][keep],
+            }
+        return True
+
+    def search(self, query, k=1, n_probe=None):
+        """
+        Approximate k-NN search
+
+        Returns:
+            list: [(face_id, user_id, distance), ...] urut dari distance terkecil
+        """
+        if not self.trained or len(self) == 0:
+            return []
+        query = np.asarray(query, dtype=np.float32).reshape(1, self.dim)
+        n_probe = n_probe or self.n_probe
+
+        with self._lock:
+            probes = self._nearest_centroids(query, count=n_probe)[0]
+            selected = [self.lists[int(i)] for i in np.atleast_1d(probes)]
+
+        selected = [inverted for inverted in selected if len(inverted['face_ids']) > 0]
+        if not selected:
+            return []
+        face_ids = np.concatenate([inverted['face_ids'] for inverted in selected])
+        user_ids = np.concatenate([inverted['user_ids'] for inverted in selected])
+        vectors = np.vstack([inverted['vectors'] for inverted in selected])
+
+        distances = np.linalg.norm(vectors - query, axis=1)
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k] if k < len(distances) else np.arange(len(distances))
+        top = top[np.argsort(distances[top])]
+        return [(int(face_ids[i]), int(user_ids[i]), float(distances[i])) for i in top]
+
+    def entries(self):
+        """
+        Snapshot semua entry, urut per inverted list
+        Returns: (list_sizes, face_ids, user_ids, vectors, centroids)
+        """
+        with self._lock:
+            sizes = np.array([len(inverted['face_ids']) for inverted in self.lists], dtype=np.int64)
+            if self.lists:
+                face_ids = np.concatenate([inverted['face_ids'] for inverted in self.lists])
+                user_ids = np.concatenate([inverted['user_ids'] for inverted in self.lists])
+                vectors = np.vstack([inverted['vectors'] for inverted in self.lists])
+            else:
+                face_ids = user_ids = np.empty(0, dtype=np.int64)
+                vectors = np.empty((0, self.dim), dtype=np.float32)
+            return sizes, face_ids, user_ids, vectors, self.centroids
+
+    def save(self, path):
+        """
+        Persist index ke disk (.npz) dengan atomic replace
+        Fungsi: Temp file unik di directory yang sama (beberapa worker boleh save bersamaan),
+        checksum isi array ikut disimpan untuk validasi saat load
+        """
+        sizes, face_ids, user_ids, vectors, centroids = self.entries()
+        checksum = arrays_checksum(centroids, sizes, face_ids, user_ids, vectors)
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory or '.', prefix=os.path.basename(path) + '.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, centroids=centroids, list_sizes=sizes, face_ids=face_ids,
+                         user_ids=user_ids, vectors=vectors, n_probe=self.n_probe, checksum=checksum)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path, n_probe=None):
+        """
+        Load index yang sudah dipersist; return None jika file tidak ada
+        Raises: ValueError jika checksum tidak cocok / tidak ada (file rusak atau format lama)
+        """
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            if 'checksum' not in data.files:
+                raise ValueError(f'{path}: no checksum')
+            centroids, sizes = data['centroids'], data['list_sizes']
+            face_ids, user_ids, vectors = data['face_ids'], data['user_ids'], data['vectors']
+            if str(data['checksum']) != arrays_checksum(centroids, sizes, face_ids, user_ids, vectors):
+                raise ValueError(f'{path}: checksum mismatch')
+            index = cls(dim=centroids.shape[1] if centroids.ndim == 2 else 128,
+                        n_lists=len(centroids), n_probe=n_probe or int(data['n_probe']))
+            index.centroids = centroids.astype(np.float32)
+            offsets = np.concatenate([[0], np.cumsum(sizes)])
+
+        for list_index in range(len(offsets) - 1):
+            start, end = offsets[list_index], offsets[list_index + 1]
+            index.lists.append({
+                'face_ids': face_ids[start:end],
+                'user_ids': user_ids[start:end],
+                'vectors': vectors[start:end],
+            })
+            for face_id in face_ids[start:end].tolist():
+                index.id_to_list[face_id] = list_index
+        return index
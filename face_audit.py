@@ -0,0 +1,217 @@
+# Background writer untuk audit I/O face login (foto audit + FaceRecognitionLog)
+#
+# Request thread hanya append ke bounded queue (tanpa I/O). Satu daemon thread per
+# process men-drain queue setiap FACE_AUDIT_FLUSH_INTERVAL detik (atau begitu
+# FACE_AUDIT_BATCH_SIZE item terkumpul): JPEG encode + tulis file foto, dan semua log
+# row dalam satu bulk INSERT + satu commit. Queue penuh -> item tertua di-drop, login
+# response tidak pernah menunggu audit. Sisa queue di-flush saat process exit (atexit).
+# FACE_AUDIT_ASYNC=0: tulis langsung di request thread (behaviour lama, untuk debugging).
+import atexit
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+FACE_AUDIT_ASYNC = os.environ.get('FACE_AUDIT_ASYNC', '1') == '1'
+FACE_AUDIT_QUEUE_SIZE = int(os.environ.get('FACE_AUDIT_QUEUE_SIZE', 1000))
+FACE_AUDIT_FLUSH_INTERVAL = float(os.environ.get('FACE_AUDIT_FLUSH_INTERVAL', 2.0))  # detik
+FACE_AUDIT_BATCH_SIZE = int(os.environ.get('FACE_AUDIT_BATCH_SIZE', 100))
+FACE_AUDIT_SHUTDOWN_TIMEOUT = 5.0
+
+AUDIT_LOG = 'log'
+AUDIT_PHOTO = 'photo'
+
+def write_photo(image, filepath, quality=85):
+    """
+    JPEG encode + tulis satu foto audit
+    image: PIL Image, atau numpy array BGR / gray (cv2)
+    """
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if hasattr(image, 'save'):
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(filepath, 'JPEG', quality=quality)
+        return
+    import cv2
+    ok, data = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError(f'JPEG encode failed for {filepath}')
+    with open(filepath, 'wb') as f:
+        f.write(data.tobytes())
+
+def write_logs(rows):
+    """
+    Bulk insert FaceRecognitionLog (butuh app context)
+    Fungsi: username di-resolve ke users.id dengan satu query untuk seluruh batch,
+    lalu satu INSERT executemany + satu commit
+    """
+    from face_models import FaceRecognitionLog, User
+    from kapal_models import db
+    usernames = {row['username'] for row in rows if row.get('username')}
+    user_ids = {}
+    if usernames:
+        user_ids = dict(db.session.query(User.username, User.id).filter(User.username.in_(usernames)))
+    records = []
+    for row in rows:
+        record = dict(row)
+        record['user_id'] = user_ids.get(record.pop('username', None))
+        records.append(record)
+    try:
+        db.session.execute(FaceRecognitionLog.__table__.insert(), records)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+class FaceAuditWriter:
+    """
+    Bounded in-process queue + background thread untuk audit I/O
+    Fungsi: submit_log / submit_photo dari request thread, batch write di thread sendiri
+    """
+
+    def __init__(self, max_queue=FACE_AUDIT_QUEUE_SIZE, flush_interval=FACE_AUDIT_FLUSH_INTERVAL,
+                 batch_size=FACE_AUDIT_BATCH_SIZE, enabled=FACE_AUDIT_ASYNC):
+        self.app = None
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.enabled = enabled
+        self._queue = deque(maxlen=max(1, max_queue))  # append saat penuh = drop item tertua
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stopping = False
+        self._in_flight = 0
+        self.counters = {'dropped': 0, 'logs': 0, 'photos': 0, 'failed': 0}
+        atexit.register(self.shutdown)
+
+    def init_app(self, app):
+        """Flask app untuk app context saat menulis log rows"""
+        self.app = app
+
+    def submit(self, kind, payload):
+        """
+        Queue satu item audit (non-blocking)
+        Returns: True jika di-queue, False jika ditulis langsung (FACE_AUDIT_ASYNC=0)
+        """
+        if not self.enabled:
+            self.process([(kind, payload)])
+            return False
+        with self._cond:
+            if len(self._queue) == self._queue.maxlen:
+                self.counters['dropped'] += 1
+                if self.counters['dropped'] % 100 == 1:
+                    print(f"[WARNING] Face audit queue full, dropping oldest ({self.counters['dropped']} dropped)")
+            self._queue.append((kind, payload))
+            self._ensure_thread()
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+        return True
+
+    def submit_log(self, **fields):
+        """Queue satu FaceRecognitionLog row (kolom model + 'username' untuk resolve user_id)"""
+        fields.setdefault('created_at', datetime.utcnow())
+        return self.submit(AUDIT_LOG, fields)
+
+    def submit_photo(self, image, filepath, quality=85):
+        """Queue satu foto audit; JPEG encode + write jalan di background thread"""
+        return self.submit(AUDIT_PHOTO, (image, filepath, quality))
+
+    def _ensure_thread(self):
+        """Start writer thread (lazy, dan ulang setelah fork). Caller memegang _cond"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        self._pid = os.getpid()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='face-audit', daemon=True)
+        self._thread.start()
+
+    def _take(self):
+        """Ambil semua item di queue. Caller memegang _cond"""
+        items = list(self._queue)
+        self._queue.clear()
+        self._in_flight += len(items)
+        return items
+
+    def _done(self, items):
+        with self._cond:
+            self._in_flight -= len(items)
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopping or len(self._queue) >= self.batch_size,
+                                    timeout=self.flush_interval)
+                items = self._take()
+                stopping = self._stopping
+            if items:
+                try:
+                    self.process(items)
+                finally:
+                    self._done(items)
+            if stopping and not items:
+                return
+
+    def process(self, items):
+        """Tulis satu batch: foto satu per satu, log rows sebagai satu bulk insert"""
+        counts = {'logs': 0, 'photos': 0, 'failed': 0}
+        logs = [payload for kind, payload in items if kind == AUDIT_LOG]
+        for kind, payload in items:
+            if kind != AUDIT_PHOTO:
+                continue
+            try:
+                write_photo(*payload)
+                counts['photos'] += 1
+            except Exception as e:
+                counts['failed'] += 1
+                print(f"[ERROR] Face audit photo {payload[1]}: {e}")
+        if logs:
+            try:
+                if self.app is None:
+                    raise RuntimeError('FaceAuditWriter.init_app() not called')
+                with self.app.app_context():
+                    write_logs(logs)
+                counts['logs'] += len(logs)
+            except Exception as e:
+                counts['failed'] += len(logs)
+                print(f"[ERROR] Face audit log write ({len(logs)} rows): {e}")
+        with self._cond:
+            for name, count in counts.items():
+                self.counters[name] += count
+
+    def flush(self, timeout=FACE_AUDIT_SHUTDOWN_TIMEOUT):
+        """
+        Tulis semua item yang masih di queue sekarang (di thread pemanggil) dan tunggu
+        batch yang sedang ditulis writer thread. Returns: True jika semua selesai
+        """
+        with self._cond:
+            items = self._take()
+        if items:
+            try:
+                self.process(items)
+            finally:
+                self._done(items)
+        with self._cond:
+            return self._cond.wait_for(lambda: self._in_flight == 0, timeout=timeout)
+
+    def shutdown(self, timeout=FACE_AUDIT_SHUTDOWN_TIMEOUT):
+        """Stop writer thread dan flush sisa queue (atexit, termasuk graceful stop gunicorn worker)"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        self.flush(timeout)
+
+    def stats(self):
+        """Returns: counters + panjang queue untuk dashboard admin"""
+        with self._cond:
+            stats = dict(self.counters)
+            stats['queued'] = len(self._queue)
+        return stats
+
+# Global writer (satu thread per process, start saat item pertama di-submit)
+face_audit_writer = FaceAuditWriter()
@@ -0,0 +1,154 @@
+# Common face engine interface + runtime selection
+#
+# Semua engine (OpenCVFaceSystem, DlibFaceEngine, dan FaceWorkerClient sebagai proxy)
+# expose method dan result shape yang sama, sehingga app.py / face_worker.py tidak
+# tergantung engine mana yang dipakai:
+#   enroll_face(username, image_data, user_info=None, timer=None)
+#   recognize_face(image_data, confidence_threshold=80, timer=None)          -> 1:N identify
+#   verify_face(username, image_data, confidence_threshold=80, timer=None)   -> 1:1
+#   recognize_faces_batch(images, confidence_threshold=80, timer=None)
+#   delete_user(username), get_enrolled_users(), get_stats()
+# Result: {'success', 'message', ...}; match sukses berisi 'user' {'username', 'user_info',
+# 'enrolled_at'} dan 'confidence' / 'match_percentage' dalam persen (0-100).
+#
+# Engine dipilih lewat profile (FACE_ENGINE). Profile = engine + setting yang menentukan
+# trade-off latency vs accuracy; ukur di hardware sendiri dengan
+#   python benchmarks/bench_engine_profiles.py
+# lalu pilih profile termurah yang masih memenuhi accuracy.
+import abc
+import os
+
+# 'opencv' = OpenCVFaceSystem dengan config env-nya sendiri (FACE_RECOGNITION_ENGINE dkk.)
+FACE_ENGINE_PROFILE = os.environ.get('FACE_ENGINE', 'opencv')
+
+ENGINE_PROFILES = {
+    'opencv': {
+        'engine': 'opencv',
+        'description': 'OpenCV, setting dari env (default template correlation + coarse-to-fine detection)',
+    },
+    'opencv-template': {
+        'engine': 'opencv',
+        'description': 'Template correlation 200x200, coarse-to-fine Haar detection (default)',
+        'recognition_engine': 'template',
+        'detection_mode': 'coarse',
+    },
+    'opencv-template-ladder': {
+        'engine': 'opencv',
+        'description': 'Template correlation, Haar parameter ladder di full resolution (lebih lambat, recall detection lebih tinggi)',
+        'recognition_engine': 'template',
+        'detection_mode': 'ladder',
+    },
+    'dlib-hog': {
+        'engine': 'dlib',
+        'description': 'dlib HOG detection (upsample 1) + 128-d ResNet encoding',
+        'detection_model': 'hog',
+        'upsample': 1,
+        'max_side': 1024,
+        'encoding_model': 'large',
+    },
+    'dlib-hog-fast': {
+        'engine': 'dlib',
+        'description': 'dlib HOG tanpa upsample di 640px, 5-point landmarks (wajah harus dekat kamera)',
+        'detection_model': 'hog',
+        'upsample': 0,
+        'max_side': 640,
+        'encoding_model': 'small',
+    },
+    'dlib-cnn': {
+        'engine': 'dlib',
+        'description': 'dlib CNN detection (paling akurat, lambat tanpa GPU)',
+        'detection_model': 'cnn',
+        'upsample': 1,
+        'max_side': 800,
+        'encoding_model': 'large',
+    },
+}
+
+class FaceEngine(abc.ABC):
+    """
+    Base class face engine
+    Fungsi: Definisikan interface bersama; subclass wajib implement enroll_face,
+    recognize_face, verify_face, delete_user dan get_enrolled_users
+    """
+
+    engine_name = None
+    profile = None
+
+    @abc.abstractmethod
+    def enroll_face(self, username, image_data, user_info=None, timer=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def recognize_face(self, image_data, confidence_threshold=80, timer=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def verify_face(self, username, image_data, confidence_threshold=80, timer=None):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete_user(self, username):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_enrolled_users(self):
+        raise NotImplementedError
+
+    def recognize_faces_batch(self, images, confidence_threshold=80, timer=None):
+        """
+        Default: recognize_face per frame, hasil = frame dengan confidence tertinggi
+        (engine yang bisa match semua frame sekaligus override method ini)
+        """
+        frames = []
+        best = None
+        for index, image_data in enumerate(images):
+            result = self.recognize_face(image_data, confidence_threshold, timer=timer)
+            frame = {'frame': index, 'success': result['success'], 'message': result['message']}
+            if 'confidence' in result:
+                frame['confidence'] = frame['match_percentage'] = result['confidence']
+            if result['success']:
+                frame['username'] = result['user']['username']
+            frames.append(frame)
+            if 'confidence' in result and (best is None or result['confidence'] > best['confidence']):
+                best = result
+
+        result = dict(best) if best else {'success': False, 'message': 'No face detected in any frame'}
+        result['frames'] = frames
+        result['frames_processed'] = sum('confidence' in frame for frame in frames)
+        return result
+
+    def get_stats(self):
+        """Returns: dict info engine (nama, profile, jumlah user) untuk dashboard / metrics"""
+        return {
+            'engine': self.engine_name,
+            'profile': self.profile,
+            'enrolled_users': len(self.get_enrolled_users()),
+        }
+
+def get_engine_profile(name=None):
+    """
+    Returns: (name, profile dict) untuk name / FACE_ENGINE
+    Profile tidak dikenal -> ValueError (typo di config tidak boleh diam-diam fallback)
+    """
+    name = name or FACE_ENGINE_PROFILE
+    if name not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown face engine profile '{name}' (available: {', '.join(ENGINE_PROFILES)})")
+    return name, ENGINE_PROFILES[name]
+
+def create_face_engine(profile_name=None, **options):
+    """
+    Construct engine sesuai profile
+    options: argument tambahan untuk constructor engine (mis. faces_dir, registry untuk OpenCV)
+    Returns: FaceEngine
+    """
+    name, profile = get_engine_profile(profile_name)
+    settings = {key: value for key, value in profile.items() if key not in ('engine', 'description')}
+    settings.update(options)
+    if profile['engine'] == 'dlib':
+        from face_recognition_core import DlibFaceEngine
+        engine = DlibFaceEngine(**settings)
+    else:
+        from opencv_face_system import OpenCVFaceSystem
+        engine = OpenCVFaceSystem(**settings)
+    engine.profile = name
+    return engine
@@ -0,0 +1,290 @@
+# Shared on-disk face template gallery untuk semua gunicorn worker
+#
+# Layout di faces_dir:
+#   face_gallery.<generation>.bin   header 64 byte + float32 rows (append-only)
+#   face_gallery.json               id index {version, generation, row_count, rows: {username: [row, ...]}}
+#
+# Semua worker memory-map data file read-only, jadi template hanya ada sekali di
+# page cache. Writer append row baru lalu publish index baru dengan os.replace;
+# reader cukup os.stat index file per request untuk tahu ada version baru.
+# Row yang di-replace / dihapus jadi garbage sampai compaction (generation baru).
+# Satu user bisa punya beberapa template row; row aktif di-pack per user
+# (rows + offsets) sehingga score per user = satu reduceat atas score per template.
+import json
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows dev: lock hanya antar thread
+    fcntl = None
+
+GALLERY_MAGIC = b'FGALLERY'
+GALLERY_HEADER = struct.Struct('<8sII')  # magic, dim, generation
+GALLERY_HEADER_SIZE = 64
+GALLERY_DTYPE = np.dtype('<f4')
+
+# Compaction jika garbage rows > max(minimum, jumlah row aktif)
+GALLERY_COMPACT_MIN_GARBAGE = 64
+
+class FaceGalleryStore:
+    """
+    Memory-mapped template gallery yang di-share antar process
+    Fungsi: Simpan satu atau lebih vector (dim float32) per username, publish perubahan
+    secara atomic dan deteksi perubahan dari process lain dengan satu stat()
+    """
+
+    def __init__(self, directory, dim, name='face_gallery'):
+        self.directory = directory
+        self.dim = dim
+        self.name = name
+        self.index_file = os.path.join(directory, name + '.json')
+        self.lock_file = os.path.join(directory, name + '.lock')
+
+        self.version = 0
+        self.generation = 0
+        self.row_count = 0
+        self.usernames = []
+        self.rows = np.empty(0, dtype=np.int64)
+        self.offsets = np.empty(0, dtype=np.int64)
+        self.matrix = np.empty((0, dim), dtype=np.float32)
+        self._rows_by_username = {}
+        self._stat_key = None
+        # Username yang row-nya berubah di load terakhir (None = tidak diketahui: load
+        # pertama atau generation baru setelah compaction)
+        self.changed_usernames = None
+
+        self._lock = threading.Lock()          # swap state untuk reader
+        self._write_lock = threading.RLock()   # writer dalam process ini
+        self._write_depth = 0
+        self._lock_handle = None
+
+    def __len__(self):
+        return len(self.usernames)
+
+    @property
+    def template_count(self):
+        return len(self.rows)
+
+    def data_file(self, generation):
+        return os.path.join(self.directory, f'{self.name}.{generation}.bin')
+
+    def _index_stat_key(self):
+        try:
+            stat = os.stat(self.index_file)
+        except FileNotFoundError:
+            return None
+        # os.replace selalu membuat inode baru
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _map_rows(self, generation, row_count):
+        """Memory-map row_count rows pertama dari data file (read-only)"""
+        if row_count == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        path = self.data_file(generation)
+        with open(path, 'rb') as f:
+            magic, dim, file_generation = GALLERY_HEADER.unpack(f.read(GALLERY_HEADER.size))
+        if magic != GALLERY_MAGIC or dim != self.dim or file_generation != generation:
+            raise ValueError(f'Invalid gallery data file {path}')
+        return np.memmap(path, dtype=GALLERY_DTYPE, mode='r', offset=GALLERY_HEADER_SIZE,
+                         shape=(row_count, self.dim))
+
+    def load(self):
+        """Load index terbaru dan memory-map data file-nya. Returns: False jika belum ada gallery"""
+        stat_key = self._index_stat_key()
+        if stat_key is None:
+            return False
+        try:
+            with open(self.index_file, 'r') as f:
+                index = json.load(f)
+            if index.get('dim') != self.dim:
+                print(f"[WARNING] Face gallery dim mismatch ({index.get('dim')} vs {self.dim})")
+                return False
+            matrix = self._map_rows(index['generation'], index['row_count'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARNING] Face gallery unreadable: {e}")
+            return False
+
+        # Index lama: satu row (int) per username
+        rows_by_username = {username: rows if isinstance(rows, list) else [rows]
+                            for username, rows in index['rows'].items() if rows != []}
+        usernames = sorted(rows_by_username, key=lambda username: rows_by_username[username][0])
+        counts = [len(rows_by_username[u]) for u in usernames]
+        # Row dalam satu generation tidak pernah dipakai ulang: row list berubah = user berubah
+        previous = self._rows_by_username
+        if self._stat_key is not None and index['generation'] == self.generation:
+            changed = {username for username in set(previous) | set(rows_by_username)
+                       if previous.get(username) != rows_by_username.get(username)}
+        else:
+            changed = None
+        with self._lock:
+            self.version = index['version']
+            self.generation = index['generation']
+            self.row_count = index['row_count']
+            self.usernames = usernames
+            self.rows = np.array([row for u in usernames for row in rows_by_username[u]], dtype=np.int64)
+            self.offsets = np.cumsum([0] + counts[:-1], dtype=np.int64) if counts else np.empty(0, dtype=np.int64)
+            self.matrix = matrix
+            self._rows_by_username = rows_by_username
+            self._stat_key = stat_key
+            self.changed_usernames = changed
+        return True
+
+    def refresh(self):
+        """
+        Reload jika process lain sudah publish version baru
+        Returns: True jika gallery berubah sejak load terakhir
+        """
+        stat_key = self._index_stat_key()
+        if stat_key is None or stat_key == self._stat_key:
+            return False
+        return self.load()
+
+    def snapshot(self):
+        """
+        Returns: (usernames, rows, offsets, matrix). Template aktif = matrix[rows]
+        (matrix bisa berisi garbage rows); template user ke-i = rows[offsets[i]:offsets[i + 1]]
+        """
+        with self._lock:
+            return self.usernames, self.rows, self.offsets, self.matrix
+
+    def versioned_snapshot(self):
+        """Returns: (generation, usernames, rows, offsets, matrix); row dalam satu generation immutable"""
+        with self._lock:
+            return self.generation, self.usernames, self.rows, self.offsets, self.matrix
+
+    def templates(self, username):
+        """Returns: template username (K x dim, lookup index tanpa scan gallery), atau None"""
+        with self._lock:
+            rows = self._rows_by_username.get(username)
+            matrix = self.matrix
+        return None if not rows else np.asarray(matrix[rows])
+
+    @contextmanager
+    def write_lock(self):
+        """Exclusive lock antar thread dan antar process (flock), reentrant"""
+        with self._write_lock:
+            if self._write_depth == 0 and fcntl is not None:
+                self._lock_handle = open(self.lock_file, 'a')
+                fcntl.flock(self._lock_handle, fcntl.LOCK_EX)
+            self._write_depth += 1
+            try:
+                yield
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0 and self._lock_handle is not None:
+                    fcntl.flock(self._lock_handle, fcntl.LOCK_UN)
+                    self._lock_handle.close()
+                    self._lock_handle = None
+
+    def _publish(self, generation, row_count, rows_by_username):
+        """Tulis index baru (tmp + fsync + os.replace) lalu load sebagai state sendiri"""
+        index = {
+            'version': self.version + 1,
+            'generation': generation,
+            'dim': self.dim,
+            'row_count': row_count,
+            'rows': rows_by_username,
+        }
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(index, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.index_file)
+        self.load()
+
+    def replace_all(self, usernames, matrix):
+        """
+        Tulis generation baru berisi tepat matrix (bootstrap & compaction)
+        usernames: pemilik setiap row matrix (username boleh berulang untuk multi-template)
+        """
+        matrix = np.ascontiguousarray(matrix, dtype=GALLERY_DTYPE).reshape(-1, self.dim)
+        with self.write_lock():
+            self.refresh()
+            old_generation = self.generation if self._stat_key is not None else None
+            generation = self.generation + 1
+            path = self.data_file(generation)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(GALLERY_HEADER.pack(GALLERY_MAGIC, self.dim, generation).ljust(GALLERY_HEADER_SIZE, b'\0'))
+                f.write(matrix.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            rows_by_username = {}
+            for row, username in enumerate(usernames):
+                rows_by_username.setdefault(username, []).append(row)
+            self._publish(generation, len(usernames), rows_by_username)
+
+            # Reader yang masih map file lama tetap aman (unlink tidak menghapus mapping)
+            if old_generation is not None and old_generation != generation:
+                try:
+                    os.remove(self.data_file(old_generation))
+                except OSError:
+                    pass
+
+    def upsert(self, username, vectors):
+        """Ganti semua template username dengan vectors (row lama jadi garbage)"""
+        self.update_templates(username, [], vectors)
+
+    def update_templates(self, username, keep, vectors):
+        """
+        Template baru username = template lama di index keep (urutan tetap) + vectors (append)
+        Returns: jumlah template username setelah update
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=GALLERY_DTYPE).reshape(-1, self.dim)
+        with self.write_lock():
+            self.refresh()
+            if self._stat_key is None:
+                self.replace_all([username] * len(vectors), vectors)
+                return len(vectors)
+            old_rows = self._rows_by_username.get(username, [])
+            # Tulis di posisi row_count (truncate sisa append yang tidak pernah di-publish)
+            with open(self.data_file(self.generation), 'r+b') as f:
+                f.seek(GALLERY_HEADER_SIZE + self.row_count * self.dim * GALLERY_DTYPE.itemsize)
+                f.write(vectors.tobytes())
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+            rows_by_username = dict(self._rows_by_username)
+            rows_by_username[username] = ([old_rows[i] for i in keep]
+                                          + list(range(self.row_count, self.row_count + len(vectors))))
+            if not rows_by_username[username]:
+                del rows_by_username[username]
+            self._publish(self.generation, self.row_count + len(vectors), rows_by_username)
+            self.compact_if_needed()
+            return len(rows_by_username.get(username, []))
+
+    def remove(self, username):
+        """
+        Hapus username dari index. Selalu publish version baru supaya worker lain
+        ikut reload state yang terkait (users.json, LBPH model)
+        Returns: True jika username ada
+        """
+        with self.write_lock():
+            self.refresh()
+            rows_by_username = dict(self._rows_by_username)
+            existed = rows_by_username.pop(username, None) is not None
+            if self._stat_key is None:
+                self.replace_all([], np.empty((0, self.dim), dtype=np.float32))
+            else:
+                self._publish(self.generation, self.row_count, rows_by_username)
+                self.compact_if_needed()
+            return existed
+
+    def compact_if_needed(self):
+        """Rewrite ke generation baru jika garbage rows sudah terlalu banyak"""
+        with self.write_lock():
+            usernames, rows, offsets, matrix = self.snapshot()
+            garbage = self.row_count - len(rows)
+            if garbage <= max(GALLERY_COMPACT_MIN_GARBAGE, len(rows)):
+                return False
+            counts = np.diff(np.append(offsets, len(rows)))
+            self.replace_all([u for u, count in zip(usernames, counts) for _ in range(count)],
+                             np.asarray(matrix)[rows])
+            print(f"[OK] Face gallery compacted: {garbage} garbage rows dropped")
+            return True
@@ -0,0 +1,200 @@
+# LBPH (Local Binary Patterns Histograms) face model, NumPy implementation
+try:
+    import cv2
+    import numpy as np
+    OPENCV_AVAILABLE = True
+except ImportError:
+    OPENCV_AVAILABLE = False
+
+import os
+import threading
+
+from face_gallery_store import FaceGalleryStore
+
+# LBPH parameters (sama dengan default cv2.face.LBPHFaceRecognizer: radius 1, 8 neighbors, grid 8x8)
+LBPH_GRID = (8, 8)
+LBPH_FACE_SIZE = (200, 200)
+
+def _uniform_lookup():
+    """
+    Mapping 256 LBP code -> 59 bin 'uniform pattern'
+    (58 pattern dengan <= 2 transisi bit + 1 bin untuk sisanya)
+    """
+    lookup = np.full(256, 58, dtype=np.uint8)
+    next_bin = 0
+    for code in range(256):
+        bits = [(code >> i) & 1 for i in range(8)]
+        transitions = sum(bits[i] != bits[(i + 1) % 8] for i in range(8))
+        if transitions <= 2:
+            lookup[code] = next_bin
+            next_bin += 1
+    return lookup
+
+if OPENCV_AVAILABLE:
+    UNIFORM_LOOKUP = _uniform_lookup()
+    LBPH_BINS = 59
+    LBPH_DIM = LBPH_GRID[0] * LBPH_GRID[1] * LBPH_BINS
+
+def lbp_histogram(face_gray):
+    """
+    Hitung spatial LBP histogram dari face grayscale
+    Returns: float32 vector (grid x 59 bin), setiap cell dinormalisasi sehingga jumlahnya 1
+    (chi-square distance = jumlah distance per cell, 0..2 per cell)
+    """
+    if face_gray.shape[:2] != (LBPH_FACE_SIZE[1], LBPH_FACE_SIZE[0]):
+        face_gray = cv2.resize(face_gray, LBPH_FACE_SIZE)
+    image = face_gray.astype(np.int16)
+    center = image[1:-1, 1:-1]
+    height, width = center.shape
+
+    # 8 neighbors radius 1, searah jarum jam dari kiri atas
+    offsets = [(-1, -1), (-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1)]
+    codes = np.zeros(center.shape, dtype=np.uint8)
+    for bit, (dy, dx) in enumerate(offsets):
+        neighbor = image[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+        codes |= (neighbor >= center).astype(np.uint8) << bit
+    codes = UNIFORM_LOOKUP[codes]
+
+    # Histogram per cell dalam satu bincount (offset bin per cell)
+    rows, cols = LBPH_GRID
+    cell_h, cell_w = height // rows, width // cols
+    codes = codes[:cell_h * rows, :cell_w * cols]
+    cell_index = (np.arange(rows).repeat(cell_h)[:, np.newaxis] * cols
+                  + np.arange(cols).repeat(cell_w)[np.newaxis, :])
+    histogram = np.bincount((cell_index * LBPH_BINS + codes).ravel(), minlength=LBPH_DIM)
+    histogram = histogram.reshape(rows * cols, LBPH_BINS).astype(np.float32)
+    histogram /= histogram.sum(axis=1, keepdims=True)
+    return histogram.ravel()
+
+def chi_square_distances(histograms, query):
+    """Chi-square distance query terhadap setiap baris histograms (vectorized)"""
+    numerator = (histograms - query) ** 2
+    denominator = histograms + query
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0).sum(axis=1)
+
+def label_rows(labels):
+    """Index label -> list row histogram (satu label bisa punya beberapa histogram)"""
+    rows = {}
+    for row, label in enumerate(labels):
+        rows.setdefault(label, []).append(row)
+    return rows
+
+def mean_distances(distances, label_ids, label_count):
+    """Distance per histogram -> rata-rata distance per label (aggregation 'mean')"""
+    counts = np.bincount(label_ids, minlength=label_count)
+    return np.bincount(label_ids, weights=distances, minlength=label_count) / np.maximum(counts, 1)
+
+class LBPHFaceModel:
+    """
+    LBPH face recognizer dengan incremental update
+    Fungsi: Setiap enrollment hanya menambah histogram label itu (tanpa full retrain).
+    Histogram disimpan di FaceGalleryStore (face_model.<generation>.bin append-only +
+    index face_model.json), jadi update / remove satu label tidak rewrite seluruh matrix
+    dan semua worker memory-map file yang sama.
+    """
+
+    def __init__(self, model_file):
+        self.model_file = model_file
+        directory, name = os.path.split(os.path.splitext(model_file)[0])
+        self.store = FaceGalleryStore(directory or '.', LBPH_DIM, name=name)
+        self.labels = []
+        self.histograms = np.empty((0, LBPH_DIM), dtype=np.float32)
+        self._rows = np.empty(0, dtype=np.int64)
+        self._rows_by_label = {}
+        self._label_names = []
+        self._label_ids = np.empty(0, dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.labels)
+
+    def _load_store(self):
+        """Ambil snapshot store: label per histogram + row matrix-nya (garbage rows dilewati)"""
+        usernames, rows, offsets, matrix = self.store.snapshot()
+        counts = np.diff(np.append(offsets, len(rows)))
+        labels = [label for label, count in zip(usernames, counts) for _ in range(count)]
+        with self._lock:
+            self.labels = labels
+            self._rows_by_label = label_rows(labels)
+            self._label_names = list(self._rows_by_label)
+            label_index = {label: i for i, label in enumerate(self._label_names)}
+            self._label_ids = np.array([label_index[label] for label in labels], dtype=np.int64)
+            self._rows = rows
+            self.histograms = matrix
+
+    def template_count(self, label):
+        return len(self._rows_by_label.get(label, []))
+
+    def load(self):
+        """Load model dari disk; histogram di-memory-map (read-only)"""
+        if not self.store.load():
+            return False
+        self._load_store()
+        return True
+
+    def train(self, samples):
+        """Full train dari list (label, face_gray); hanya dipakai untuk bootstrap model"""
+        labels = [label for label, _ in samples]
+        histograms = [lbp_histogram(face_gray) for _, face_gray in samples]
+        self.store.replace_all(labels, np.vstack(histograms) if histograms else np.empty((0, LBPH_DIM)))
+        self._load_store()
+
+    def update(self, label, face_gray, replace=True):
+        """
+        Incremental update: tambah histogram satu face
+        replace=True -> histogram lama untuk label yang sama dibuang
+        """
+        keep = [] if replace else range(self.template_count(label))
+        self.update_label(label, keep, [face_gray])
+
+    def update_label(self, label, keep, face_grays):
+        """
+        Histogram label = histogram lama di index keep (urutan tetap) + histogram face_grays
+        (urutan sama dengan template di gallery / face_files); hanya histogram baru yang di-append
+        """
+        histograms = [lbp_histogram(face_gray) for face_gray in face_grays]
+        self.store.update_templates(label, list(keep),
+                                    np.vstack(histograms) if histograms else np.empty((0, LBPH_DIM)))
+        self._load_store()
+
+    def remove(self, label):
+        """Hapus semua histogram untuk label"""
+        removed = self.store.remove(label)
+        self._load_store()
+        return removed
+
+    def predict(self, face_gray, aggregation='max'):
+        """
+        aggregation: 'max' = histogram terdekat, 'mean' = rata-rata distance semua histogram label
+        Returns: (label, chi-square distance), atau (None, None)
+        """
+        with self._lock:
+            labels = self.labels
+            histograms = self.histograms
+            rows = self._rows
+            label_names = self._label_names
+            label_ids = self._label_ids
+        if len(labels) == 0:
+            return None, None
+        # Distance ke seluruh matrix (garbage rows dibatasi compaction) lalu ambil row aktif
+        distances = chi_square_distances(histograms, lbp_histogram(face_gray))[rows]
+        if aggregation == 'mean':
+            per_label = mean_distances(distances, label_ids, len(label_names))
+            best = int(np.argmin(per_label))
+            return label_names[best], float(per_label[best])
+        best = int(np.argmin(distances))
+        return labels[best], float(distances[best])
+
+    def distance(self, label, face_gray, aggregation='max'):
+        """
+        1:1 verification: chi-square distance face terhadap histogram label saja
+        Returns: distance terdekat ('max') / rata-rata ('mean'), atau None jika label tidak ada di model
+        """
+        with self._lock:
+            positions = self._rows_by_label.get(label)
+            rows = self._rows
+            histograms = self.histograms
+        if not positions:
+            return None
+        distances = chi_square_distances(np.asarray(histograms[rows[positions]]), lbp_histogram(face_gray))
+        return float(distances.mean() if aggregation == 'mean' else distances.min())
@@ -0,0 +1,92 @@
+# Per-stage timing instrumentation untuk face pipeline
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+class StageTimer:
+    """
+    Timer per stage untuk satu request
+    Fungsi: Catat durasi (ms, monotonic clock) setiap stage face pipeline
+
+    Usage:
+        timer = StageTimer()
+        with timer.stage('detect'):
+            faces = face_system.detect_faces(image)
+        timer.as_dict()  # {'detect': 12.3, 'total': 12.3}
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.started_at = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (time.perf_counter() - start) * 1000
+
+    @property
+    def total_ms(self):
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def as_dict(self):
+        timings = {name: round(ms, 3) for name, ms in self.stages.items()}
+        timings['total'] = round(self.total_ms, 3)
+        return timings
+
+class NullTimer:
+    """Timer no-op untuk pemanggil yang tidak butuh instrumentation"""
+
+    @contextmanager
+    def stage(self, name):
+        yield
+
+NULL_TIMER = NullTimer()
+
+class StageMetrics:
+    """
+    Rolling window latency per stage
+    Fungsi: Simpan N sample terakhir per stage dan hitung p50/p95/p99 untuk admin
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, timings):
+        """Tambah satu breakdown {stage: ms} ke rolling window"""
+        with self._lock:
+            for name, ms in timings.items():
+                if name not in self.samples:
+                    self.samples[name] = deque(maxlen=self.window)
+                self.samples[name].append(ms)
+
+    def percentiles(self):
+        """Returns: {stage: {'count', 'p50', 'p95', 'p99'}} dalam ms"""
+        with self._lock:
+            snapshot = {name: np.array(values) for name, values in self.samples.items()}
+        summary = {}
+        for name, values in snapshot.items():
+            if len(values) == 0:
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            summary[name] = {
+                'count': int(len(values)),
+                'p50': round(float(p50), 3),
+                'p95': round(float(p95), 3),
+                'p99': round(float(p99), 3),
+            }
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+# Global metrics untuk face recognition requests
+face_metrics = StageMetrics()
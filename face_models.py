@@ -1,9 +1,18 @@
 # Database models untuk Face Recognition System
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, func, inspect, text, update, MetaData
+from sqlalchemy.orm import Session, object_session
 from datetime import datetime
+import atexit
 import json
+import os
+import threading
+import time
+import numpy as np
+from kapal_models import db
 
-db = SQLAlchemy()
+# Dimensi face encoding dari face_recognition (dlib) dan format binary-nya (little-endian float32)
+ENCODING_DIM = 128
+ENCODING_DTYPE = np.dtype('<f4')
 
 class User(db.Model):
     """
@@ -47,7 +56,8 @@ class FaceData(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    face_encoding = db.Column(db.Text, nullable=False)  # JSON encoded face features
+    face_encoding = db.Column(db.Text, nullable=True)  # Legacy: JSON encoded face features
+    face_encoding_bin = db.Column(db.LargeBinary, nullable=True)  # Raw little-endian float32 (128 x 4 = 512 bytes)
     photo_filename = db.Column(db.String(255), nullable=True)  # Optional: simpan foto
     confidence_threshold = db.Column(db.Float, default=0.6)  # Threshold untuk recognition
     is_primary = db.Column(db.Boolean, default=False)  # Primary face untuk user
@@ -59,24 +69,27 @@ class FaceData(db.Model):
     
     def get_encoding_array(self):
         """
-        Convert JSON face encoding ke numpy array
-        Fungsi: Face encoding disimpan sebagai JSON string, convert ke array untuk processing
+        Convert stored face encoding ke numpy array
+        Fungsi: Decode binary float32 langsung via np.frombuffer,
+        fallback ke JSON untuk row lama yang belum dimigrasi
         """
         try:
-            return json.loads(self.face_encoding)
+            if self.face_encoding_bin is not None:
+                return np.frombuffer(self.face_encoding_bin, dtype=ENCODING_DTYPE)
+            return np.asarray(json.loads(self.face_encoding), dtype=np.float32)
         except:
             return None
     
     def set_encoding_array(self, encoding_array):
         """
-        Simpan numpy array sebagai JSON string
-        Fungsi: Convert numpy array ke JSON untuk disimpan di database
+        Simpan numpy array sebagai raw float32 bytes
+        Fungsi: 512 bytes per face, tanpa JSON encode/parse
         """
         try:
-            # Convert numpy array ke list, lalu ke JSON
-            self.face_encoding = json.dumps(encoding_array.tolist())
-        except:
+            self.face_encoding_bin = np.asarray(encoding_array, dtype=ENCODING_DTYPE).tobytes()
             self.face_encoding = None
+        except:
+            self.face_encoding_bin = None
 
 class Attendance(db.Model):
     """
@@ -165,17 +178,86 @@ class FaceRecognitionLog(db.Model):
     def __repr__(self):
         return f'<FaceLog {self.id}: {"✅" if self.recognized else "❌"}>'
 
+class FaceRegistryEntry(db.Model):
+    """
+    Registry user yang enroll di OpenCVFaceSystem (pengganti faces_data/users.json)
+    Fungsi: Satu row per username; insert/delete per row dengan id unik,
+    foto wajah ikut disimpan supaya replica baru bisa restore faces_data
+    """
+    __tablename__ = 'face_registry'
+
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(50), unique=True, nullable=False, index=True)
+    face_file = db.Column(db.String(255), nullable=False)
+    face_image = db.deferred(db.Column(db.LargeBinary, nullable=True))  # JPEG face ROI, tidak di-load saat listing
+    user_info = db.Column(db.Text, nullable=True)  # JSON
+    enrolled_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<FaceRegistryEntry {self.username}>'
+
+    def to_users_data(self, face_files=None):
+        """
+        Format yang sama dengan entry users.json lama
+        face_files: template user (urutan face_registry_template.id), default face_file saja
+        """
+        return {
+            'user_id': self.id,
+            'face_file': self.face_file,
+            'face_files': face_files or [self.face_file],
+            'enrolled_at': self.enrolled_at.isoformat() if self.enrolled_at else None,
+            'user_info': json.loads(self.user_info) if self.user_info else {}
+        }
+
+class FaceRegistryTemplate(db.Model):
+    """
+    Foto template user di face_registry (multi-template enrollment)
+    Fungsi: Satu row per face file; urutan id = urutan template di gallery / LBPH model.
+    Entry lama tanpa row di sini memakai face_registry.face_image
+    """
+    __tablename__ = 'face_registry_template'
+
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(50), nullable=False, index=True)
+    face_file = db.Column(db.String(255), nullable=False)
+    face_image = db.deferred(db.Column(db.LargeBinary, nullable=True))  # JPEG face ROI
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<FaceRegistryTemplate {self.username}: {self.face_file}>'
+
+class FaceRegistryImport(db.Model):
+    """
+    Marker one-shot import users.json ke face_registry
+    Fungsi: Satu row per file sumber yang sudah di-import, sehingga import tidak
+    jalan lagi saat tabel kosong karena semua user dihapus
+    """
+    __tablename__ = 'face_registry_import'
+
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(255), unique=True, nullable=False)
+    imported = db.Column(db.Integer, nullable=True)  # NULL = tabel sudah terisi sebelum marker ada
+    skipped = db.Column(db.Integer, nullable=True)
+    missing_photo = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<FaceRegistryImport {self.source}>'
+
 # Utility functions untuk database operations
 def init_face_database(app):
     """
     Initialize database dengan sample data
-    Fungsi: Setup database tables dan create sample users
+    Fungsi: Setup database tables, migrasi encoding JSON -> float32 dan create sample users.
+    Face tables memakai db instance kapal_models (satu engine per app); db di-register
+    di sini jika app belum memanggil init_kapal_database
     """
-    db.init_app(app)
-    
+    if 'sqlalchemy' not in app.extensions:
+        db.init_app(app)
     with app.app_context():
         # Create all tables
         db.create_all()
+        migrate_face_encodings_to_binary()
         
         # Create sample users jika belum ada
         sample_users = [
@@ -208,46 +290,451 @@ def init_face_database(app):
         db.session.commit()
         print("[OK] Face recognition database initialized!")
 
-def get_user_by_face_encoding(face_encoding, confidence_threshold=0.6):
+def migrate_face_encodings_to_binary():
+    """
+    One-shot migration FaceData.face_encoding (JSON text) -> face_encoding_bin (float32)
+    Fungsi: Tambah kolom binary di database lama, lepas NOT NULL dari kolom JSON,
+    lalu convert semua row lama. Aman dijalankan berulang (no-op jika sudah migrasi).
+    Harus dipanggil di dalam app context.
+    """
+    engine = db.engine
+    columns = {column['name']: column for column in inspect(engine).get_columns('face_data')}
+    
+    if 'face_encoding_bin' not in columns or not columns['face_encoding']['nullable']:
+        with engine.begin() as connection:
+            if engine.dialect.name == 'sqlite' and not columns['face_encoding']['nullable']:
+                # SQLite tidak bisa ALTER COLUMN: rebuild table dengan schema baru
+                legacy_columns = ', '.join(name for name in columns)
+                metadata = MetaData()
+                User.__table__.to_metadata(metadata)
+                new_table = FaceData.__table__.to_metadata(metadata, name='face_data_new')
+                new_table.create(connection)
+                connection.execute(text(
+                    f'INSERT INTO face_data_new ({legacy_columns}) SELECT {legacy_columns} FROM face_data'
+                ))
+                connection.execute(text('DROP TABLE face_data'))
+                connection.execute(text('ALTER TABLE face_data_new RENAME TO face_data'))
+            else:
+                if 'face_encoding_bin' not in columns:
+                    binary_type = db.LargeBinary().compile(dialect=engine.dialect)
+                    connection.execute(text(f'ALTER TABLE face_data ADD COLUMN face_encoding_bin {binary_type}'))
+                if not columns['face_encoding']['nullable']:
+                    connection.execute(text('ALTER TABLE face_data ALTER COLUMN face_encoding DROP NOT NULL'))
+        print("[OK] face_data schema migrated to binary encodings")
+    
+    # Convert row lama yang masih JSON
+    legacy_rows = db.session.query(FaceData.id, FaceData.face_encoding).filter(
+        FaceData.face_encoding_bin.is_(None), FaceData.face_encoding.isnot(None)
+    ).all()
+    if not legacy_rows:
+        return 0
+    
+    updates = []
+    for face_id, face_encoding in legacy_rows:
+        try:
+            encoding = np.asarray(json.loads(face_encoding), dtype=ENCODING_DTYPE)
+        except (TypeError, ValueError):
+            print(f"[WARNING] Skipping invalid face encoding id={face_id}")
+            continue
+        updates.append({'id': face_id, 'face_encoding_bin': encoding.tobytes(), 'face_encoding': None})
+    
+    if updates:
+        db.session.execute(update(FaceData), updates)
+        db.session.commit()
+    print(f"[OK] {len(updates)} face encodings migrated to binary float32")
+    return len(updates)
+
+
+# Face index config: 'exact' (brute-force matrix scan) atau 'ivf' (approximate, untuk gallery besar)
+FACE_INDEX_BACKEND = os.environ.get('FACE_INDEX_BACKEND', 'exact')
+FACE_ANN_INDEX_PATH = os.environ.get('FACE_ANN_INDEX_PATH', os.path.join('instance', 'face_ann_index.npz'))
+FACE_ANN_MIN_SIZE = int(os.environ.get('FACE_ANN_MIN_SIZE', 5000))  # Di bawah ini exact search lebih cepat
+FACE_ANN_NPROBE = int(os.environ.get('FACE_ANN_NPROBE', 8))
+# Encoding baru masuk ke list yang sudah ada tanpa re-train; k-means diulang di background jika
+# N > growth * n_lists^2 (train memakai ~sqrt(N) list, jadi gallery sudah tumbuh ~growth kali)
+FACE_ANN_RETRAIN_GROWTH = float(os.environ.get('FACE_ANN_RETRAIN_GROWTH', 4.0))
+# Perubahan IVF index dipersist di background maksimal sekali per interval (detik), plus saat exit
+FACE_ANN_SAVE_INTERVAL = float(os.environ.get('FACE_ANN_SAVE_INTERVAL', 30.0))
+# Cek perubahan face_data dari worker / replica lain (atau bulk delete tanpa ORM event)
+# maksimal sekali per interval (detik); 0 = cek setiap search
+FACE_INDEX_REFRESH_INTERVAL = float(os.environ.get('FACE_INDEX_REFRESH_INTERVAL', 2.0))
+
+class FaceEncodingIndex:
+    """
+    Resident index untuk semua primary face encoding
+    Fungsi: Simpan encodings di float32 matrix (N x 128) dengan parallel id arrays,
+    sehingga 1:N search = satu batched distance computation + top-k selection
+    """
+    
+    def __init__(self, backend=None):
+        self.backend = backend or FACE_INDEX_BACKEND
+        self.ann_index = None  # IVFFlatIndex jika backend='ivf'
+        self.face_ids = np.empty(0, dtype=np.int64)
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.encodings = np.empty((0, ENCODING_DIM), dtype=np.float32)
+        self.squared_norms = np.empty(0, dtype=np.float32)
+        self.loaded = False
+        self.signature = None  # db_signature() saat load terakhir
+        self.refresh_interval = FACE_INDEX_REFRESH_INTERVAL
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_timer = None
+        self._save_pid = None
+        self._ann_dirty = False
+        atexit.register(self.save_ann_index)
+    
+    def __len__(self):
+        return len(self.face_ids)
+    
+    def db_signature(self):
+        """
+        Signature murah isi primary face_data: (count, max id, max created_at)
+        Fungsi: Insert, delete (termasuk bulk query.delete() yang tidak memicu ORM event)
+        dan enrollment di worker lain mengubah signature; update encoding in-place tidak
+        (app selalu insert row baru saat enroll)
+        """
+        count, max_id, max_created = db.session.query(
+            func.count(FaceData.id), func.max(FaceData.id), func.max(FaceData.created_at)
+        ).filter(FaceData.is_primary.is_(True)).one()
+        return count, max_id, max_created
+    
+    def refresh(self, force=False):
+        """
+        Load index jika belum, atau reload jika face_data berubah sejak load terakhir
+        (dicek maksimal sekali per refresh_interval detik)
+        Returns: True jika index di-(re)load
+        """
+        now = time.monotonic()
+        if self.loaded and not force and now - self._last_check < self.refresh_interval:
+            return False
+        with self._refresh_lock:
+            if self.loaded and not force and now - self._last_check < self.refresh_interval:
+                return False  # Thread lain baru saja cek
+            signature = self.db_signature()
+            self._last_check = time.monotonic()
+            if self.loaded and signature == self.signature:
+                return False
+            if self.loaded:
+                print("[DEBUG] Face encoding index stale, reloading")
+            self.load(signature)
+            return True
+    
+    def load(self, signature=None):
+        """
+        Load semua primary FaceData dari database
+        Fungsi: Query hanya kolom yang dibutuhkan (tanpa ORM object per row)
+        signature: db_signature() yang diambil sebelum query (default: diambil di sini)
+        """
+        if signature is None:
+            signature = self.db_signature()
+        rows = db.session.query(
+            FaceData.id, FaceData.user_id, FaceData.face_encoding_bin, FaceData.face_encoding
+        ).filter(FaceData.is_primary.is_(True)).all()
+        
+        row_size = ENCODING_DIM * ENCODING_DTYPE.itemsize
+        binary_rows = [row for row in rows if row[2] is not None and len(row[2]) == row_size]
+        legacy_rows = [row for row in rows if row[2] is None and row[3] is not None]
+        
+        # Binary rows: satu join + satu np.frombuffer untuk seluruh gallery
+        face_ids = [row[0] for row in binary_rows]
+        user_ids = [row[1] for row in binary_rows]
+        blocks = [np.frombuffer(b''.join(row[2] for row in binary_rows), dtype=ENCODING_DTYPE)
+                  .reshape(-1, ENCODING_DIM)]
+        
+        # Row lama yang belum dimigrasi masih JSON
+        for face_id, user_id, _, face_encoding in legacy_rows:
+            try:
+                vector = np.asarray(json.loads(face_encoding), dtype=np.float32)
+            except (TypeError, ValueError):
+                continue
+            if vector.shape != (ENCODING_DIM,):
+                continue
+            face_ids.append(face_id)
+            user_ids.append(user_id)
+            blocks.append(vector[np.newaxis, :])
+        
+        encodings = np.vstack(blocks)
+        with self._lock:
+            previous_ids = self.face_ids if self.loaded else None
+            self.face_ids = np.asarray(face_ids, dtype=np.int64)
+            self.user_ids = np.asarray(user_ids, dtype=np.int64)
+            self.encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+            self.squared_norms = np.einsum('ij,ij->i', self.encodings, self.encodings)
+            self.signature = signature
+            self.loaded = True
+        print(f"[OK] Face encoding index loaded: {len(face_ids)} encodings")
+        
+        if self.backend != 'ivf':
+            return
+        if self.ann_index is None or previous_ids is None:
+            self.load_ann_index()
+        else:
+            self.sync_ann_index(previous_ids)
+    
+    def sync_ann_index(self, previous_ids):
+        """Reload: apply selisih face_id ke IVF index (tanpa re-train k-means)"""
+        added, removed = self.apply_ann_changes(self.ann_index, previous_ids)
+        if added or removed:
+            print(f"[OK] Face ANN index synced: +{added} -{removed}")
+        if self.ann_index_needs_retrain(self.ann_index):
+            self.schedule_ann_save()  # Re-train di timer background
+    
+    def apply_ann_changes(self, ann_index, previous_ids):
+        """
+        Apply selisih face_id index exact terhadap previous_ids ke ann_index
+        Returns: (jumlah added, jumlah removed)
+        """
+        face_ids, user_ids, encodings = self.face_ids, self.user_ids, self.encodings
+        removed = np.setdiff1d(previous_ids, face_ids)
+        for face_id in removed.tolist():
+            ann_index.remove(face_id)
+        added = np.flatnonzero(~np.isin(face_ids, previous_ids))
+        for position in added.tolist():
+            ann_index.add(int(face_ids[position]), int(user_ids[position]), encodings[position])
+        return len(added), len(removed)
+    
+    def ann_index_needs_retrain(self, ann_index):
+        """
+        True jika IVF index sudah tumbuh jauh sejak k-means terakhir
+        Fungsi: Index yang mulai kosong (add() pertama = satu centroid) atau di-train
+        dengan N kecil tetap punya ~sqrt(N awal) list, sehingga query men-scan hampir
+        seluruh gallery setelah banyak enrollment
+        """
+        count, n_lists = len(ann_index), len(ann_index.centroids)
+        return count > 1 and count > FACE_ANN_RETRAIN_GROWTH * n_lists * n_lists
+    
+    def retrain_ann_index(self):
+        """
+        Re-train IVF index dari index exact lalu swap
+        Fungsi: k-means jalan tanpa lock; perubahan yang masuk selama training
+        di-apply ke index baru sebelum swap
+        """
+        from face_ann_index import IVFFlatIndex
+        
+        with self._lock:
+            face_ids, user_ids, encodings = self.face_ids, self.user_ids, self.encodings
+        ann_index = IVFFlatIndex(dim=ENCODING_DIM, n_probe=FACE_ANN_NPROBE)
+        ann_index.train(face_ids, user_ids, encodings)
+        with self._lock:
+            self.apply_ann_changes(ann_index, face_ids)
+            self.ann_index = ann_index
+        with self._save_lock:
+            self._ann_dirty = True
+        print(f"[OK] Face ANN index retrained: {len(ann_index)} encodings, {len(ann_index.lists)} lists")
+    
+    def load_ann_index(self):
+        """
+        Load IVF index dari disk, rebuild jika file rusak atau tidak sinkron dengan database
+        Fungsi: Worker restart tidak perlu re-train k-means selama file index masih valid
+        (face_ann_index baru di-import di sini: backend 'exact' tidak pernah memuatnya)
+        """
+        from face_ann_index import IVFFlatIndex
+        
+        try:
+            try:
+                ann_index = IVFFlatIndex.load(FACE_ANN_INDEX_PATH, n_probe=FACE_ANN_NPROBE)
+            except Exception as e:
+                print(f"[WARNING] Face ANN index file invalid, rebuilding: {e}")
+                ann_index = None
+            if ann_index is not None and not self.ann_index_matches(ann_index):
+                print("[WARNING] Face ANN index out of sync with database, rebuilding")
+                ann_index = None
+            if ann_index is not None and self.ann_index_needs_retrain(ann_index):
+                print("[WARNING] Face ANN index trained on a much smaller gallery, rebuilding")
+                ann_index = None
+            if ann_index is None:
+                ann_index = IVFFlatIndex(dim=ENCODING_DIM, n_probe=FACE_ANN_NPROBE)
+                ann_index.train(self.face_ids, self.user_ids, self.encodings)
+                ann_index.save(FACE_ANN_INDEX_PATH)
+                print(f"[OK] Face ANN index rebuilt: {len(ann_index.lists)} lists")
+            self.ann_index = ann_index
+        except Exception as e:
+            print(f"[WARNING] Face ANN index unavailable, using exact search: {e}")
+            self.ann_index = None
+    
+    def ann_index_matches(self, ann_index):
+        """True jika face_id, user_id dan vector di IVF index sama persis dengan index exact (database)"""
+        _, face_ids, user_ids, vectors, _ = ann_index.entries()
+        if len(face_ids) != len(self.face_ids):
+            return False
+        theirs, ours = np.argsort(face_ids, kind='stable'), np.argsort(self.face_ids, kind='stable')
+        return (np.array_equal(face_ids[theirs], self.face_ids[ours])
+                and np.array_equal(user_ids[theirs], self.user_ids[ours])
+                and np.array_equal(vectors[theirs], self.encodings[ours]))
+    
+    def schedule_ann_save(self):
+        """
+        Tandai IVF index berubah; re-train (jika perlu) dan persist di background thread
+        maksimal sekali per FACE_ANN_SAVE_INTERVAL (bukan rewrite .npz di setiap commit)
+        """
+        if self.ann_index is None:
+            return
+        with self._save_lock:
+            self._ann_dirty = True
+            if self._save_timer is not None and self._save_pid == os.getpid():
+                return  # Timer sudah pending
+            self._save_pid = os.getpid()
+            self._save_timer = threading.Timer(FACE_ANN_SAVE_INTERVAL, self.maintain_ann_index)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+    
+    def maintain_ann_index(self):
+        """Timer background: re-train IVF index jika sudah tumbuh jauh, lalu persist"""
+        ann_index = self.ann_index
+        if ann_index is not None and self.ann_index_needs_retrain(ann_index):
+            try:
+                self.retrain_ann_index()
+            except Exception as e:
+                print(f"[WARNING] Failed to retrain face ANN index: {e}")
+        self.save_ann_index()
+    
+    def save_ann_index(self):
+        """Persist IVF index jika ada perubahan yang belum disimpan (timer background / atexit)"""
+        with self._save_lock:
+            self._save_timer = None  # Perubahan berikutnya menjadwalkan save baru
+            if self.ann_index is None or not self._ann_dirty:
+                return
+            self._ann_dirty = False
+        try:
+            self.ann_index.save(FACE_ANN_INDEX_PATH)
+        except Exception as e:
+            print(f"[WARNING] Failed to save face ANN index: {e}")
+            with self._save_lock:
+                self._ann_dirty = True
+    
+    def upsert(self, face_id, user_id, encoding):
+        """Tambah atau replace satu encoding (incremental, tanpa reload)"""
+        vector = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_DIM)
+        with self._lock:
+            positions = np.flatnonzero(self.face_ids == face_id)
+            if len(positions) > 0:
+                encodings = self.encodings.copy()
+                encodings[positions[0]] = vector
+                user_ids = self.user_ids.copy()
+                user_ids[positions[0]] = user_id
+                face_ids = self.face_ids
+            else:
+                face_ids = np.append(self.face_ids, face_id)
+                user_ids = np.append(self.user_ids, user_id)
+                encodings = np.vstack([self.encodings, vector[np.newaxis, :]])
+            self.face_ids, self.user_ids, self.encodings = face_ids, user_ids, encodings
+            self.squared_norms = np.einsum('ij,ij->i', encodings, encodings)
+        if self.ann_index is not None:
+            self.ann_index.add(face_id, user_id, vector)
+    
+    def remove(self, face_id):
+        """Hapus satu encoding dari index"""
+        with self._lock:
+            keep = self.face_ids != face_id
+            if keep.all():
+                return
+            self.face_ids = self.face_ids[keep]
+            self.user_ids = self.user_ids[keep]
+            self.encodings = self.encodings[keep]
+            self.squared_norms = self.squared_norms[keep]
+        if self.ann_index is not None:
+            self.ann_index.remove(face_id)
+    
+    def search(self, face_encoding, k=1):
+        """
+        Cari k encoding terdekat
+        
+        Args:
+            face_encoding: query encoding (128-d)
+            k: jumlah kandidat teratas
+            
+        Returns:
+            list: [(face_id, user_id, distance), ...] urut dari distance terkecil
+        """
+        self.refresh()
+        
+        # Gallery besar: approximate search, exact search tetap sebagai fallback
+        if self.ann_index is not None and len(self) >= FACE_ANN_MIN_SIZE:
+            results = self.ann_index.search(face_encoding, k=k)
+            if results:
+                return results
+        
+        with self._lock:
+            face_ids, user_ids = self.face_ids, self.user_ids
+            encodings, squared_norms = self.encodings, self.squared_norms
+        
+        if len(face_ids) == 0:
+            return []
+        
+        query = np.asarray(face_encoding, dtype=np.float32).reshape(ENCODING_DIM)
+        # ||e - q||^2 = ||e||^2 - 2 e.q + ||q||^2  -> satu matrix-vector product
+        squared = squared_norms - 2.0 * (encodings @ query) + float(query @ query)
+        distances = np.sqrt(np.maximum(squared, 0.0))
+        
+        k = min(k, len(distances))
+        if k < len(distances):
+            top = np.argpartition(distances, k - 1)[:k]
+        else:
+            top = np.arange(len(distances))
+        top = top[np.argsort(distances[top])]
+        return [(int(face_ids[i]), int(user_ids[i]), float(distances[i])) for i in top]
+
+# Global encoding index per process (di-load lazily saat search pertama, reload jika stale)
+face_index = FaceEncodingIndex()
+
+# Perubahan FaceData dicatat per session dan diterapkan ke index setelah commit
+@event.listens_for(FaceData, 'after_insert')
+@event.listens_for(FaceData, 'after_update')
+def _queue_face_index_upsert(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        return
+    session.info.setdefault('face_index_changes', []).append(
+        ('upsert', target.id, target.user_id, bool(target.is_primary), target.get_encoding_array())
+    )
+
+@event.listens_for(FaceData, 'after_delete')
+def _queue_face_index_remove(mapper, connection, target):
+    session = object_session(target)
+    if session is None:
+        return
+    session.info.setdefault('face_index_changes', []).append(('remove', target.id, None, False, None))
+
+@event.listens_for(Session, 'after_commit')
+def _apply_face_index_changes(session):
+    changes = session.info.pop('face_index_changes', None)
+    if not changes or not face_index.loaded:
+        return
+    for action, face_id, user_id, is_primary, encoding in changes:
+        if action == 'upsert' and is_primary and encoding is not None:
+            face_index.upsert(face_id, user_id, encoding)
+        else:
+            face_index.remove(face_id)
+    face_index.schedule_ann_save()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_face_index_changes(session):
+    session.info.pop('face_index_changes', None)
+
+def get_user_by_face_encoding(face_encoding, confidence_threshold=0.6, top_k=1):
     """
     Find user berdasarkan face encoding
-    Fungsi: Compare face encoding dengan semua stored faces di database
+    Fungsi: Compare face encoding dengan semua stored faces lewat resident index
     
     Args:
         face_encoding: numpy array dari detected face
         confidence_threshold: minimum confidence untuk match
+        top_k: jumlah kandidat terdekat yang diambil dari index
         
     Returns:
         tuple: (User object, confidence_score) atau (None, None)
     """
-    import face_recognition
-    
-    # Get semua face data dari database
-    all_faces = FaceData.query.filter_by(is_primary=True).all()
-    
-    best_match = None
-    best_confidence = 0
-    
-    for face_data in all_faces:
-        stored_encoding = face_data.get_encoding_array()
-        if stored_encoding is None:
-            continue
-            
-        # Compare faces
-        try:
-            # Calculate face distance (lower = more similar)
-            face_distance = face_recognition.face_distance([stored_encoding], face_encoding)[0]
-            
-            # Convert distance ke confidence (higher = more confident)
-            confidence = 1 - face_distance
-            
-            # Check jika ini match terbaik
-            if confidence > confidence_threshold and confidence > best_confidence:
-                best_match = face_data.user
-                best_confidence = confidence
-                
-        except Exception as e:
-            print(f"Face comparison error: {e}")
-            continue
+    # Distance sama dengan face_recognition.face_distance (euclidean), lower = more similar
+    for face_id, user_id, face_distance in face_index.search(face_encoding, k=top_k):
+        # Convert distance ke confidence (higher = more confident)
+        confidence = 1 - face_distance
+        if confidence <= confidence_threshold:
+            break
+        
+        user = db.session.get(User, user_id)
+        if user is not None:
+            return user, confidence
     
-    return best_match, best_confidence if best_match else None
+    return None, None
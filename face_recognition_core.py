@@ -7,6 +7,54 @@ import io
 import base64
 import os
 from datetime import datetime
+from face_audit import face_audit_writer
+from face_engine import FaceEngine
+from face_metrics import NULL_TIMER
+
+# Distance dlib -> confidence persen (seperti LBPH_MAX_DISTANCE di opencv_face_system):
+# tolerance standar face_recognition 0.6 = 80%, threshold default recognize / verify
+DLIB_MAX_DISTANCE = float(os.environ.get('FACE_DLIB_MAX_DISTANCE', 3.0))
+DLIB_MAX_TEMPLATES = int(os.environ.get('FACE_MAX_TEMPLATES', 5))  # Encoding per user (terbaru)
+
+class FaceImageContext:
+    """
+    Hasil olahan satu image yang di-share antar langkah validate -> encode -> save
+    Fungsi: Decode sekali, detect sekali; RGB array, gray buffer, face locations dan
+    quality metrics di-cache di context (lihat FaceRecognitionSystem.create_context)
+    """
+    
+    def __init__(self, image, detection_model='hog', upsample=1):
+        """
+        image: PIL Image atau numpy RGB array
+        detection_model / upsample: parameter face_recognition.face_locations
+        """
+        self.image = image if hasattr(image, 'convert') else None
+        self.rgb = np.asarray(image.convert('RGB')) if self.image is not None else np.asarray(image)
+        self.detection_model = detection_model
+        self.upsample = upsample
+        self._gray = None
+        self._face_locations = None
+        self.quality = None  # Diisi oleh validate_face_quality
+    
+    @property
+    def gray(self):
+        if self._gray is None:
+            self._gray = cv2.cvtColor(self.rgb, cv2.COLOR_RGB2GRAY)
+        return self._gray
+    
+    @property
+    def face_locations(self):
+        """Face locations [(top, right, bottom, left), ...], satu HOG / CNN pass per image"""
+        if self._face_locations is None:
+            self._face_locations = face_recognition.face_locations(
+                self.rgb, number_of_times_to_upsample=self.upsample, model=self.detection_model)
+        return self._face_locations
+    
+    def to_pil(self):
+        """PIL Image untuk disimpan (original jika ada, selain itu dari RGB array)"""
+        if self.image is None:
+            self.image = Image.fromarray(self.rgb)
+        return self.image
 
 class FaceRecognitionSystem:
     """
@@ -14,25 +62,50 @@ class FaceRecognitionSystem:
     Fungsi: Handle semua operasi computer vision untuk face detection dan recognition
     """
     
-    def __init__(self, confidence_threshold=0.6):
+    def __init__(self, confidence_threshold=0.6, detection_model='hog', upsample=1):
         """
         Initialize face recognition system
         
         Args:
             confidence_threshold (float): Minimum confidence untuk accept recognition
+            detection_model (str): 'hog' atau 'cnn' untuk face_recognition.face_locations
+            upsample (int): number_of_times_to_upsample saat detection
             
         Fungsi: Setup parameters untuk face recognition
         """
         self.confidence_threshold = confidence_threshold
+        self.detection_model = detection_model
+        self.upsample = upsample
         self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
         # face_cascade = pre-trained model untuk detect faces di image
+    
+    def create_context(self, image_data):
+        """
+        Buat FaceImageContext untuk image_data
+        
+        Args:
+            image_data: Base64 string, PIL Image, numpy RGB array, atau FaceImageContext
+            
+        Returns:
+            FaceImageContext, atau None jika image tidak bisa di-decode
+            
+        Fungsi: Decode image sekali; method lain menerima context ini supaya
+        decode dan face detection tidak diulang di setiap langkah
+        """
+        if isinstance(image_data, FaceImageContext):
+            return image_data
+        if isinstance(image_data, str):
+            image_data = self.base64_to_image(image_data)
+        if image_data is None:
+            return None
+        return FaceImageContext(image_data, self.detection_model, self.upsample)
         
     def detect_faces_in_image(self, image_data):
         """
         Detect faces dalam image
         
         Args:
-            image_data: Image dalam format numpy array atau PIL Image
+            image_data: Image dalam format numpy array, PIL Image, base64 atau FaceImageContext
             
         Returns:
             list: List of face locations [(top, right, bottom, left), ...]
@@ -40,19 +113,12 @@ class FaceRecognitionSystem:
         Fungsi: Find all faces di dalam image dan return coordinates
         """
         try:
-            # Convert image ke format yang benar
-            if isinstance(image_data, str):
-                # Base64 string
-                image_data = self.base64_to_image(image_data)
-            
-            # Convert PIL Image ke numpy array jika perlu
-            if hasattr(image_data, 'convert'):
-                image_array = np.array(image_data.convert('RGB'))
-            else:
-                image_array = image_data
+            context = self.create_context(image_data)
+            if context is None:
+                return []
             
-            # Detect faces menggunakan face_recognition library
-            face_locations = face_recognition.face_locations(image_array, model='hog')
+            # Detect faces menggunakan face_recognition library (di-cache di context)
+            face_locations = context.face_locations
             # model='hog' = Histogram of Oriented Gradients (faster, good accuracy)
             # model='cnn' = Convolutional Neural Network (slower, better accuracy)
             
@@ -68,7 +134,7 @@ class FaceRecognitionSystem:
         Extract face encoding dari image
         
         Args:
-            image_data: Image data
+            image_data: Image data atau FaceImageContext
             face_location: Specific face location, atau None untuk auto-detect
             
         Returns:
@@ -78,22 +144,14 @@ class FaceRecognitionSystem:
         Yang bisa dibandingkan dengan face encodings lain
         """
         try:
-            # Convert image
-            if isinstance(image_data, str):
-                image_data = self.base64_to_image(image_data)
-                
-            if hasattr(image_data, 'convert'):
-                image_array = np.array(image_data.convert('RGB'))
-            else:
-                image_array = image_data
+            context = self.create_context(image_data)
+            if context is None:
+                return None
             
-            # Extract face encodings
-            if face_location:
-                # Use specific face location
-                encodings = face_recognition.face_encodings(image_array, [face_location])
-            else:
-                # Auto-detect face dan extract encoding
-                encodings = face_recognition.face_encodings(image_array)
+            # Extract face encodings; tanpa face_location pakai locations dari context
+            # (detection yang sudah jalan di validate / detect tidak diulang)
+            face_locations = [face_location] if face_location else context.face_locations[:1]
+            encodings = face_recognition.face_encodings(context.rgb, face_locations) if face_locations else []
             
             if len(encodings) > 0:
                 # Return first face encoding
@@ -176,36 +234,31 @@ class FaceRecognitionSystem:
         Save face photo ke file system
         
         Args:
-            image_data: Image data
+            image_data: Image data atau FaceImageContext
             user_id: User ID
             photo_type: Type of photo ('enrollment', 'attendance', 'verification')
             
         Returns:
-            str: Filename jika berhasil, None jika gagal
+            str: Filename jika berhasil di-queue / disimpan, None jika gagal
             
-        Fungsi: Simpan photo ke disk untuk audit trail dan debugging
+        Fungsi: Simpan photo ke disk untuk audit trail dan debugging.
+        JPEG encode + write jalan di face_audit_writer (background thread),
+        request tidak menunggu disk I/O
         """
         try:
-            # Create photos directory jika belum ada
             photos_dir = 'static/face_photos'
-            if not os.path.exists(photos_dir):
-                os.makedirs(photos_dir)
             
             # Generate filename dengan timestamp
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             filename = f"user_{user_id}_{photo_type}_{timestamp}.jpg"
             filepath = os.path.join(photos_dir, filename)
             
-            # Save image
-            if isinstance(image_data, str):
-                image_data = self.base64_to_image(image_data)
-            
-            # Convert ke RGB jika perlu
-            if image_data.mode != 'RGB':
-                image_data = image_data.convert('RGB')
-                
-            image_data.save(filepath, 'JPEG', quality=85)
-            print(f"📸 Face photo saved: {filename}")
+            # Save image (context: image yang sudah di-decode, tanpa decode ulang)
+            context = self.create_context(image_data)
+            if face_audit_writer.submit_photo(context.to_pil(), filepath, quality=85):
+                print(f"📸 Face photo queued: {filename}")
+            else:
+                print(f"📸 Face photo saved: {filename}")
             return filename
             
         except Exception as e:
@@ -217,21 +270,26 @@ class FaceRecognitionSystem:
         Validate kualitas face image untuk enrollment
         
         Args:
-            image_data: Image data
+            image_data: Image data atau FaceImageContext
             
         Returns:
             dict: {'valid': bool, 'message': str, 'suggestions': list}
             
-        Fungsi: Check apakah face image cukup bagus untuk reliable recognition
+        Fungsi: Check apakah face image cukup bagus untuk reliable recognition.
+        Metrics disimpan di context.quality; locations dan gray buffer dipakai ulang
+        oleh extract_face_encoding / save_face_photo dengan context yang sama
         """
         try:
-            if isinstance(image_data, str):
-                image_data = self.base64_to_image(image_data)
-            
-            image_array = np.array(image_data.convert('RGB'))
+            context = self.create_context(image_data)
+            if context is None:
+                return {
+                    'valid': False,
+                    'message': 'Image tidak bisa dibaca',
+                    'suggestions': ['Coba ambil foto ulang', 'Pastikan format image correct']
+                }
             
             # Check 1: Detect faces
-            face_locations = face_recognition.face_locations(image_array)
+            face_locations = context.face_locations
             
             if len(face_locations) == 0:
                 return {
@@ -251,9 +309,10 @@ class FaceRecognitionSystem:
             top, right, bottom, left = face_locations[0]
             face_width = right - left
             face_height = bottom - top
-            image_width, image_height = image_data.size
+            image_height, image_width = context.rgb.shape[:2]
             
             face_percentage = (face_width * face_height) / (image_width * image_height)
+            context.quality = {'face_percentage': face_percentage}
             
             if face_percentage < 0.1:  # Face kurang dari 10% dari total image
                 return {
@@ -263,10 +322,11 @@ class FaceRecognitionSystem:
                 }
             
             # Check 3: Image quality (brightness, blur)
-            gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
+            gray = context.gray
             
             # Check brightness
             brightness = np.mean(gray)
+            context.quality['brightness'] = float(brightness)
             if brightness < 50:
                 return {
                     'valid': False,
@@ -283,6 +343,7 @@ class FaceRecognitionSystem:
             
             # Check blur (Laplacian variance)
             laplacian_var = cv2.Laplacian(gray, cv2.CV_64F).var()
+            context.quality['laplacian_var'] = float(laplacian_var)
             if laplacian_var < 100:
                 return {
                     'valid': False,
@@ -304,5 +365,287 @@ class FaceRecognitionSystem:
                 'suggestions': ['Coba ambil foto ulang', 'Pastikan format image correct']
             }
 
-# Global face recognition system instance
-face_system = FaceRecognitionSystem()
+class DlibFaceEngine(FaceEngine):
+    """
+    Face engine berbasis face_recognition (dlib): HOG / CNN detection + 128-d encoding
+    Fungsi: Implementasi face_engine.FaceEngine di atas tabel users / face_data dan
+    resident encoding index (face_models.face_index). Butuh Flask app context
+    """
+    
+    engine_name = 'dlib'
+    
+    def __init__(self, detection_model='hog', upsample=1, max_side=1024, encoding_model='large', num_jitters=1):
+        """
+        detection_model: 'hog' (CPU) atau 'cnn'; upsample: number_of_times_to_upsample
+        max_side: sisi terpanjang image sebelum detection (image lebih besar di-downscale)
+        encoding_model: 'large' (68 landmarks) atau 'small' (5 landmarks, lebih cepat)
+        """
+        self.detection_model = detection_model
+        self.upsample = upsample
+        self.max_side = max_side
+        self.encoding_model = encoding_model
+        self.num_jitters = num_jitters
+        self.max_templates = max(1, DLIB_MAX_TEMPLATES)
+        self.core = FaceRecognitionSystem(detection_model=detection_model, upsample=upsample)
+    
+    def load_image(self, image_data):
+        """Decode base64 string / raw bytes -> RGB array (downscale ke max_side). Returns: array atau None"""
+        try:
+            if isinstance(image_data, str):
+                if ',' in image_data:
+                    image_data = image_data.split(',', 1)[1]
+                image_data = base64.b64decode(image_data)
+            image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+        except (ValueError, TypeError):
+            return None
+        if image is None:
+            return None
+        
+        height, width = image.shape[:2]
+        scale = self.max_side / max(height, width)
+        if scale < 1:
+            image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    
+    def create_context(self, image_data, timer=None):
+        """Decode (downscale ke max_side) -> FaceImageContext. Returns: context atau None"""
+        with (timer or NULL_TIMER).stage('decode'):
+            image = self.load_image(image_data)
+        return self.core.create_context(image) if image is not None else None
+    
+    def encode_face(self, image_data, timer=None, single_face=False):
+        """
+        Decode -> detect -> encoding wajah terbesar
+        image_data: base64 / bytes, atau FaceImageContext (decode dan detection tidak diulang)
+        Returns: (encoding, None) atau (None, result gagal)
+        """
+        timer = timer or NULL_TIMER
+        if isinstance(image_data, FaceImageContext):
+            context = image_data
+        else:
+            context = self.create_context(image_data, timer)
+        if context is None:
+            return None, {'success': False, 'message': 'Invalid image data'}
+        
+        with timer.stage('detect'):
+            locations = context.face_locations
+        if len(locations) == 0:
+            return None, {'success': False, 'message': 'No face detected in image'}
+        if single_face and len(locations) > 1:
+            return None, {'success': False, 'message': 'Multiple faces detected. Please ensure only one face is visible.'}
+        
+        # (top, right, bottom, left)
+        location = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+        with timer.stage('encode'):
+            encodings = face_recognition.face_encodings(context.rgb, [location], num_jitters=self.num_jitters,
+                                                        model=self.encoding_model)
+        if len(encodings) == 0:
+            return None, {'success': False, 'message': 'Could not extract face encoding'}
+        return encodings[0], None
+    
+    def distance_to_confidence(self, distance):
+        return max(0.0, 1 - float(distance) / DLIB_MAX_DISTANCE) * 100
+    
+    def user_payload(self, user):
+        face_data = [face for face in user.face_data if face.is_primary]
+        enrolled_at = max(face.created_at for face in face_data) if face_data else user.created_at
+        return {
+            'username': user.username,
+            'user_info': {'full_name': user.full_name, 'role': user.role},
+            'enrolled_at': enrolled_at.isoformat() if enrolled_at else None
+        }
+    
+    def enroll_face(self, username, image_data, user_info=None, timer=None):
+        """
+        Enroll face: encoding baru + (max_templates - 1) encoding terbaru yang sudah ada
+        Satu FaceImageContext untuk validate -> encode -> save photo (decode dan face
+        detection masing-masing sekali)
+        """
+        from face_models import FaceData, User, db
+        try:
+            timer = timer or NULL_TIMER
+            context = self.create_context(image_data, timer)
+            if context is None:
+                return {'success': False, 'message': 'Invalid image data'}
+            
+            with timer.stage('quality'):
+                quality = self.core.validate_face_quality(context)
+            if not quality['valid']:
+                return {
+                    'success': False,
+                    'message': quality['message'],
+                    'suggestions': quality['suggestions'],
+                    'quality': context.quality
+                }
+            
+            encoding, failed = self.encode_face(context, timer, single_face=True)
+            if failed:
+                return failed
+            
+            user_info = user_info or {}
+            user = User.query.filter_by(username=username).first()
+            if user is None:
+                user = User(username=username, full_name=user_info.get('full_name', username),
+                            email=f'{username}@fisheries.local', role=user_info.get('role', 'unknown'))
+                db.session.add(user)
+            
+            # Hapus lewat session (bukan bulk delete) supaya face_index ikut di-update setelah commit
+            existing = sorted(user.face_data, key=lambda face: face.id)
+            pruned = existing[:max(0, len(existing) - (self.max_templates - 1))]
+            for face in pruned:
+                db.session.delete(face)
+            
+            if user.id is None:
+                db.session.flush()  # user.id untuk nama file foto
+            photo_filename = self.core.save_face_photo(context, user.id, 'enrollment')
+            
+            face = FaceData(user=user, is_primary=True, photo_filename=photo_filename)
+            face.set_encoding_array(encoding)
+            db.session.add(face)
+            db.session.commit()
+            
+            return {
+                'success': True,
+                'message': f'Face enrolled successfully for {username}',
+                'template_count': len(existing) - len(pruned) + 1,
+                'pruned_templates': len(pruned)
+            }
+            
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Face enrollment: {e}")
+            return {
+                'success': False,
+                'message': f'Enrollment error: {str(e)}'
+            }
+    
+    def recognize_face(self, image_data, confidence_threshold=80, timer=None):
+        """1:N identification lewat resident encoding index"""
+        from face_models import User, db, face_index
+        try:
+            face_index.refresh()  # Enrollment / delete di worker lain
+            if len(face_index) == 0:
+                return {
+                    'success': False,
+                    'message': 'No faces enrolled. Please enroll faces first.'
+                }
+            
+            encoding, failed = self.encode_face(image_data, timer)
+            if failed:
+                return failed
+            
+            with (timer or NULL_TIMER).stage('match'):
+                matches = face_index.search(encoding, k=1)
+            user = db.session.get(User, matches[0][1]) if matches else None
+            confidence = self.distance_to_confidence(matches[0][2]) if matches else 0.0
+            print(f"[DEBUG] Best match {user.username if user else None}: {confidence:.1f}% (dlib)")
+            
+            if user is not None and confidence >= confidence_threshold:
+                return {
+                    'success': True,
+                    'message': 'Face recognized successfully',
+                    'user': self.user_payload(user),
+                    'confidence': confidence,
+                    'match_percentage': confidence
+                }
+            return {
+                'success': False,
+                'message': 'Face not recognized or confidence too low',
+                'confidence': confidence,
+                'match_percentage': confidence
+            }
+            
+        except Exception as e:
+            print(f"[ERROR] Face recognition: {e}")
+            return {
+                'success': False,
+                'message': f'Recognition error: {str(e)}'
+            }
+    
+    def verify_face(self, username, image_data, confidence_threshold=80, timer=None):
+        """1:1 verification: jarak terdekat ke encoding username saja"""
+        from face_models import User
+        try:
+            user = User.query.filter_by(username=username).first()
+            known = [face.get_encoding_array() for face in user.face_data if face.is_primary] if user else []
+            known = [encoding for encoding in known if encoding is not None]
+            if not known:
+                return {
+                    'success': False,
+                    'message': 'Face not verified for this user',
+                    'confidence': 0.0,
+                    'match_percentage': 0.0
+                }
+            
+            encoding, failed = self.encode_face(image_data, timer)
+            if failed:
+                return failed
+            
+            with (timer or NULL_TIMER).stage('match'):
+                distance = float(face_recognition.face_distance(np.vstack(known), encoding).min())
+            confidence = self.distance_to_confidence(distance)
+            print(f"[DEBUG] Verify {username}: {confidence:.1f}% (dlib)")
+            
+            if confidence >= confidence_threshold:
+                return {
+                    'success': True,
+                    'message': 'Face verified successfully',
+                    'user': self.user_payload(user),
+                    'confidence': confidence,
+                    'match_percentage': confidence
+                }
+            return {
+                'success': False,
+                'message': 'Face not verified for this user',
+                'confidence': confidence,
+                'match_percentage': confidence
+            }
+            
+        except Exception as e:
+            print(f"[ERROR] Face verification: {e}")
+            return {
+                'success': False,
+                'message': f'Verification error: {str(e)}'
+            }
+    
+    def get_enrolled_users(self):
+        from face_models import FaceData, User, db
+        rows = db.session.query(User.username).join(FaceData).filter(FaceData.is_primary.is_(True)).distinct()
+        return [username for username, in rows]
+    
+    def delete_user(self, username):
+        """Hapus semua face encoding user (row users tetap, dipakai attendance / log)"""
+        from face_models import User, db
+        try:
+            user = User.query.filter_by(username=username).first()
+            if user is None or not user.face_data:
+                return {
+                    'success': False,
+                    'message': f'User {username} not found'
+                }
+            for face in list(user.face_data):
+                db.session.delete(face)
+            db.session.commit()
+            return {
+                'success': True,
+                'message': f'User {username} deleted successfully'
+            }
+        
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] Delete user: {e}")
+            return {
+                'success': False,
+                'message': f'Delete error: {str(e)}'
+            }
+    
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update({
+            'detection_model': self.detection_model,
+            'upsample': self.upsample,
+            'max_side': self.max_side,
+            'encoding_model': self.encoding_model,
+            'max_templates': self.max_templates,
+        })
+        return stats
@@ -0,0 +1,253 @@
+# Registry user yang enroll di OpenCVFaceSystem
+#
+# JsonFaceRegistry     = format lama faces_data/users.json (benchmark / tanpa database)
+# DatabaseFaceRegistry = tabel face_registry (face_models.FaceRegistryEntry), dipakai app
+#
+# Semua registry mengembalikan dict {username: user_data} dengan format users.json lama,
+# ditambah 'face_files' (semua template user, terbaru di akhir; 'face_file' = terbaru).
+#
+# One-shot import users.json + foto ke database jalan otomatis sekali (marker di tabel
+# face_registry_import). Import manual:
+#   python face_registry.py --import faces_data/users.json
+import argparse
+import json
+import os
+from datetime import datetime
+
+def template_files(user_data):
+    """Face file semua template user (entry lama hanya punya 'face_file')"""
+    return list(user_data.get('face_files') or [user_data['face_file']])
+
+class JsonFaceRegistry:
+    """
+    Registry di satu file JSON (rewrite seluruh file setiap perubahan)
+    Fungsi: Backend sederhana tanpa database
+    """
+
+    shared = False  # File lokal per host / replica
+
+    def __init__(self, users_file):
+        self.users_file = users_file
+
+    def load_all(self):
+        if os.path.exists(self.users_file):
+            with open(self.users_file, 'r') as f:
+                return json.load(f)
+        return {}
+
+    def load(self, usernames):
+        """Returns: {username: user_data} untuk usernames yang ada di registry"""
+        users_data = self.load_all()
+        return {username: users_data[username] for username in usernames if username in users_data}
+
+    def usernames(self):
+        return list(self.load_all().keys())
+
+    def _save(self, users_data):
+        tmp_file = self.users_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(users_data, f, indent=2)
+        os.replace(tmp_file, self.users_file)
+
+    def upsert(self, username, user_data, face_images=None):
+        """Returns: user_data yang tersimpan (dengan user_id unik)"""
+        users_data = self.load_all()
+        existing = users_data.get(username)
+        if existing is not None:
+            user_id = existing['user_id']
+        else:
+            user_id = max((entry.get('user_id', 0) for entry in users_data.values()), default=0) + 1
+        users_data[username] = dict(user_data, user_id=user_id)
+        self._save(users_data)
+        return users_data[username]
+
+    def delete(self, username):
+        users_data = self.load_all()
+        if users_data.pop(username, None) is None:
+            return False
+        self._save(users_data)
+        return True
+
+    def get_face_image(self, username, face_file):
+        return None  # Foto hanya ada di faces_dir
+
+class DatabaseFaceRegistry:
+    """
+    Registry di tabel face_registry
+    Fungsi: Insert/delete per row, id unik dari database, lookup username via index.
+    Butuh Flask app context (request atau app.app_context())
+    """
+
+    shared = True  # Satu database untuk semua replica
+
+    def load_all(self):
+        from face_models import FaceRegistryEntry, FaceRegistryTemplate
+        face_files = {}
+        templates = FaceRegistryTemplate.query.with_entities(
+            FaceRegistryTemplate.username, FaceRegistryTemplate.face_file).order_by(FaceRegistryTemplate.id)
+        for username, face_file in templates:
+            face_files.setdefault(username, []).append(face_file)
+        return {entry.username: entry.to_users_data(face_files.get(entry.username))
+                for entry in FaceRegistryEntry.query.all()}
+
+    def load(self, usernames):
+        """
+        Load user_data usernames saja (lookup via index username, bukan full table scan)
+        Returns: {username: user_data} untuk usernames yang ada di registry
+        """
+        from face_models import FaceRegistryEntry, FaceRegistryTemplate
+        usernames = list(usernames)
+        if not usernames:
+            return {}
+        face_files = {}
+        templates = FaceRegistryTemplate.query.with_entities(
+            FaceRegistryTemplate.username, FaceRegistryTemplate.face_file).filter(
+            FaceRegistryTemplate.username.in_(usernames)).order_by(FaceRegistryTemplate.id)
+        for username, face_file in templates:
+            face_files.setdefault(username, []).append(face_file)
+        return {entry.username: entry.to_users_data(face_files.get(entry.username))
+                for entry in FaceRegistryEntry.query.filter(FaceRegistryEntry.username.in_(usernames))}
+
+    def usernames(self):
+        from face_models import FaceRegistryEntry
+        return [username for (username,) in FaceRegistryEntry.query.with_entities(FaceRegistryEntry.username)]
+
+    def count(self):
+        from face_models import FaceRegistryEntry
+        return FaceRegistryEntry.query.count()
+
+    def upsert(self, username, user_data, face_images=None):
+        """
+        Insert atau update row username + template rows (user_data['face_files'])
+        face_images: {face_file: JPEG bytes} untuk template baru
+        Returns: user_data yang tersimpan (user_id = primary key)
+        """
+        from sqlalchemy.exc import IntegrityError
+        from face_models import FaceRegistryEntry, FaceRegistryTemplate
+        from kapal_models import db
+
+        face_files = template_files(user_data)
+        face_images = face_images or {}
+        for attempt in range(2):
+            entry = FaceRegistryEntry.query.filter_by(username=username).first()
+            legacy_file, legacy_image = None, None
+            if entry is None:
+                entry = FaceRegistryEntry(username=username)
+                db.session.add(entry)
+            else:
+                legacy_file, legacy_image = entry.face_file, entry.face_image
+            entry.face_file = user_data['face_file']
+            entry.user_info = json.dumps(user_data.get('user_info') or {})
+            if user_data.get('enrolled_at'):
+                entry.enrolled_at = datetime.fromisoformat(user_data['enrolled_at'])
+
+            # Template rows: hapus yang sudah di-prune, insert yang baru (urutan face_files)
+            existing = set()
+            for template in FaceRegistryTemplate.query.filter_by(username=username):
+                if template.face_file in face_files:
+                    existing.add(template.face_file)
+                else:
+                    db.session.delete(template)
+            for face_file in face_files:
+                if face_file in existing:
+                    continue
+                face_image = face_images.get(face_file)
+                if face_image is None and face_file == legacy_file:
+                    face_image = legacy_image  # Entry lama: pindahkan foto ke template row
+                db.session.add(FaceRegistryTemplate(username=username, face_file=face_file, face_image=face_image))
+            entry.face_image = None
+            try:
+                db.session.commit()
+                return entry.to_users_data(face_files)
+            except IntegrityError:
+                # Worker lain insert username yang sama duluan -> ulangi sebagai update
+                db.session.rollback()
+                if attempt:
+                    raise
+
+    def delete(self, username):
+        from face_models import FaceRegistryEntry, FaceRegistryTemplate
+        from kapal_models import db
+
+        deleted = FaceRegistryEntry.query.filter_by(username=username).delete()
+        FaceRegistryTemplate.query.filter_by(username=username).delete()
+        db.session.commit()
+        return deleted > 0
+
+    def get_face_image(self, username, face_file):
+        from face_models import FaceRegistryEntry, FaceRegistryTemplate
+        row = FaceRegistryTemplate.query.with_entities(FaceRegistryTemplate.face_image).filter_by(
+            username=username, face_file=face_file).first()
+        if row is None:
+            # Entry lama (sebelum multi-template): foto di face_registry.face_image
+            row = FaceRegistryEntry.query.with_entities(FaceRegistryEntry.face_image).filter_by(
+                username=username, face_file=face_file).first()
+        return row[0] if row else None
+
+    def is_imported(self, source):
+        """True jika users.json source sudah pernah di-import (marker di face_registry_import)"""
+        from face_models import FaceRegistryImport
+        return FaceRegistryImport.query.filter_by(source=os.path.normpath(source)).count() > 0
+
+    def mark_imported(self, source, stats=None):
+        """
+        Catat marker import source (stats None = import sudah jalan sebelum marker ada)
+        Worker lain yang mencatat duluan tidak dianggap error
+        """
+        from sqlalchemy.exc import IntegrityError
+        from face_models import FaceRegistryImport
+        from kapal_models import db
+
+        db.session.add(FaceRegistryImport(source=os.path.normpath(source), **(stats or {})))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+
+def import_users_json(registry, users_file, faces_dir):
+    """
+    One-shot import users.json + face JPEG ke registry
+    Fungsi: Username yang sudah ada di registry dilewati; user_id lama
+    (yang bisa duplikat) diganti id baru dari registry
+    Returns: dict jumlah imported / skipped / missing_photo
+    """
+    stats = {'imported': 0, 'skipped': 0, 'missing_photo': 0}
+    if not os.path.exists(users_file):
+        return stats
+
+    with open(users_file, 'r') as f:
+        users_data = json.load(f)
+    existing = set(registry.usernames())
+
+    for username, user_data in users_data.items():
+        if username in existing:
+            stats['skipped'] += 1
+            continue
+        face_images = {}
+        for face_file in template_files(user_data):
+            face_path = os.path.join(faces_dir, face_file)
+            if os.path.exists(face_path):
+                with open(face_path, 'rb') as f:
+                    face_images[face_file] = f.read()
+            else:
+                stats['missing_photo'] += 1
+                print(f"[WARNING] Face photo missing for {username}: {face_path}")
+        registry.upsert(username, user_data, face_images)
+        stats['imported'] += 1
+
+    print(f"[OK] Face registry import from {users_file}: {stats}")
+    return stats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Face registry tools')
+    parser.add_argument('--import', dest='users_file', default=os.path.join('faces_data', 'users.json'),
+                        help='users.json yang di-import ke tabel face_registry')
+    parser.add_argument('--faces-dir', default=None, help='Folder foto (default: folder users.json)')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        registry = DatabaseFaceRegistry()
+        stats = import_users_json(registry, args.users_file, args.faces_dir or os.path.dirname(args.users_file))
+        if os.path.exists(args.users_file) and not registry.is_imported(args.users_file):
+            registry.mark_imported(args.users_file, stats)
@@ -0,0 +1,207 @@
+# Cross-replica face registry sync via Redis
+#
+# faces_data/ adalah disk lokal per replica (Railway), jadi enroll/delete di satu
+# replica harus dibawa ke replica lain. Setiap perubahan:
+#   face_registry:users     hash username -> {user_data, face_jpegs {face_file: base64}}
+#   face_registry:deleted   hash username -> waktu delete (tombstone untuk full resync)
+#   face_registry:version   counter, di-bump atomic bersama entry change log
+#   face_registry:changes   sorted set (score = version) berisi username yang berubah
+#
+# Worker cukup GET version (di-throttle) per request. Jika tertinggal, hanya username
+# di change log sejak version lokal yang di-reconcile dengan isi hash; full resync
+# hanya jika change log sudah terpotong melewati version lokal.
+import base64
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+from face_registry import template_files
+
+REGISTRY_PREFIX = os.environ.get('FACE_REGISTRY_PREFIX', 'face_registry')
+REGISTRY_SYNC_INTERVAL = float(os.environ.get('FACE_REGISTRY_SYNC_INTERVAL', 1.0))  # detik
+REGISTRY_LOG_MAX = int(os.environ.get('FACE_REGISTRY_LOG_MAX', 1000))
+
+def registry_sync_enabled():
+    """Default aktif jika Redis dikonfigurasi (REDIS_HOST); override dengan FACE_REGISTRY_SYNC=0/1"""
+    default = '1' if os.environ.get('REDIS_HOST') else '0'
+    return os.environ.get('FACE_REGISTRY_SYNC', default) == '1'
+
+class FaceRegistrySync:
+    """
+    Versioned face registry di Redis
+    Fungsi: Publish enroll/delete lokal dan apply perubahan dari replica lain
+    secara incremental ke OpenCVFaceSystem (users.json, LBPH model, gallery)
+    """
+
+    def __init__(self, face_system, redis_manager):
+        self.face_system = face_system
+        self.redis = redis_manager
+        self.origin = os.environ.get('RAILWAY_REPLICA_ID') or socket.gethostname()
+        self.version_key = f'{REGISTRY_PREFIX}:version'
+        self.log_key = f'{REGISTRY_PREFIX}:changes'
+        self.users_key = f'{REGISTRY_PREFIX}:users'
+        self.deleted_key = f'{REGISTRY_PREFIX}:deleted'
+        # Version yang sudah di-apply ke faces_dir (di-share oleh semua worker di host ini)
+        self.state_file = os.path.join(face_system.faces_dir, 'registry_state.json')
+        self.local_version = self.read_local_version()
+        self._last_check = 0.0
+        self._poll_lock = threading.Lock()
+
+    def read_local_version(self):
+        if not os.path.exists(self.state_file):
+            return 0
+        try:
+            with open(self.state_file, 'r') as f:
+                return int(json.load(f).get('version', 0))
+        except (OSError, ValueError) as e:
+            print(f"[WARNING] Registry state unreadable: {e}")
+            return 0
+
+    def write_local_version(self, version):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'version': version}, f)
+        os.replace(tmp_file, self.state_file)
+        self.local_version = version
+
+    def publish_enroll(self, username, user_data):
+        """
+        Publish enrollment lokal ke registry (semua template user)
+        Returns: version baru, atau None jika record / change log gagal ditulis
+        (change log tidak ditulis tanpa record-nya: replica lain akan membaca record lama)
+        """
+        face_jpegs = {}
+        try:
+            for face_file in template_files(user_data):
+                with open(os.path.join(self.face_system.faces_dir, face_file), 'rb') as f:
+                    face_jpegs[face_file] = base64.b64encode(f.read()).decode('ascii')
+        except OSError as e:
+            print(f"[ERROR] Registry publish {username}: {e}")
+            return None
+        if not self.redis.set_hash(self.users_key, username, {'user_data': user_data, 'face_jpegs': face_jpegs}):
+            print(f"[WARNING] Registry change not published: enroll {username}")
+            return None
+        self.redis.delete_hash_field(self.deleted_key, username)
+        return self._append_change('enroll', username)
+
+    def publish_delete(self, username):
+        """Publish delete lokal ke registry"""
+        self.redis.delete_hash_field(self.users_key, username)
+        self.redis.set_hash(self.deleted_key, username, datetime.now().isoformat())
+        return self._append_change('delete', username)
+
+    def _append_change(self, op, username):
+        version = self.redis.append_versioned_entry(
+            self.version_key, self.log_key,
+            {'op': op, 'username': username, 'origin': self.origin},
+            max_entries=REGISTRY_LOG_MAX
+        )
+        if version is None:
+            print(f"[WARNING] Registry change not published: {op} {username}")
+        return version
+
+    def poll(self, force=False):
+        """
+        Cek version registry (maksimal sekali per REGISTRY_SYNC_INTERVAL) dan apply
+        perubahan yang belum ada di faces_dir
+        Returns: jumlah username yang di-reconcile
+        """
+        now = time.monotonic()
+        if not force and now - self._last_check < REGISTRY_SYNC_INTERVAL:
+            return 0
+        if not self._poll_lock.acquire(blocking=False):
+            return 0  # Thread lain sedang sync
+        try:
+            self._last_check = now
+            remote_version = int(self.redis.get_data(self.version_key) or 0)
+            if remote_version <= self.local_version:
+                return 0
+            with self.face_system.gallery.write_lock():
+                # Worker lain di host ini mungkin sudah apply
+                self.local_version = self.read_local_version()
+                if remote_version <= self.local_version:
+                    return 0
+                self.face_system.refresh_local_state()
+                return self._sync(remote_version)
+        except Exception as e:
+            print(f"[ERROR] Registry sync: {e}")
+            return 0
+        finally:
+            self._poll_lock.release()
+
+    def _sync(self, remote_version):
+        entries = self.redis.get_entries_since(self.log_key, self.local_version)
+        if entries is None:
+            return 0
+
+        if not entries or entries[0][0] > self.local_version + 1:
+            # Change log sudah terpotong: reconcile semua username di registry + tombstone.
+            # User lokal yang tidak pernah di-publish (mis. enroll sebelum sync aktif) dibiarkan
+            # Redis error -> raise ke poll(): version tidak maju, dicoba lagi di poll berikutnya
+            registry = self.redis.get_hash(self.users_key, raise_errors=True)
+            deleted = self.redis.get_hash(self.deleted_key, raise_errors=True)
+            usernames = set(registry) | (set(deleted) & set(self.face_system.users_data))
+            for username in sorted(usernames):
+                self.reconcile(username, registry.get(username))
+            print(f"[OK] Registry full resync to version {remote_version}: {len(usernames)} users")
+            self.write_local_version(remote_version)
+            return len(usernames)
+
+        changed = []
+        version = self.local_version
+        for entry_version, entry in entries:
+            if entry_version != version + 1:
+                break  # Gap: entry berikutnya belum terlihat, lanjut di poll berikutnya
+            version = entry_version
+            if entry['username'] not in changed:
+                changed.append(entry['username'])
+        for username in changed:
+            # None hanya berarti field tidak ada (user dihapus); Redis error raise sebelum
+            # reconcile sehingga user tidak ikut terhapus dan version tidak maju
+            self.reconcile(username, self.redis.get_hash(self.users_key, username, raise_errors=True))
+        self.write_local_version(version)
+        print(f"[OK] Registry synced to version {version}: {len(changed)} changed users")
+        return len(changed)
+
+    def reconcile(self, username, record):
+        """
+        Samakan local state satu user dengan isi registry
+        record None = user sudah dihapus di registry
+        """
+        system = self.face_system
+        if record is None:
+            # Hanya local state replica ini: registry database di-share antar replica dan
+            # row-nya sudah dihapus oleh replica asal (atau oleh enrollment ulang sesudahnya)
+            system.purge_local_user(username)
+            return
+
+        local = system.users_data.get(username)
+        user_data = record['user_data']
+        face_files = template_files(user_data)
+        templates = system.gallery.templates(username)
+        if (local is not None and template_files(local) == face_files
+                and all(os.path.exists(os.path.join(system.faces_dir, f)) for f in face_files)
+                and templates is not None and len(templates) == len(face_files)):
+            return  # Sudah sama (mis. enrollment dari replica ini sendiri)
+
+        # Record lama (sebelum multi-template): satu 'face_jpeg'
+        face_jpegs = record.get('face_jpegs') or {user_data['face_file']: record['face_jpeg']}
+        faces = []
+        for face_file in face_files:
+            face_jpeg = base64.b64decode(face_jpegs[face_file])
+            face_roi = cv2.imdecode(np.frombuffer(face_jpeg, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+            if face_roi is None:
+                print(f"[WARNING] Registry face image invalid for {username}: {face_file}")
+                return
+            faces.append((face_file, face_roi, face_jpeg))
+        for face_file, _, face_jpeg in faces:
+            with open(os.path.join(system.faces_dir, face_file), 'wb') as f:
+                f.write(face_jpeg)
+        system.store_user(username, user_data, faces)
+        if local is not None:
+            system.remove_face_files([f for f in template_files(local) if f not in face_files])
@@ -0,0 +1,132 @@
+# Lazy accessor untuk face recognition engine
+#
+# Import modul ini murah (tanpa cv2): OpenCVFaceSystem baru dibuat saat request
+# pertama yang benar-benar butuh face engine, atau saat warm_up_face_system()
+# dipanggil secara eksplisit (mis. FACE_WARMUP=1 di worker gunicorn).
+# Registry default di database (butuh Flask app context); 'json' = users.json lama.
+# FACE_WORKER_SOCKET di-set: engine jalan di process face_worker.py, web worker
+# hanya memegang FaceWorkerClient (tanpa cv2).
+# Engine dipilih lewat FACE_ENGINE (profile di face_engine.py, default 'opencv').
+import os
+import threading
+import time
+from face_engine import create_face_engine, get_engine_profile
+from face_registry import DatabaseFaceRegistry, JsonFaceRegistry, import_users_json
+
+FACES_DIR = os.environ.get('FACES_DIR', 'faces_data')
+FACE_REGISTRY_BACKEND = os.environ.get('FACE_REGISTRY_BACKEND', 'database')
+FACE_WORKER_SOCKET = os.environ.get('FACE_WORKER_SOCKET')
+
+_face_system = None
+_face_system_lock = threading.Lock()
+_face_registry = None
+_face_worker_client = None
+
+def get_face_registry():
+    """
+    Get registry user yang enroll
+    Fungsi: Saat pertama dipakai, import users.json + foto lama sekali (one-shot).
+    Marker di face_registry_import mencegah import ulang setelah semua user dihapus;
+    tabel yang sudah terisi tanpa marker (deploy lama) hanya dicatat, tidak di-import
+    """
+    global _face_registry
+    if _face_registry is None:
+        users_file = os.path.join(FACES_DIR, 'users.json')
+        if FACE_REGISTRY_BACKEND == 'database':
+            registry = DatabaseFaceRegistry()
+            if os.path.exists(users_file) and not registry.is_imported(users_file):
+                stats = import_users_json(registry, users_file, FACES_DIR) if registry.count() == 0 else None
+                registry.mark_imported(users_file, stats)
+        else:
+            registry = JsonFaceRegistry(users_file)
+        _face_registry = registry
+    return _face_registry
+
+def get_face_system():
+    """
+    Get face engine untuk request handler
+    Returns: FaceWorkerClient jika FACE_WORKER_SOCKET di-set, selain itu engine lokal (FACE_ENGINE)
+    """
+    if FACE_WORKER_SOCKET:
+        return get_face_worker_client()
+    return get_local_face_system()
+
+def get_face_worker_client():
+    """Client ke face worker (satu per process, semaphore in-flight di-share antar thread)"""
+    global _face_worker_client
+    if _face_worker_client is None:
+        from face_worker import FaceWorkerClient
+        _face_worker_client = FaceWorkerClient(FACE_WORKER_SOCKET)
+    return _face_worker_client
+
+def get_local_face_system():
+    """
+    Get global face engine (profile FACE_ENGINE)
+    Fungsi: Construct engine sekali per process (thread-safe), saat pertama dipakai
+    """
+    global _face_system
+    if _face_system is None:
+        with _face_system_lock:
+            if _face_system is None:
+                start = time.perf_counter()
+                profile_name, profile = get_engine_profile()
+                if profile['engine'] == 'opencv':
+                    system = create_face_engine(profile_name, faces_dir=FACES_DIR, registry=get_face_registry())
+                    attach_registry_sync(system)
+                else:
+                    system = create_face_engine(profile_name)
+                _face_system = system
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                print(f"[OK] Face system initialized in {elapsed_ms:.0f} ms "
+                      f"(profile {profile_name}, pid {os.getpid()})")
+    return _face_system
+
+def attach_registry_sync(system):
+    """Aktifkan cross-replica registry sync (Redis) jika dikonfigurasi"""
+    from face_registry_sync import FaceRegistrySync, registry_sync_enabled
+    if system.gallery is None or not registry_sync_enabled():
+        return False
+    from redis_config import redis_manager
+    if redis_manager.redis_client is None:
+        print("[WARNING] Face registry sync disabled: Redis not connected")
+        return False
+    system.registry_sync = FaceRegistrySync(system, redis_manager)
+    system.registry_sync.poll(force=True)
+    print(f"[OK] Face registry sync enabled (version {system.registry_sync.local_version})")
+    return True
+
+def is_face_system_loaded():
+    """Apakah engine sudah di-construct di process ini"""
+    return _face_system is not None
+
+def warm_up_face_system():
+    """
+    Warm-up hook: construct engine sekarang, bukan saat request pertama
+    Returns: waktu init dalam ms (0 jika sudah loaded atau engine ada di face worker)
+    """
+    if FACE_WORKER_SOCKET or is_face_system_loaded():
+        return 0.0
+    start = time.perf_counter()
+    get_local_face_system()
+    return (time.perf_counter() - start) * 1000
+
+def get_face_engine_stats():
+    """
+    Stats engine untuk dashboard admin
+    Returns: dict, atau None jika engine lokal belum loaded (tidak memicu load)
+    """
+    if FACE_WORKER_SOCKET:
+        return get_face_worker_client().get_stats()
+    if is_face_system_loaded():
+        return _face_system.get_stats()
+    return None
+
+def get_enrolled_users():
+    """
+    Get list username yang sudah enroll
+    Fungsi: Jika engine belum loaded, query registry langsung supaya halaman
+    dashboard/status/login password tidak memicu load cv2 + cascade
+    """
+    if is_face_system_loaded():
+        return _face_system.get_enrolled_users()
+    return get_face_registry().usernames()
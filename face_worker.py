@@ -0,0 +1,329 @@
+# Standalone face recognition worker (Unix domain socket)
+#
+# Decode / detect / match jalan di process terpisah, sehingga worker gunicorn tidak
+# import cv2 dan tidak ter-block oleh request face. Web worker cukup pakai
+# FaceWorkerClient (lihat face_service.get_face_system() saat FACE_WORKER_SOCKET di-set).
+#
+# Protocol (satu request per koneksi, big-endian):
+#   request  = 'FRW1' | op u8 | reserved u8 | meta_len u32 | body_len u32 | meta | body
+#              meta = JSON compact (username, user_info, confidence_threshold, deadline)
+#              body = image* dengan image = kind u8 (0 bytes, 1 base64 text) | length u32 | data
+#   response = 'FRW1' | status u8 | length u32 | JSON result
+#
+# Start worker pool (pre-fork, gallery sudah di-load sebelum fork):
+#   python face_worker.py --socket /tmp/face_worker.sock --processes 2
+import argparse
+import json
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+
+from face_engine import FaceEngine
+
+PROTOCOL_MAGIC = b'FRW1'
+REQUEST_HEADER = struct.Struct('!4sBBII')
+IMAGE_HEADER = struct.Struct('!BI')
+RESPONSE_HEADER = struct.Struct('!4sBI')
+
+IMAGE_BYTES = 0
+IMAGE_BASE64 = 1
+
+OP_RECOGNIZE = 1
+OP_VERIFY = 2
+OP_RECOGNIZE_BATCH = 3
+OP_ENROLL = 4
+OP_DELETE = 5
+OP_USERS = 6
+OP_PING = 7
+OP_STATS = 8
+
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_EXPIRED = 2
+
+FACE_WORKER_TIMEOUT = float(os.environ.get('FACE_WORKER_TIMEOUT', 10.0))        # detik per request
+FACE_WORKER_MAX_PENDING = int(os.environ.get('FACE_WORKER_MAX_PENDING', 8))     # request in-flight per web process
+FACE_WORKER_BACKLOG = int(os.environ.get('FACE_WORKER_BACKLOG', 64))
+FACE_WORKER_MAX_BODY = int(os.environ.get('FACE_WORKER_MAX_BODY', 32 * 1024 * 1024))
+
+def recv_exact(sock, length):
+    """Baca tepat length bytes dari socket. Returns: bytes, atau None jika koneksi ditutup"""
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    received = 0
+    while received < length:
+        count = sock.recv_into(view[received:], length - received)
+        if count == 0:
+            return None
+        received += count
+    return bytes(buffer)
+
+def encode_images(images):
+    """List image (bytes-like atau base64 string) -> body protocol"""
+    parts = []
+    for image_data in images:
+        if isinstance(image_data, str):
+            kind, data = IMAGE_BASE64, image_data.encode('ascii')
+        else:
+            kind, data = IMAGE_BYTES, bytes(image_data)
+        parts.append(IMAGE_HEADER.pack(kind, len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+def decode_images(body):
+    """Body protocol -> list image (bytes / base64 string) untuk engine load_image"""
+    images = []
+    offset = 0
+    while offset < len(body):
+        kind, length = IMAGE_HEADER.unpack_from(body, offset)
+        offset += IMAGE_HEADER.size
+        data = body[offset:offset + length]
+        offset += length
+        images.append(data.decode('ascii') if kind == IMAGE_BASE64 else data)
+    return images
+
+def encode_message(meta):
+    return json.dumps(meta, separators=(',', ':')).encode('utf-8')
+
+class FaceWorkerClient(FaceEngine):
+    """
+    Thin client ke face worker
+    Fungsi: Proxy face_engine.FaceEngine (recognize/verify/enroll/delete/stats),
+    dengan timeout per request dan batas request in-flight per process
+    """
+
+    def __init__(self, socket_path, timeout=FACE_WORKER_TIMEOUT, max_pending=FACE_WORKER_MAX_PENDING):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._pending = threading.BoundedSemaphore(max_pending)
+
+    def _call(self, op, meta=None, images=(), timer=None):
+        """
+        Kirim satu request ke worker
+        Returns: result dict worker, atau {'success': False, ...} jika busy / timeout / worker down
+        """
+        if not self._pending.acquire(blocking=False):
+            return {
+                'success': False,
+                'message': 'Face service busy, please retry'
+            }
+        start = time.perf_counter()
+        try:
+            meta = dict(meta or {}, deadline=time.time() + self.timeout)
+            meta_bytes = encode_message(meta)
+            body = encode_images(images)
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                sock.sendall(REQUEST_HEADER.pack(PROTOCOL_MAGIC, op, 0, len(meta_bytes), len(body)) + meta_bytes + body)
+                header = recv_exact(sock, RESPONSE_HEADER.size)
+                if header is None:
+                    raise ConnectionError('connection closed by face worker')
+                magic, status, length = RESPONSE_HEADER.unpack(header)
+                payload = recv_exact(sock, length)
+                if magic != PROTOCOL_MAGIC or payload is None:
+                    raise ConnectionError('invalid response from face worker')
+            result = json.loads(payload)
+        except socket.timeout:
+            print(f"[ERROR] Face worker timeout after {self.timeout:.1f}s (op {op})")
+            return {
+                'success': False,
+                'message': 'Face service timeout, please retry'
+            }
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] Face worker {self.socket_path}: {e}")
+            return {
+                'success': False,
+                'message': 'Face service unavailable. Please use password login.'
+            }
+        finally:
+            self._pending.release()
+
+        # Timing stage dari worker + overhead IPC ke timer request di web worker
+        timings = result.pop('_timings', None) or {}
+        if timer is not None and hasattr(timer, 'stages'):
+            for name, ms in timings.items():
+                if name != 'total':
+                    timer.stages[name] = timer.stages.get(name, 0.0) + ms
+            ipc_ms = (time.perf_counter() - start) * 1000 - timings.get('total', 0.0)
+            timer.stages['ipc'] = timer.stages.get('ipc', 0.0) + max(0.0, ipc_ms)
+        if status != STATUS_OK:
+            print(f"[ERROR] Face worker status {status}: {result.get('message')}")
+        return result
+
+    def recognize_face(self, image_data, confidence_threshold=80, timer=None):
+        return self._call(OP_RECOGNIZE, {'confidence_threshold': confidence_threshold}, [image_data], timer)
+
+    def verify_face(self, username, image_data, confidence_threshold=80, timer=None):
+        meta = {'username': username, 'confidence_threshold': confidence_threshold}
+        return self._call(OP_VERIFY, meta, [image_data], timer)
+
+    def recognize_faces_batch(self, images, confidence_threshold=80, timer=None):
+        return self._call(OP_RECOGNIZE_BATCH, {'confidence_threshold': confidence_threshold}, images, timer)
+
+    def enroll_face(self, username, image_data, user_info=None, timer=None):
+        meta = {'username': username, 'user_info': user_info or {}}
+        return self._call(OP_ENROLL, meta, [image_data], timer)
+
+    def delete_user(self, username):
+        return self._call(OP_DELETE, {'username': username})
+
+    def get_enrolled_users(self):
+        result = self._call(OP_USERS)
+        return result.get('users', [])
+
+    def get_stats(self):
+        result = self._call(OP_STATS)
+        return result.get('stats', {'engine': None, 'message': result.get('message')})
+
+    def ping(self):
+        return self._call(OP_PING).get('success', False)
+
+def handle_request(system, op, meta, images, timer):
+    """Dispatch satu request ke face engine (face_engine.FaceEngine). Returns: result dict"""
+    threshold = meta.get('confidence_threshold', 80)
+    if op in (OP_RECOGNIZE, OP_VERIFY, OP_ENROLL) and len(images) != 1:
+        return {'success': False, 'message': 'Exactly one image required'}
+
+    if op == OP_RECOGNIZE:
+        return system.recognize_face(images[0], threshold, timer=timer)
+    if op == OP_VERIFY:
+        return system.verify_face(meta['username'], images[0], threshold, timer=timer)
+    if op == OP_RECOGNIZE_BATCH:
+        return system.recognize_faces_batch(images, threshold, timer=timer)
+    if op == OP_ENROLL:
+        return system.enroll_face(meta['username'], images[0], meta.get('user_info'), timer=timer)
+    if op == OP_DELETE:
+        return system.delete_user(meta['username'])
+    if op == OP_USERS:
+        return {'success': True, 'users': system.get_enrolled_users()}
+    if op == OP_STATS:
+        return {'success': True, 'stats': system.get_stats()}
+    if op == OP_PING:
+        return {'success': True, 'message': 'pong', 'pid': os.getpid()}
+    return {'success': False, 'message': f'Unknown face worker op {op}'}
+
+def handle_connection(app, system, conn):
+    """Baca satu request, jalankan di app context baru, kirim response"""
+    from face_metrics import StageTimer
+
+    conn.settimeout(FACE_WORKER_TIMEOUT)
+    header = recv_exact(conn, REQUEST_HEADER.size)
+    if header is None:
+        return
+    magic, op, _, meta_len, body_len = REQUEST_HEADER.unpack(header)
+    if magic != PROTOCOL_MAGIC or meta_len + body_len > FACE_WORKER_MAX_BODY:
+        status, result = STATUS_ERROR, {'success': False, 'message': 'Invalid face worker request'}
+    else:
+        meta = json.loads(recv_exact(conn, meta_len) or b'{}')
+        images = decode_images(recv_exact(conn, body_len) or b'')
+        if meta.get('deadline') and time.time() > meta['deadline']:
+            # Client sudah timeout selama request antri di backlog: jangan buang CPU
+            status, result = STATUS_EXPIRED, {'success': False, 'message': 'Face worker request expired'}
+        else:
+            timer = StageTimer()
+            try:
+                # App context per request: session SQLAlchemy bersih setiap request
+                with app.app_context():
+                    result = handle_request(system, op, meta, images, timer)
+                status = STATUS_OK
+            except Exception as e:
+                print(f"[ERROR] Face worker op {op}: {e}")
+                status, result = STATUS_ERROR, {'success': False, 'message': f'Face worker error: {str(e)}'}
+            result['_timings'] = timer.as_dict()
+
+    payload = encode_message(result)
+    conn.sendall(RESPONSE_HEADER.pack(PROTOCOL_MAGIC, status, len(payload)) + payload)
+
+def worker_loop(app, system, listener):
+    """Accept loop satu process: satu request sekaligus (CPU-bound), sisanya antri di backlog"""
+    while True:
+        conn, _ = listener.accept()
+        with conn:
+            try:
+                handle_connection(app, system, conn)
+            except (OSError, ValueError, struct.error) as e:
+                print(f"[WARNING] Face worker connection: {e}")
+
+def bind_listener(socket_path, backlog=FACE_WORKER_BACKLOG):
+    if os.path.exists(socket_path):
+        os.remove(socket_path)  # Socket sisa process sebelumnya
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    os.chmod(socket_path, 0o660)
+    listener.listen(backlog)
+    return listener
+
+def spawn_worker(app, system, listener):
+    pid = os.fork()
+    if pid:
+        return pid
+    # Child: signal default, koneksi database baru (pool parent tidak dipakai setelah fork)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    try:
+        from kapal_models import db
+        with app.app_context():
+            db.engine.dispose(close=False)
+        worker_loop(app, system, listener)
+    finally:
+        os._exit(0)
+
+def serve(socket_path, processes=1):
+    """
+    Load face engine sekali, lalu serve di socket_path
+    processes > 1: pre-fork pool (gallery/LBPH sudah di-memory-map, di-share copy-on-write)
+    """
+    from app import app
+    from face_service import get_local_face_system
+
+    with app.app_context():
+        system = get_local_face_system()
+    listener = bind_listener(socket_path)
+    print(f"[OK] Face worker listening on {socket_path} ({processes} processes, pid {os.getpid()})")
+
+    try:
+        if processes <= 1:
+            worker_loop(app, system, listener)
+            return
+
+        children = {spawn_worker(app, system, listener) for _ in range(processes)}
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+            for pid in children:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        while children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            children.discard(pid)
+            if not stopping:
+                print(f"[WARNING] Face worker {pid} exited (status {status}), restarting")
+                children.add(spawn_worker(app, system, listener))
+    finally:
+        listener.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Face recognition worker')
+    parser.add_argument('--socket', default=os.environ.get('FACE_WORKER_SOCKET', '/tmp/face_worker.sock'))
+    parser.add_argument('--processes', type=int, default=int(os.environ.get('FACE_WORKER_PROCESSES', 1)))
+    args = parser.parse_args()
+    # Budget dibagi antar process pool, sebelum app / numpy di-import
+    from thread_budget import apply_thread_budget
+    apply_thread_budget(workers=args.processes)
+    serve(args.socket, args.processes)
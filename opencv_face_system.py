@@ -1,8 +1,10 @@
 # OpenCV Face Recognition System
+from thread_budget import apply_thread_budget, configure_opencv_threads
 try:
     import cv2
     import numpy as np
     OPENCV_AVAILABLE = True
+    configure_opencv_threads(cv2)
     print("[OK] OpenCV loaded successfully")
 except ImportError as e:
     print(f"[WARNING] OpenCV not available: {e}")
@@ -20,22 +22,200 @@ except ImportError as e:
 
 import os
 import base64
-import json
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from face_engine import FaceEngine
+from face_gallery_store import FaceGalleryStore
+from face_lbph_model import LBPHFaceModel
+from face_registry import JsonFaceRegistry, template_files
+from face_metrics import NULL_TIMER
 
-class OpenCVFaceSystem:
+# Ukuran standar face ROI / template (width, height)
+TEMPLATE_SIZE = (200, 200)
+
+# Haar cascade parameter ladder (dari standard ke ultra sensitive)
+DETECTION_PARAMS = [
+    # Parameter 1: Standard
+    {'scaleFactor': 1.1, 'minNeighbors': 5, 'minSize': (80, 80)},
+    # Parameter 2: More sensitive
+    {'scaleFactor': 1.05, 'minNeighbors': 3, 'minSize': (60, 60)},
+    # Parameter 3: Very sensitive
+    {'scaleFactor': 1.03, 'minNeighbors': 2, 'minSize': (40, 40)},
+    # Parameter 4: Ultra sensitive
+    {'scaleFactor': 1.02, 'minNeighbors': 1, 'minSize': (30, 30)}
+]
+
+# LBPH: chi-square distance (histogram per cell dinormalisasi, 8x8 cell) yang dipetakan ke
+# confidence 0% (identik = 100%); confidence 80% = distance 0.2 * LBPH_MAX_DISTANCE.
+# Diukur dengan augmentasi benchmarks/face_pipeline.py (crop 85-100%, brightness +-40, noise)
+# atas faces_data: genuine p5/p50/p95 = 7.5/19.5/45.1, impostor p1/p5/p50 = 11.3/14.5/30.0,
+# EER ~31% di distance ~24. Default 55 -> accept di distance < 11 (FAR ~1%, FRR ~83%).
+# Terlalu lemah untuk login, jadi LBPH tidak punya engine profile; opt-in lewat
+# FACE_RECOGNITION_ENGINE=lbph, default engine = template correlation
+LBPH_MAX_DISTANCE = float(os.environ.get('FACE_LBPH_MAX_DISTANCE', 55.0))
+
+# Multi-template enrollment: maksimal template per user, score user = max / mean semua templatenya
+MAX_TEMPLATES_PER_USER = int(os.environ.get('FACE_MAX_TEMPLATES', 5))
+TEMPLATE_AGGREGATION = os.environ.get('FACE_TEMPLATE_AGGREGATION', 'max')  # 'max' atau 'mean'
+
+# Two-stage template matching: 32x32 thumbnail correlation -> full 200x200 untuk top-k
+THUMBNAIL_SIZE = 32
+SHORTLIST_K = int(os.environ.get('FACE_SHORTLIST_K', 20))                        # 0 = selalu full matching
+SHORTLIST_MIN_GALLERY = int(os.environ.get('FACE_SHORTLIST_MIN_GALLERY', 200))   # Gallery kecil: full matching
+SHORTLIST_EARLY_EXIT = float(os.environ.get('FACE_SHORTLIST_EARLY_EXIT', 95.0))  # Score (%) untuk stop lebih awal
+SHORTLIST_CHUNK = 256
+
+# Sharded matching: gallery besar dibagi per range row dan di-score paralel di thread pool
+# (matmul BLAS release GIL). Default = thread budget per worker (thread_budget.py);
+# FACE_MATCH_THREADS=1 = satu pass di request thread
+MATCH_THREADS = int(os.environ.get('FACE_MATCH_THREADS', 0))
+MATCH_SHARD_MIN_ROWS = int(os.environ.get('FACE_MATCH_SHARD_MIN_ROWS', 2048))   # Row minimum per shard
+
+# Image input: sisi terpanjang setelah decode (image lebih besar di-downscale)
+MAX_IMAGE_SIDE = 1024
+BRIGHTNESS_SAMPLE_STEP = 4   # Brightness dihitung dari setiap pixel ke-4 (baris & kolom)
+
+# Quality gate pada face ROI 200x200 sebelum matching (FACE_QUALITY_GATE=0 untuk disable)
+QUALITY_GATE = os.environ.get('FACE_QUALITY_GATE', '1') == '1'
+# Sharpness = energi high-frequency ROI 200x200 (ROI - Gaussian blur sigma 1) dibagi variance
+# intensitas ROI, x1000: tidak tergantung ukuran wajah asli (ROI selalu 200x200) maupun kontras.
+# Diukur lewat detect + extract_face_roi pada faces_data: capture asli 0.25 - 10.6,
+# capture yang di-blur Gaussian sigma 4: 0.05 - 0.17 (10/10 ditolak), sigma 2.5: 0.08 - 0.26
+# (9/10 ditolak). Variance Laplacian mentah tidak terpisah sebersih ini (asli 3.8, blur 2.5)
+QUALITY_MIN_SHARPNESS = float(os.environ.get('FACE_QUALITY_MIN_SHARPNESS', 0.2))
+QUALITY_MIN_FACE_RATIO = float(os.environ.get('FACE_QUALITY_MIN_FACE_RATIO', 0.1))    # Lebar wajah / sisi terpanjang image
+QUALITY_BRIGHTNESS_RANGE = (50, 210)                                                  # Mean ROI
+
+# Coarse-to-fine detection settings
+CASCADE_WINDOW = 24          # Ukuran window haarcascade_frontalface_default
+COARSE_MAX_SIDE = 320        # Sisi terpanjang image untuk coarse pass
+COARSE_MAX_CANDIDATES = 3    # Kandidat maksimal yang di-refine di full resolution
+COARSE_CROP_MARGIN = 0.5     # Margin crop sekitar kandidat (relatif ke ukuran kandidat)
+
+def area_matrix(source, target):
+    """
+    Matrix (target x source) untuk area-average downscale 1D
+    thumbnail = A @ image @ A.T (sama untuk gallery dan query)
+    """
+    matrix = np.zeros((target, source), dtype=np.float32)
+    step = source / target
+    for i in range(target):
+        start, end = i * step, (i + 1) * step
+        for j in range(int(start), min(source, int(np.ceil(end)))):
+            matrix[i, j] = (min(end, j + 1) - max(start, j)) / step
+    return matrix
+
+def template_thumbnails(vectors):
+    """
+    Compact descriptor: template (N x 40000) -> thumbnail 32x32 zero-mean unit-norm (N x 1024)
+    Dot product dua thumbnail ~ TM_CCOEFF_NORMED di resolusi 32x32
+    """
+    area = area_matrix(TEMPLATE_SIZE[0], THUMBNAIL_SIZE)
+    vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, TEMPLATE_SIZE[1], TEMPLATE_SIZE[0])
+    thumbs = (area @ vectors @ area.T).reshape(len(vectors), -1)
+    thumbs -= thumbs.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(thumbs, axis=1, keepdims=True)
+    return np.divide(thumbs, norms, out=np.zeros_like(thumbs), where=norms > 0)
+
+def aggregate_scores(scores, offsets, aggregation='max'):
+    """
+    Score per template (Q x T, template di-pack per user) -> score per user (Q x N)
+    offsets: index template pertama setiap user (gallery snapshot)
+    """
+    if scores.shape[1] == len(offsets):
+        return scores  # Satu template per user
+    if aggregation == 'mean':
+        counts = np.diff(np.append(offsets, scores.shape[1]))
+        return np.add.reduceat(scores, offsets, axis=1) / counts
+    return np.maximum.reduceat(scores, offsets, axis=1)
+
+def shard_ranges(row_count, shards):
+    """Bagi [0, row_count) jadi maksimal shards range (start, end) contiguous dengan ukuran rata"""
+    bounds = np.linspace(0, row_count, shards + 1).astype(np.int64)
+    return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+def to_gray(image):
+    """Grayscale view: image gray dikembalikan apa adanya (tanpa copy)"""
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+def roi_sharpness(face_roi):
+    """
+    Energi high-frequency (ROI - Gaussian blur sigma 1) relatif ke variance intensitas, x1000
+    Fungsi: Ukuran blur yang tidak berubah dengan kontras / exposure; ROI flat = 0
+    """
+    roi = face_roi.astype(np.float32)
+    variance = float(roi.var())
+    if variance < 1e-6:
+        return 0.0
+    detail = roi - cv2.GaussianBlur(roi, (0, 0), 1.0)
+    return float((detail * detail).mean()) / variance * 1000.0
+
+def encoded_image_size(image_bytes):
+    """
+    Baca (width, height) dari header JPEG / PNG tanpa decode
+    Returns: None untuk format lain atau header rusak
+    """
+    data = memoryview(image_bytes)
+    if len(data) >= 24 and data[:8] == b'\x89PNG\r\n\x1a\n':
+        width, height = struct.unpack('>II', data[16:24])
+        return width, height
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    
+    # Scan JPEG markers sampai SOFn (frame header berisi ukuran image)
+    index = 2
+    while index + 9 < len(data):
+        if data[index] != 0xFF:
+            return None
+        marker = data[index + 1]
+        if marker == 0xFF:  # Fill byte
+            index += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # Marker tanpa length
+            index += 2
+            continue
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', data[index + 5:index + 9])
+            return width, height
+        index += 2 + struct.unpack('>H', data[index + 2:index + 4])[0]
+    return None
+
+def grayscale_decode_flag(size):
+    """
+    imdecode flag grayscale dengan reduksi terbesar yang sisi terpanjangnya
+    masih >= MAX_IMAGE_SIDE (resize akhir tetap di preprocess_image)
+    """
+    if size is not None:
+        longest = max(size)
+        for factor, flag in ((8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+                             (4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+                             (2, cv2.IMREAD_REDUCED_GRAYSCALE_2)):
+            if longest // factor >= MAX_IMAGE_SIDE:
+                return flag
+    return cv2.IMREAD_GRAYSCALE
+
+class OpenCVFaceSystem(FaceEngine):
     """
     Face Recognition System menggunakan OpenCV
     Menggunakan LBPH (Local Binary Patterns Histograms) Face Recognizer
     """
     
-    def __init__(self, faces_dir='faces_data'):
+    engine_name = 'opencv'
+    
+    def __init__(self, faces_dir='faces_data', registry=None, recognition_engine=None, detection_mode=None):
         """
         Initialize face recognition system
+        registry: face_registry.DatabaseFaceRegistry / JsonFaceRegistry (default users.json)
+        recognition_engine / detection_mode: override env (dipakai oleh engine profile, face_engine.py)
         """
         self.faces_dir = faces_dir
         self.model_file = os.path.join(faces_dir, 'face_model.yml')
         self.users_file = os.path.join(faces_dir, 'users.json')
+        self.registry = registry or JsonFaceRegistry(self.users_file)
         self.opencv_available = OPENCV_AVAILABLE
         
         # Create directory jika tidak ada
@@ -47,142 +227,620 @@ class OpenCVFaceSystem:
             self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
             # Use template matching for simple face recognition (demo purpose)
             self.use_simple_matching = True
+            # 'coarse' = coarse-to-fine, 'ladder' = semua parameter di full resolution
+            self.detection_mode = detection_mode or os.environ.get('FACE_DETECTION_MODE', 'coarse')
+            # 'template' = template correlation (default), 'lbph' = LBPH histogram model (opt-in,
+            # akurasi rendah, lihat LBPH_MAX_DISTANCE)
+            self.recognition_engine = recognition_engine or os.environ.get('FACE_RECOGNITION_ENGINE', 'template')
+            self.lbph_model = LBPHFaceModel(self.model_file)
+            self.max_templates = max(1, MAX_TEMPLATES_PER_USER)
+            self.template_aggregation = TEMPLATE_AGGREGATION
+            self.quality_gate = QUALITY_GATE
+            # Template gallery di disk (face_gallery.*), di-memory-map oleh semua worker.
+            # Satu baris per user, sudah dinormalisasi (zero-mean, unit-norm) sehingga
+            # matching = satu matrix-vector product
+            self.gallery = FaceGalleryStore(faces_dir, TEMPLATE_SIZE[0] * TEMPLATE_SIZE[1])
+            # Shortlist stage: thumbnail per gallery row, in-memory per worker
+            self.shortlist_k = SHORTLIST_K
+            self.shortlist_min_gallery = SHORTLIST_MIN_GALLERY
+            self.shortlist_early_exit = SHORTLIST_EARLY_EXIT
+            self._thumbnail_cache = (None, np.empty((0, THUMBNAIL_SIZE * THUMBNAIL_SIZE), dtype=np.float32))
+            self._thumbnail_lock = threading.Lock()
+            # Sharded matching thread pool (lazy, per process)
+            budget = apply_thread_budget()
+            self.match_threads = MATCH_THREADS or (budget['threads'] if budget['enabled'] else min(4, os.cpu_count() or 1))
+            self.match_shard_min_rows = MATCH_SHARD_MIN_ROWS
+            self._match_pool = (None, None)
+            self._match_pool_lock = threading.Lock()
         else:
             # Fallback mode - no face detection
             self.face_cascade = None
             self.use_simple_matching = False
+            self.detection_mode = None
+            self.recognition_engine = None
+            self.lbph_model = None
+            self.gallery = None
             print("[INFO] Running in fallback mode without face detection")
         
+        # Cross-replica registry sync (face_registry_sync), di-attach oleh face_service
+        self.registry_sync = None
+        
         # Load model jika sudah ada
         self.users_data = self.load_users_data()
         self.load_model()
         
     def load_users_data(self):
-        """Load user data dari file"""
-        if os.path.exists(self.users_file):
-            with open(self.users_file, 'r') as f:
-                return json.load(f)
-        return {}
+        """Load user data dari registry"""
+        return self.registry.load_all()
     
-    def save_users_data(self):
-        """Save user data ke file"""
-        with open(self.users_file, 'w') as f:
-            json.dump(self.users_data, f, indent=2)
+    def reload_users(self, usernames):
+        """Reload registry entry usernames saja; username yang sudah tidak ada dibuang"""
+        loaded = self.registry.load(usernames)
+        users_data = dict(self.users_data)  # Swap dict: thread lain bisa sedang iterate
+        for username in usernames:
+            if username in loaded:
+                users_data[username] = loaded[username]
+            else:
+                users_data.pop(username, None)
+        self.users_data = users_data
     
+    def load_face_file(self, username, face_file):
+        """
+        Load satu face file (grayscale) user dari faces_dir
+        Jika file tidak ada di disk lokal (mis. replica baru), restore dari registry
+        """
+        face_path = os.path.join(self.faces_dir, face_file)
+        if os.path.exists(face_path):
+            return cv2.imread(face_path, cv2.IMREAD_GRAYSCALE)
+        face_image = self.registry.get_face_image(username, face_file)
+        if not face_image:
+            return None
+        with open(face_path, 'wb') as f:
+            f.write(face_image)
+        return cv2.imdecode(np.frombuffer(face_image, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    
+    def refresh_shared_state(self):
+        """
+        Sinkronkan state per-worker dengan replica lain (registry sync, jika aktif)
+        dan dengan worker lain di host yang sama
+        """
+        if self.registry_sync is not None:
+            self.registry_sync.poll()
+        return self.refresh_local_state()
+    
+    def refresh_local_state(self):
+        """
+        Sinkronkan state per-worker dengan worker lain di host yang sama
+        Fungsi: Gallery version adalah commit point setiap enroll/delete; jika berubah
+        (satu os.stat), reload registry entry user yang row gallery-nya berubah dan LBPH
+        model yang ditulis sebelum publish. Full reload registry hanya setelah compaction
+        """
+        if self.gallery is None or not self.gallery.refresh():
+            return False
+        changed = self.gallery.changed_usernames
+        if changed is None:
+            self.users_data = self.load_users_data()
+        elif changed:
+            self.reload_users(changed)
+        if self.recognition_engine == 'lbph':
+            self.lbph_model.load()
+        return True
+    
+    def template_count(self):
+        """Jumlah template semua user di registry (users_data)"""
+        return sum(len(template_files(user_data)) for user_data in self.users_data.values())
+
     def load_model(self):
-        """Load face templates (simplified version)"""
+        """Load face templates dan LBPH model"""
         if self.use_simple_matching:
-            print("[OK] Simple face matching system ready")
+            self.load_templates()
+            print(f"[OK] Simple face matching system ready ({len(self.gallery)} users, {self.gallery.template_count} templates in shared gallery)")
+            if self.recognition_engine == 'lbph':
+                self.load_lbph_model()
             return True
         return False
     
-    def base64_to_image(self, base64_string):
+    def load_lbph_model(self):
+        """
+        Memory-map LBPH model dari face_model.json/.bin
+        Jika belum ada atau tidak sinkron dengan users.json, bootstrap sekali dari face files
+        """
+        try:
+            if (self.lbph_model.load() and set(self.lbph_model.labels) == set(self.users_data)
+                    and len(self.lbph_model) == self.template_count()):
+                print(f"[OK] LBPH model loaded: {len(self.lbph_model)} histograms")
+                return True
+            
+            samples = []
+            for username, user_data in self.users_data.items():
+                for face_file in template_files(user_data):
+                    face_gray = self.load_face_file(username, face_file)
+                    if face_gray is not None:
+                        samples.append((username, face_gray))
+            self.lbph_model.train(samples)
+            print(f"[OK] LBPH model trained from {len(samples)} face files")
+            return True
+        except Exception as e:
+            print(f"[WARNING] LBPH model unavailable, using template matching: {e}")
+            self.recognition_engine = 'template'
+            return False
+    
+    def normalize_template(self, face_gray):
+        """
+        Flatten face 200x200 grayscale menjadi vector zero-mean unit-norm.
+        Dot product dua vector ini sama dengan hasil cv2.TM_CCOEFF_NORMED
+        untuk dua image berukuran sama.
+        """
+        if face_gray.shape[:2] != (TEMPLATE_SIZE[1], TEMPLATE_SIZE[0]):
+            face_gray = cv2.resize(face_gray, TEMPLATE_SIZE)
+        vector = face_gray.astype(np.float32).ravel()
+        vector -= vector.mean()
+        norm = float(np.linalg.norm(vector))
+        if norm == 0:
+            return None
+        vector /= norm
+        return vector
+    
+    def load_templates(self):
+        """
+        Memory-map shared template gallery (templates x 40000)
+        Jika belum ada atau tidak sinkron dengan registry, rebuild sekali dari face files
+        """
+        if self.gallery_in_sync():
+            return len(self.gallery)
+        
+        with self.gallery.write_lock():
+            # Worker lain mungkin sudah rebuild / enroll selama kita menunggu lock
+            self.users_data = self.load_users_data()
+            if self.gallery_in_sync():
+                return len(self.gallery)
+            return self.rebuild_templates()
+    
+    def gallery_in_sync(self):
+        """Load gallery; True jika user dan jumlah template sama dengan registry"""
+        return (self.gallery.load() and set(self.gallery.usernames) == set(self.users_data)
+                and self.gallery.template_count == self.template_count())
+    
+    def rebuild_templates(self):
+        """Bangun ulang gallery dari face files di faces_dir (semua template setiap user)"""
+        labels = []
+        rows = []
+        for username, user_data in self.users_data.items():
+            for face_file in template_files(user_data):
+                template = self.load_face_file(username, face_file)
+                if template is None:
+                    print(f"[WARNING] Face template not found for {username}: {face_file}")
+                    continue
+                labels.append(username)
+                rows.append(self.template_vector(template))
+        
+        template_dim = TEMPLATE_SIZE[0] * TEMPLATE_SIZE[1]
+        matrix = np.vstack(rows) if rows else np.empty((0, template_dim), dtype=np.float32)
+        self.gallery.replace_all(labels, matrix)
+        print(f"[OK] Face gallery rebuilt from {len(labels)} face files ({len(set(labels))} users)")
+        return len(set(labels))
+    
+    def template_vector(self, face_gray):
+        """Template gallery; ROI flat (tanpa variasi) disimpan sebagai vector nol (score 0)"""
+        vector = self.normalize_template(face_gray)
+        if vector is None:
+            return np.zeros(TEMPLATE_SIZE[0] * TEMPLATE_SIZE[1], dtype=np.float32)
+        return vector
+    
+    def update_templates(self, username, keep, face_grays):
+        """
+        Template user di shared gallery = template lama di index keep + face_grays (publish version baru)
+        Returns: jumlah template user
+        """
+        vectors = [self.template_vector(face_gray) for face_gray in face_grays]
+        return self.gallery.update_templates(username, keep, vectors)
+    
+    def select_templates(self, username, new_face):
+        """
+        Pruning saat user sudah punya max_templates: buang template lama dengan kontribusi
+        terendah, yaitu yang paling mirip dengan template lain (paling redundan).
+        Template baru selalu disimpan.
+        Returns: index template lama yang dipertahankan (urutan tetap)
+        """
+        user_data = self.users_data.get(username)
+        if user_data is None:
+            return []
+        count = len(template_files(user_data))
+        if count < self.max_templates:
+            return list(range(count))
+        
+        templates = self.gallery.templates(username)
+        if templates is None or len(templates) != count:
+            # Gallery tidak sinkron dengan registry: buang yang paling lama
+            return list(range(count - self.max_templates + 1, count))
+        
+        vectors = np.vstack([templates, self.template_vector(new_face)[np.newaxis, :]])
+        similarity = vectors @ vectors.T
+        np.fill_diagonal(similarity, -np.inf)
+        keep = list(range(count))
+        while len(keep) >= self.max_templates:
+            redundancy = similarity[np.ix_(keep, keep + [count])].max(axis=1)
+            keep.pop(int(np.argmax(redundancy)))
+        return keep
+    
+    def remove_template(self, username):
+        """Hapus template user dari shared gallery (publish version baru)"""
+        return self.gallery.remove(username)
+    
+    def match_templates(self, face_gray):
+        """
+        Score face ROI terhadap gallery
+        Gallery besar: two-stage (thumbnail shortlist -> full correlation top-k),
+        selain itu semua template sekaligus
+        Returns: list of (username, score_percent), atau [] jika gallery kosong
+        """
+        if self.shortlist_k > 0 and len(self.gallery) >= max(self.shortlist_min_gallery, self.shortlist_k):
+            return self.match_templates_shortlist(face_gray)
+        usernames, scores = self.match_templates_batch([face_gray])
+        if scores is None:
+            return []
+        return list(zip(usernames, scores[0].tolist()))
+    
+    def match_executor(self):
+        """Thread pool untuk sharded matching, dibuat saat pertama dipakai (dan ulang setelah fork)"""
+        with self._match_pool_lock:
+            pool, pid = self._match_pool
+            if pool is None or pid != os.getpid():
+                pool = ThreadPoolExecutor(max_workers=self.match_threads, thread_name_prefix='face-match')
+                self._match_pool = (pool, os.getpid())
+            return pool
+    
+    def score_rows(self, matrix, queries):
+        """
+        Correlation queries (Q x dim) terhadap semua row matrix -> scores (Q x rows)
+        Matrix besar dibagi jadi shard row contiguous (view memmap, tanpa copy) yang di-score
+        paralel; setiap shard menulis langsung ke bagiannya di output
+        """
+        shards = shard_ranges(matrix.shape[0], min(self.match_threads, matrix.shape[0] // max(1, self.match_shard_min_rows)))
+        if len(shards) <= 1:
+            return queries @ matrix.T
+        
+        scores = np.empty((matrix.shape[0], len(queries)), dtype=np.result_type(matrix.dtype, queries.dtype))
+        queries_t = np.ascontiguousarray(queries.T)
+        def score_shard(shard):
+            start, end = shard
+            np.matmul(matrix[start:end], queries_t, out=scores[start:end])
+        list(self.match_executor().map(score_shard, shards))
+        return scores.T
+    
+    def gallery_thumbnails(self, generation, matrix):
+        """
+        Thumbnail untuk setiap row gallery (termasuk garbage rows)
+        Row dalam satu generation tidak pernah berubah, jadi hanya row baru yang dihitung
+        """
+        with self._thumbnail_lock:
+            cached_generation, thumbs = self._thumbnail_cache
+            if cached_generation != generation:
+                thumbs = thumbs[:0]
+            row_count = matrix.shape[0]
+            if thumbs.shape[0] < row_count:
+                new_rows = [template_thumbnails(matrix[start:min(start + SHORTLIST_CHUNK, row_count)])
+                            for start in range(thumbs.shape[0], row_count, SHORTLIST_CHUNK)]
+                thumbs = np.vstack([thumbs] + new_rows)
+                self._thumbnail_cache = (generation, thumbs)
+            return thumbs[:row_count]
+    
+    def match_templates_shortlist(self, face_gray):
+        """
+        Two-stage matching:
+        1. Correlation thumbnail 32x32 terhadap semua template (1024 dim, ~40x lebih murah),
+           di-aggregate per user
+        2. Full 200x200 correlation hanya untuk template top-k user, urut dari kandidat terbaik;
+           berhenti begitu score >= shortlist_early_exit
+        Returns: list of (username, score_percent) untuk kandidat yang dievaluasi
+        """
+        generation, usernames, rows, offsets, matrix = self.gallery.versioned_snapshot()
+        query = self.normalize_template(face_gray)
+        if query is None or len(usernames) == 0:
+            return []
+        
+        thumbs = self.gallery_thumbnails(generation, matrix)
+        coarse = self.score_rows(thumbs, template_thumbnails(query))[0][rows]
+        coarse = aggregate_scores(coarse[np.newaxis, :], offsets, self.template_aggregation)[0]
+        k = min(self.shortlist_k, len(usernames))
+        shortlist = np.argpartition(-coarse, k - 1)[:k]
+        shortlist = shortlist[np.argsort(-coarse[shortlist])]
+        ends = np.append(offsets[1:], len(rows))
+        
+        scores = []
+        for index in shortlist:
+            template_scores = np.asarray(matrix[rows[offsets[index]:ends[index]]]) @ query
+            score = float(template_scores.mean() if self.template_aggregation == 'mean' else template_scores.max()) * 100
+            scores.append((usernames[index], score))
+            if score >= self.shortlist_early_exit:
+                break
+        return scores
+    
+    def match_templates_batch(self, face_grays):
+        """
+        Score banyak face ROI terhadap semua template dalam satu matrix-matrix product (sharded),
+        lalu aggregate per user (max / mean) dengan satu reduceat
+        Returns: (usernames, scores) dengan scores shape (len(face_grays), len(usernames)) dalam persen,
+                 atau (usernames, None) jika gallery kosong / tidak ada ROI valid.
+                 Row untuk ROI flat (tanpa variasi, tidak bisa dinormalisasi) berisi NaN
+        """
+        usernames, rows, offsets, matrix = self.gallery.snapshot()
+        if len(usernames) == 0 or len(face_grays) == 0:
+            return usernames, None
+        
+        queries = np.zeros((len(face_grays), matrix.shape[1]), dtype=np.float32)
+        valid = np.zeros(len(face_grays), dtype=bool)
+        for row, face_gray in enumerate(face_grays):
+            query = self.normalize_template(face_gray)
+            if query is not None:
+                queries[row] = query
+                valid[row] = True
+        if not valid.any():
+            return usernames, None
+        scores = self.score_rows(matrix, queries[valid])
+        if len(rows) != matrix.shape[0] or np.any(rows[1:] < rows[:-1]):
+            scores = scores[:, rows]  # Buang kolom garbage rows, urut per user
+        result = np.full((len(face_grays), len(usernames)), np.nan, dtype=np.float32)
+        result[valid] = aggregate_scores(scores, offsets, self.template_aggregation) * 100
+        return usernames, result
+    
+    def load_image(self, image_data, timer=None):
+        """
+        Decode image dari base64 string (data URL) atau raw bytes (JPEG/PNG body)
+        Returns: grayscale image (satu buffer untuk detection + ROI extraction)
+        """
+        if isinstance(image_data, (bytes, bytearray, memoryview)):
+            return self.bytes_to_image(image_data, timer=timer)
+        return self.base64_to_image(image_data, timer=timer)
+    
+    def base64_to_image(self, base64_string, timer=None):
         """Convert base64 string to OpenCV image dengan preprocessing"""
         try:
             if not self.opencv_available:
                 return None
+            
+            with (timer or NULL_TIMER).stage('base64_decode'):
+                # Remove data URL prefix jika ada
+                if 'data:image' in base64_string and 'base64,' in base64_string:
+                    base64_string = base64_string.split('base64,')[1]
                 
-            # Remove data URL prefix jika ada
-            if 'data:image' in base64_string and 'base64,' in base64_string:
-                base64_string = base64_string.split('base64,')[1]
+                # Decode base64
+                img_data = base64.b64decode(base64_string)
+            return self.bytes_to_image(img_data, timer=timer)
             
-            # Decode base64
-            img_data = base64.b64decode(base64_string)
-            nparr = np.frombuffer(img_data, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        except Exception as e:
+            print(f"[ERROR] Base64 to image conversion: {e}")
+            return None
+    
+    def bytes_to_image(self, image_bytes, timer=None):
+        """
+        Convert raw encoded image bytes ke grayscale image dengan preprocessing
+        np.frombuffer hanya membuat view (tanpa copy) di atas buffer upload.
+        Decode langsung ke grayscale; JPEG besar di-decode di resolusi 1/2, 1/4
+        atau 1/8 (DCT scaling) selama hasilnya masih >= MAX_IMAGE_SIDE
+        """
+        try:
+            if not self.opencv_available:
+                return None
+            
+            timer = timer or NULL_TIMER
+            with timer.stage('image_decode'):
+                nparr = np.frombuffer(image_bytes, np.uint8)
+                image = cv2.imdecode(nparr, grayscale_decode_flag(encoded_image_size(image_bytes)))
             
             if image is None:
-                print("[ERROR] Failed to decode image from base64")
+                print("[ERROR] Failed to decode image data")
                 return None
             
-            # Preprocessing untuk better detection
-            # 1. Resize if too large
-            height, width = image.shape[:2]
-            if width > 1024 or height > 1024:
-                scale = min(1024/width, 1024/height)
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                image = cv2.resize(image, (new_width, new_height))
-                print(f"[DEBUG] Image resized to {new_width}x{new_height}")
-            
-            # 2. Improve contrast if needed
-            gray_temp = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            avg_brightness = np.mean(gray_temp)
-            
-            if avg_brightness < 80:  # Dark image
-                # Increase brightness and contrast
-                alpha = 1.3  # Contrast control
-                beta = 30    # Brightness control
-                image = cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
-                print("[DEBUG] Applied brightness/contrast enhancement")
-            
-            print(f"[DEBUG] Image processed: {image.shape}, brightness: {avg_brightness:.1f}")
-            return image
+            with timer.stage('preprocess'):
+                return self.preprocess_image(image)
             
         except Exception as e:
-            print(f"[ERROR] Base64 to image conversion: {e}")
+            print(f"[ERROR] Image decode: {e}")
             return None
     
-    def detect_faces(self, image):
+    def preprocess_image(self, image):
+        """
+        Preprocessing untuk better detection: resize + brightness/contrast correction
+        image: grayscale (pipeline normal) atau BGR
+        """
+        # 1. Resize if too large
+        height, width = image.shape[:2]
+        if width > MAX_IMAGE_SIDE or height > MAX_IMAGE_SIDE:
+            scale = min(MAX_IMAGE_SIDE/width, MAX_IMAGE_SIDE/height)
+            new_width = int(width * scale)
+            new_height = int(height * scale)
+            image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_AREA)
+            print(f"[DEBUG] Image resized to {new_width}x{new_height}")
+        
+        # 2. Improve contrast if needed (brightness dari subsample, tanpa copy gray penuh)
+        sample = image[::BRIGHTNESS_SAMPLE_STEP, ::BRIGHTNESS_SAMPLE_STEP]
+        if sample.ndim == 3:
+            sample = cv2.cvtColor(sample, cv2.COLOR_BGR2GRAY)
+        avg_brightness = float(np.mean(sample))
+        
+        if avg_brightness < 80:  # Dark image
+            # Increase brightness and contrast
+            alpha = 1.3  # Contrast control
+            beta = 30    # Brightness control
+            image = cv2.convertScaleAbs(image, alpha=alpha, beta=beta)
+            print("[DEBUG] Applied brightness/contrast enhancement")
+        
+        print(f"[DEBUG] Image processed: {image.shape}, brightness: {avg_brightness:.1f}")
+        return image
+    
+    def detect_faces(self, image, mode=None, timer=None):
         """
         Detect faces dalam image dengan parameter yang lebih fleksibel
-        Returns: list of face rectangles
+        mode: 'coarse' (coarse-to-fine, default) atau 'ladder' (semua parameter di full resolution)
+        Returns: list of face rectangles (koordinat full resolution)
         """
         try:
             if not self.opencv_available or image is None:
                 return []
+            
+            with (timer or NULL_TIMER).stage('detect'):
+                gray = to_gray(image)
                 
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Try multiple detection parameters untuk increased success rate
-            detection_params = [
-                # Parameter 1: Standard
-                {'scaleFactor': 1.1, 'minNeighbors': 5, 'minSize': (80, 80)},
-                # Parameter 2: More sensitive
-                {'scaleFactor': 1.05, 'minNeighbors': 3, 'minSize': (60, 60)},
-                # Parameter 3: Very sensitive
-                {'scaleFactor': 1.03, 'minNeighbors': 2, 'minSize': (40, 40)},
-                # Parameter 4: Ultra sensitive
-                {'scaleFactor': 1.02, 'minNeighbors': 1, 'minSize': (30, 30)}
-            ]
-            
-            for params in detection_params:
-                faces = self.face_cascade.detectMultiScale(gray, **params)
-                if len(faces) > 0:
-                    print(f"[DEBUG] Face detected with params: {params}")
-                    return faces
-            
-            print("[DEBUG] No faces detected with all parameter sets")
-            return []
+                if (mode or self.detection_mode) == 'ladder':
+                    return self.detect_faces_ladder(gray)
+                return self.detect_faces_coarse_to_fine(gray)
             
         except Exception as e:
             print(f"[ERROR] Face detection: {e}")
             return []
     
-    def extract_face_roi(self, image, face_rect):
+    def detect_faces_ladder(self, gray, params_list=None):
+        """
+        Try multiple detection parameters untuk increased success rate
+        """
+        for params in params_list or DETECTION_PARAMS:
+            faces = self.face_cascade.detectMultiScale(gray, **params)
+            if len(faces) > 0:
+                print(f"[DEBUG] Face detected with params: {params}")
+                return faces
+        
+        print("[DEBUG] No faces detected with all parameter sets")
+        return []
+    
+    def detect_faces_coarse_to_fine(self, gray):
+        """
+        Coarse-to-fine detection:
+        1. Cascade di image yang di-downscale (murah)
+        2. Parameter mahal hanya dijalankan di crop sekitar kandidat (wajah kecil: kandidat
+           dari image dengan downscale lebih ringan, lihat step 2 di bawah)
+        3. Rectangle di-map kembali ke full resolution untuk extract_face_roi
+        """
+        height, width = gray.shape[:2]
+        
+        def downscale(scale):
+            if scale >= 1.0:
+                return gray, 1.0
+            return cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA), scale
+        
+        def scaled(params, scale):
+            min_side = max(CASCADE_WINDOW, int(params['minSize'][0] * scale))
+            return dict(params, minSize=(min_side, min_side))
+        
+        # Step 1: standard + sensitive params di downscaled image (COARSE_MAX_SIDE).
+        # Window cascade minimal 24px, jadi di scale ini wajah < 24/scale px (48px untuk
+        # frame 640) tidak terlihat -> jatuh ke step 2. Trade-off: rectangle dari pass ini
+        # lebih kasar dari ladder (mean IoU ~0.7 di bench_face_detection.py); ROI padding
+        # menyerap sebagian, dan enroll + login memakai detection mode yang sama
+        small, scale = downscale(COARSE_MAX_SIDE / max(width, height))
+        for params in DETECTION_PARAMS[:2]:
+            faces = self.face_cascade.detectMultiScale(small, **scaled(params, scale))
+            if len(faces) > 0:
+                print(f"[DEBUG] Face detected (coarse) with params: {params}")
+                return np.round(np.asarray(faces) / scale).astype(np.int32)
+        
+        # Step 2: kandidat dengan parameter ultra sensitive, di-refine di crop full resolution.
+        # Pass pertama di scale coarse; wajah lebih kecil dari window cascade di scale itu
+        # dicari di pass kedua pada scale di mana minSize ladder terkecil (30px) masih
+        # >= window cascade, dibatasi maxSize sehingga hanya wajah kecil yang jadi kandidat
+        min_face = DETECTION_PARAMS[-1]['minSize'][0]
+        passes = [(small, scale, None)]
+        if scale < CASCADE_WINDOW / min_face:
+            fine, fine_scale = downscale(CASCADE_WINDOW / min_face)
+            max_side = int(np.ceil(CASCADE_WINDOW / scale * fine_scale))
+            passes.append((fine, fine_scale, (max_side, max_side)))
+        
+        for image, scale, max_size in passes:
+            params = scaled(DETECTION_PARAMS[-1], scale)
+            if max_size:
+                params['maxSize'] = max_size
+            candidates = self.face_cascade.detectMultiScale(image, **params)
+            faces = self.refine_candidates(gray, candidates, scale)
+            if len(faces) > 0:
+                return faces
+        
+        print("[DEBUG] No face found in coarse pass candidates")
+        return []
+    
+    def refine_candidates(self, gray, candidates, scale):
+        """
+        Jalankan parameter ladder di crop full resolution sekitar kandidat terbesar
+        Returns: face rectangles di koordinat full resolution, atau [] jika tidak ada yang terkonfirmasi
+        """
+        height, width = gray.shape[:2]
+        candidates = sorted(candidates, key=lambda rect: rect[2] * rect[3], reverse=True)
+        for cx, cy, cw, ch in candidates[:COARSE_MAX_CANDIDATES]:
+            x, y, w, h = (int(v / scale) for v in (cx, cy, cw, ch))
+            margin_x, margin_y = int(w * COARSE_CROP_MARGIN), int(h * COARSE_CROP_MARGIN)
+            x0, y0 = max(0, x - margin_x), max(0, y - margin_y)
+            x1, y1 = min(width, x + w + margin_x), min(height, y + h + margin_y)
+            
+            faces = self.detect_faces_ladder(gray[y0:y1, x0:x1])
+            if len(faces) > 0:
+                faces = np.asarray(faces).copy()
+                faces[:, 0] += x0
+                faces[:, 1] += y0
+                return faces
+        return []
+    
+    def extract_face_roi(self, image, face_rect, timer=None):
         """
         Extract face region of interest
         """
         try:
-            x, y, w, h = face_rect
-            # Add padding
-            padding = 20
-            x = max(0, x - padding)
-            y = max(0, y - padding)
-            w = min(image.shape[1] - x, w + 2*padding)
-            h = min(image.shape[0] - y, h + 2*padding)
-            
-            face_roi = image[y:y+h, x:x+w]
-            gray_face = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY)
-            
-            # Resize to consistent size
-            gray_face = cv2.resize(gray_face, (200, 200))
-            return gray_face
+            with (timer or NULL_TIMER).stage('roi'):
+                x, y, w, h = face_rect
+                # Add padding
+                padding = 20
+                x = max(0, x - padding)
+                y = max(0, y - padding)
+                w = min(image.shape[1] - x, w + 2*padding)
+                h = min(image.shape[0] - y, h + 2*padding)
+                
+                face_roi = image[y:y+h, x:x+w]
+                if face_roi.ndim == 3:
+                    face_roi = cv2.cvtColor(face_roi, cv2.COLOR_BGR2GRAY)
+                
+                # Resize to consistent size
+                return cv2.resize(face_roi, TEMPLATE_SIZE)
         except Exception as e:
             print(f"[ERROR] Face ROI extraction: {e}")
             return None
     
-    def enroll_face(self, username, base64_image, user_info=None):
+    def check_face_quality(self, image, face_rect, face_roi, timer=None):
+        """
+        Quality gate murah pada face ROI sebelum matching: ukuran wajah relatif ke frame,
+        exposure (mean ROI) dan blur (roi_sharpness ROI 200x200)
+        Returns: None jika lolos, atau result gagal dengan 'quality' dan 'suggestions'
+        """
+        if not self.quality_gate:
+            return None
+        
+        with (timer or NULL_TIMER).stage('quality'):
+            face_ratio = face_rect[2] / max(image.shape[:2])
+            brightness = float(face_roi.mean())
+            sharpness = roi_sharpness(face_roi)
+        quality = {
+            'face_ratio': round(face_ratio, 3),
+            'brightness': round(brightness, 1),
+            'sharpness': round(sharpness, 3)
+        }
+        
+        if face_ratio < QUALITY_MIN_FACE_RATIO:
+            message, suggestions = 'Face too small in frame', ['Dekatkan wajah ke kamera', 'Posisikan wajah di tengah frame']
+        elif brightness < QUALITY_BRIGHTNESS_RANGE[0]:
+            message, suggestions = 'Face image too dark', ['Tambah pencahayaan', 'Hadapkan wajah ke sumber cahaya']
+        elif brightness > QUALITY_BRIGHTNESS_RANGE[1]:
+            message, suggestions = 'Face image too bright', ['Kurangi pencahayaan', 'Hindari backlight']
+        elif sharpness < QUALITY_MIN_SHARPNESS:
+            message, suggestions = 'Face image too blurry', ['Tahan kamera / kepala tetap diam', 'Pastikan kamera fokus']
+        else:
+            return None
+        
+        print(f"[DEBUG] Quality gate rejected: {message} {quality}")
+        return {
+            'success': False,
+            'message': message,
+            'suggestions': suggestions,
+            'quality': quality
+        }
+    
+    def enroll_face(self, username, image_data, user_info=None, timer=None):
         """
         Enroll face untuk user tertentu
         """
@@ -194,8 +852,8 @@ class OpenCVFaceSystem:
                     'message': 'Face recognition not available on this server. Please use password login.'
                 }
             
-            # Convert base64 to image
-            image = self.base64_to_image(base64_image)
+            # Convert base64 / raw bytes to image
+            image = self.load_image(image_data, timer=timer)
             if image is None:
                 return {
                     'success': False,
@@ -203,7 +861,7 @@ class OpenCVFaceSystem:
                 }
             
             # Detect faces
-            faces = self.detect_faces(image)
+            faces = self.detect_faces(image, timer=timer)
             if len(faces) == 0:
                 return {
                     'success': False,
@@ -217,27 +875,45 @@ class OpenCVFaceSystem:
                 }
             
             # Extract face ROI
-            face_roi = self.extract_face_roi(image, faces[0])
+            face_roi = self.extract_face_roi(image, faces[0], timer=timer)
             if face_roi is None:
                 return {
                     'success': False,
                     'message': 'Could not extract face region'
                 }
             
-            # Save face image
-            user_id = len(self.users_data)
-            face_filename = f"{username}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jpg"
-            face_path = os.path.join(self.faces_dir, face_filename)
-            cv2.imwrite(face_path, face_roi)
+            rejected = self.check_face_quality(image, faces[0], face_roi, timer=timer)
+            if rejected:
+                return rejected
             
-            # Add to users data
-            self.users_data[username] = {
-                'user_id': user_id,
-                'face_file': face_filename,
-                'enrolled_at': datetime.now().isoformat(),
-                'user_info': user_info or {}
-            }
-            self.save_users_data()
+            # Satu writer sekaligus (antar worker); gallery di-publish terakhir sebagai commit point
+            with self.gallery.write_lock():
+                self.refresh_shared_state()
+                
+                # Save face image
+                face_filename = f"{username}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jpg"
+                face_path = os.path.join(self.faces_dir, face_filename)
+                face_image = cv2.imencode('.jpg', face_roi)[1].tobytes()
+                with open(face_path, 'wb') as f:
+                    f.write(face_image)
+                
+                # Template lama + template baru (maksimal max_templates, sisanya di-prune)
+                existing_files = template_files(self.users_data[username]) if username in self.users_data else []
+                keep = self.select_templates(username, face_roi)
+                pruned_files = [face_file for index, face_file in enumerate(existing_files) if index not in keep]
+                
+                # Add to registry (user_id unik diberikan oleh registry)
+                user_data = {
+                    'face_file': face_filename,
+                    'face_files': [existing_files[index] for index in keep] + [face_filename],
+                    'enrolled_at': datetime.now().isoformat(),
+                    'user_info': user_info or {}
+                }
+                user_data = self.store_user(username, user_data, [(face_filename, face_roi, face_image)], keep)
+                self.remove_face_files(pruned_files)
+            
+            if self.registry_sync is not None:
+                self.registry_sync.publish_enroll(username, user_data)
             
             # Retrain model
             training_result = self.train_model()
@@ -246,6 +922,8 @@ class OpenCVFaceSystem:
                 'success': True,
                 'message': f'Face enrolled successfully for {username}',
                 'face_file': face_filename,
+                'template_count': len(user_data['face_files']),
+                'pruned_templates': len(pruned_files),
                 'training_success': training_result
             }
             
@@ -256,6 +934,30 @@ class OpenCVFaceSystem:
                 'message': f'Enrollment error: {str(e)}'
             }
     
+    def store_user(self, username, user_data, faces, keep=()):
+        """
+        Simpan satu user ke registry dan local state (LBPH model, gallery)
+        faces: list (face_file, face_roi, face_image) template baru; keep: index template
+        lama yang dipertahankan. Urutan template = user_data['face_files']
+        Caller memegang gallery write lock; gallery di-publish terakhir sebagai commit point
+        Returns: user_data yang tersimpan di registry
+        """
+        face_images = {face_file: face_image for face_file, _, face_image in faces if face_image is not None}
+        user_data = self.registry.upsert(username, user_data, face_images)
+        self.users_data[username] = user_data
+        face_rois = [face_roi for _, face_roi, _ in faces]
+        if self.recognition_engine == 'lbph':
+            self.lbph_model.update_label(username, keep, face_rois)
+        self.update_templates(username, keep, face_rois)
+        return user_data
+    
+    def remove_face_files(self, face_files):
+        """Hapus face file dari faces_dir (template yang di-prune / user yang dihapus)"""
+        for face_file in face_files:
+            face_path = os.path.join(self.faces_dir, face_file)
+            if os.path.exists(face_path):
+                os.remove(face_path)
+    
     def train_model(self):
         """
         Simple face registration (no ML training needed for demo)
@@ -273,7 +975,7 @@ class OpenCVFaceSystem:
             print(f"[ERROR] Face registration: {e}")
             return False
     
-    def recognize_face(self, base64_image, confidence_threshold=80):
+    def recognize_face(self, image_data, confidence_threshold=80, timer=None):
         """
         Simple face recognition using template matching (demo version)
         """
@@ -286,14 +988,15 @@ class OpenCVFaceSystem:
                 }
             
             # Check if any faces enrolled
+            self.refresh_shared_state()
             if len(self.users_data) == 0:
                 return {
                     'success': False,
                     'message': 'No faces enrolled. Please enroll faces first.'
                 }
             
-            # Convert base64 to image
-            image = self.base64_to_image(base64_image)
+            # Convert base64 / raw bytes to image
+            image = self.load_image(image_data, timer=timer)
             if image is None:
                 return {
                     'success': False,
@@ -301,7 +1004,7 @@ class OpenCVFaceSystem:
                 }
             
             # Detect faces
-            faces = self.detect_faces(image)
+            faces = self.detect_faces(image, timer=timer)
             if len(faces) == 0:
                 return {
                     'success': False,
@@ -309,37 +1012,42 @@ class OpenCVFaceSystem:
                 }
             
             # Use first detected face
-            face_roi = self.extract_face_roi(image, faces[0])
+            face_roi = self.extract_face_roi(image, faces[0], timer=timer)
             if face_roi is None:
                 return {
                     'success': False,
                     'message': 'Could not extract face region'
                 }
             
-            # Simple template matching with enrolled faces
+            rejected = self.check_face_quality(image, faces[0], face_roi, timer=timer)
+            if rejected:
+                return rejected
+            
             best_match = None
             best_score = 0
             
-            for username, user_data in self.users_data.items():
-                face_file = user_data['face_file']
-                face_path = os.path.join(self.faces_dir, face_file)
+            with (timer or NULL_TIMER).stage('match'):
+                if self.recognition_engine == 'lbph' and len(self.lbph_model) > 0:
+                    # Single LBPH predict call
+                    username, distance = self.lbph_model.predict(face_roi, self.template_aggregation)
+                    scores = [(username, max(0.0, 1 - distance / LBPH_MAX_DISTANCE) * 100)]
+                    print(f"[DEBUG] LBPH predict {username}: distance={distance:.3f}")
+                else:
+                    # Vectorized template matching terhadap in-memory gallery
+                    scores = self.match_templates(face_roi)
+            
+            if scores:
+                username, max_score = max(scores, key=lambda item: item[1])
+                print(f"[DEBUG] Best match {username}: {max_score:.1f}% ({self.recognition_engine})")
                 
-                if os.path.exists(face_path):
-                    template = cv2.imread(face_path, cv2.IMREAD_GRAYSCALE)
-                    if template is not None:
-                        # Simple correlation coefficient
-                        correlation = cv2.matchTemplate(face_roi, template, cv2.TM_CCOEFF_NORMED)
-                        max_score = float(np.max(correlation)) * 100  # Convert to Python float
-                        
-                        print(f"[DEBUG] {username}: {max_score:.1f}%")
-                        
-                        if max_score > best_score:
-                            best_score = float(max_score)  # Ensure Python float
-                            best_match = {
-                                'username': username,
-                                'user_info': user_data['user_info'],
-                                'enrolled_at': user_data['enrolled_at']
-                            }
+                user_data = self.users_data.get(username)
+                if user_data and max_score > best_score:
+                    best_score = float(max_score)  # Ensure Python float
+                    best_match = {
+                        'username': username,
+                        'user_info': user_data['user_info'],
+                        'enrolled_at': user_data['enrolled_at']
+                    }
             
             if best_match and best_score >= confidence_threshold:
                 return {
@@ -364,41 +1072,261 @@ class OpenCVFaceSystem:
                 'message': f'Recognition error: {str(e)}'
             }
     
-    def get_enrolled_users(self):
+    def verification_score(self, username, face_roi):
         """
-        Get list of enrolled users
+        Score face ROI hanya terhadap template username (1:1, tidak tergantung ukuran gallery),
+        aggregate max / mean atas semua template user
+        Returns: score_percent, atau None jika username tidak punya template
         """
-        return list(self.users_data.keys())
+        if self.recognition_engine == 'lbph' and len(self.lbph_model) > 0:
+            distance = self.lbph_model.distance(username, face_roi, self.template_aggregation)
+            if distance is None:
+                return None
+            print(f"[DEBUG] LBPH verify {username}: distance={distance:.3f}")
+            return max(0.0, 1 - distance / LBPH_MAX_DISTANCE) * 100
+        
+        templates = self.gallery.templates(username)
+        query = self.normalize_template(face_roi)
+        if templates is None:
+            return None
+        if query is None:  # ROI flat (tanpa variasi) -> score 0
+            return 0.0
+        scores = templates @ query
+        score = scores.mean() if self.template_aggregation == 'mean' else scores.max()
+        return max(0.0, float(score) * 100)
     
-    def delete_user(self, username):
+    def verify_face(self, username, image_data, confidence_threshold=80, timer=None):
         """
-        Delete enrolled user dan face data
+        1:1 face verification untuk username yang di-claim (mis. diisi di form login)
+        Fungsi: Bandingkan face hanya dengan template user tersebut, bukan 1:N ke semua user
         """
         try:
-            if username in self.users_data:
-                # Delete face file
-                face_file = self.users_data[username]['face_file']
-                face_path = os.path.join(self.faces_dir, face_file)
-                if os.path.exists(face_path):
-                    os.remove(face_path)
+            if not self.opencv_available:
+                return {
+                    'success': False,
+                    'message': 'Face recognition not available on this server. Please use password login.'
+                }
+            
+            self.refresh_shared_state()
+            user_data = self.users_data.get(username)
+            if user_data is None:
+                return {
+                    'success': False,
+                    'message': 'Face not verified for this user',
+                    'confidence': 0.0,
+                    'match_percentage': 0.0
+                }
+            
+            # Convert base64 / raw bytes to image
+            image = self.load_image(image_data, timer=timer)
+            if image is None:
+                return {
+                    'success': False,
+                    'message': 'Invalid image data'
+                }
+            
+            faces = self.detect_faces(image, timer=timer)
+            if len(faces) == 0:
+                return {
+                    'success': False,
+                    'message': 'No face detected in image'
+                }
+            
+            face_roi = self.extract_face_roi(image, faces[0], timer=timer)
+            if face_roi is None:
+                return {
+                    'success': False,
+                    'message': 'Could not extract face region'
+                }
+            
+            rejected = self.check_face_quality(image, faces[0], face_roi, timer=timer)
+            if rejected:
+                return rejected
+            
+            with (timer or NULL_TIMER).stage('match'):
+                score = self.verification_score(username, face_roi)
+            score = float(score or 0.0)
+            print(f"[DEBUG] Verify {username}: {score:.1f}% ({self.recognition_engine})")
+            
+            if score >= confidence_threshold:
+                return {
+                    'success': True,
+                    'message': 'Face verified successfully',
+                    'user': {
+                        'username': username,
+                        'user_info': user_data['user_info'],
+                        'enrolled_at': user_data['enrolled_at']
+                    },
+                    'confidence': score,
+                    'match_percentage': score
+                }
+            return {
+                'success': False,
+                'message': 'Face not verified for this user',
+                'confidence': score,
+                'match_percentage': score
+            }
+        
+        except Exception as e:
+            print(f"[ERROR] Face verification: {e}")
+            return {
+                'success': False,
+                'message': f'Verification error: {str(e)}'
+            }
+    
+    def recognize_faces_batch(self, images, confidence_threshold=80, timer=None):
+        """
+        Recognize beberapa frame sekaligus (misal burst dari kiosk)
+        Semua ROI di-match ke gallery dalam satu vectorized pass.
+        Returns: per-frame results + fused best match (rata-rata score per user dari semua frame valid)
+        """
+        try:
+            if not self.opencv_available:
+                return {
+                    'success': False,
+                    'message': 'Face recognition not available on this server. Please use password login.'
+                }
+            
+            self.refresh_shared_state()
+            if len(self.users_data) == 0:
+                return {
+                    'success': False,
+                    'message': 'No faces enrolled. Please enroll faces first.'
+                }
+            
+            # Decode + detect + extract ROI per frame
+            frames = []
+            face_rois = []
+            for index, image_data in enumerate(images):
+                frame = {'frame': index, 'success': False}
+                frames.append(frame)
+                
+                image = self.load_image(image_data, timer=timer)
+                if image is None:
+                    frame['message'] = 'Invalid image data'
+                    continue
+                
+                faces = self.detect_faces(image, timer=timer)
+                if len(faces) == 0:
+                    frame['message'] = 'No face detected in image'
+                    continue
                 
-                # Remove dari users data
-                del self.users_data[username]
-                self.save_users_data()
+                face_roi = self.extract_face_roi(image, faces[0], timer=timer)
+                if face_roi is None:
+                    frame['message'] = 'Could not extract face region'
+                    continue
                 
-                # Retrain model
-                if len(self.users_data) > 0:
-                    self.train_model()
+                rejected = self.check_face_quality(image, faces[0], face_roi, timer=timer)
+                if rejected:
+                    frame.update(rejected)
+                    continue
                 
+                frame['roi_index'] = len(face_rois)
+                face_rois.append(face_roi)
+            
+            # Satu matching pass untuk semua ROI
+            with (timer or NULL_TIMER).stage('match'):
+                usernames, scores = self.match_templates_batch(face_rois)
+            if scores is None:
                 return {
-                    'success': True,
-                    'message': f'User {username} deleted successfully'
+                    'success': False,
+                    'message': 'No face detected in any frame',
+                    'frames': frames,
+                    'frames_processed': 0
                 }
+            valid = ~np.isnan(scores[:, 0])  # ROI flat tidak ikut fused score
+            
+            for frame in frames:
+                roi_index = frame.pop('roi_index', None)
+                if roi_index is None:
+                    continue
+                if not valid[roi_index]:
+                    frame['message'] = 'Face region has no contrast'
+                    continue
+                best_index = int(np.argmax(scores[roi_index]))
+                best_score = float(scores[roi_index, best_index])
+                frame['confidence'] = best_score
+                frame['match_percentage'] = best_score
+                if best_score >= confidence_threshold:
+                    frame['success'] = True
+                    frame['message'] = 'Face recognized successfully'
+                    frame['username'] = usernames[best_index]
+                else:
+                    frame['message'] = 'Face not recognized or confidence too low'
+            
+            # Fused match: rata-rata score setiap user di semua frame valid
+            fused_scores = scores[valid].mean(axis=0)
+            best_index = int(np.argmax(fused_scores))
+            best_score = float(fused_scores[best_index])
+            username = usernames[best_index]
+            user_data = self.users_data.get(username)
+            frames_processed = int(valid.sum())
+            print(f"[DEBUG] Batch fused match {username}: {best_score:.1f}% over {frames_processed} frames")
+            
+            result = {
+                'frames': frames,
+                'frames_processed': frames_processed,
+                'confidence': best_score,
+                'match_percentage': best_score
+            }
+            if user_data and best_score >= confidence_threshold:
+                result.update({
+                    'success': True,
+                    'message': 'Face recognized successfully',
+                    'user': {
+                        'username': username,
+                        'user_info': user_data['user_info'],
+                        'enrolled_at': user_data['enrolled_at']
+                    }
+                })
             else:
-                return {
+                result.update({
                     'success': False,
-                    'message': f'User {username} not found'
-                }
+                    'message': 'Face not recognized or confidence too low'
+                })
+            return result
+            
+        except Exception as e:
+            print(f"[ERROR] Batch face recognition: {e}")
+            return {
+                'success': False,
+                'message': f'Recognition error: {str(e)}'
+            }
+    
+    def get_enrolled_users(self):
+        """
+        Get list of enrolled users
+        """
+        self.refresh_shared_state()
+        return list(self.users_data.keys())
+    
+    def get_stats(self):
+        """Engine info + ukuran gallery / model untuk dashboard"""
+        stats = super().get_stats()
+        stats.update({
+            'recognition_engine': self.recognition_engine,
+            'detection_mode': self.detection_mode,
+            'templates': self.template_count() if self.opencv_available else 0,
+            'max_templates': self.max_templates if self.opencv_available else 0,
+            'match_threads': self.match_threads if self.opencv_available else 0,
+        })
+        return stats
+    
+    def delete_user(self, username):
+        """
+        Delete enrolled user dan face data
+        """
+        try:
+            if self.gallery is not None:
+                with self.gallery.write_lock():
+                    self.refresh_shared_state()
+                    result = self._delete_user(username)
+            else:
+                result = self._delete_user(username)
+            
+            if result['success'] and self.registry_sync is not None:
+                self.registry_sync.publish_delete(username)
+            return result
                 
         except Exception as e:
             print(f"[ERROR] Delete user: {e}")
@@ -406,6 +1334,44 @@ class OpenCVFaceSystem:
                 'success': False,
                 'message': f'Delete error: {str(e)}'
             }
+    
+    def _delete_user(self, username):
+        """Delete user; caller memegang gallery write lock"""
+        if username not in self.users_data:
+            return {
+                'success': False,
+                'message': f'User {username} not found'
+            }
+        
+        # Remove dari registry
+        face_files = template_files(self.users_data.pop(username))
+        self.registry.delete(username)
+        self.purge_local_user(username, face_files)
+        
+        # Retrain model
+        if len(self.users_data) > 0:
+            self.train_model()
+        
+        return {
+            'success': True,
+            'message': f'User {username} deleted successfully'
+        }
+
+    def purge_local_user(self, username, face_files=()):
+        """
+        Hapus user dari local state: users_data, face files, LBPH histogram dan gallery rows
+        Registry yang di-share (database) tidak disentuh; users.json (JsonFaceRegistry)
+        adalah file lokal per replica sehingga entry-nya ikut dihapus
+        """
+        local = self.users_data.pop(username, None)
+        if local is not None:
+            face_files = list(face_files) + template_files(local)
+            if not self.registry.shared:
+                self.registry.delete(username)
+        self.remove_face_files(face_files)
+        if self.recognition_engine == 'lbph':
+            self.lbph_model.remove(username)
+        if self.gallery is not None:
+            self.remove_template(username)
 
-# Global instance
-face_system = OpenCVFaceSystem()
+# Global instance: lihat face_service.get_face_system() (lazy, satu per process)
@@ -4,6 +4,14 @@ import json
 import os
 from functools import wraps
 
+# Lua script untuk append_versioned_entry: member = "<version>:<json>" supaya unik
+VERSIONED_ENTRY_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+redis.call('ZADD', KEYS[2], version, version .. ':' .. ARGV[1])
+redis.call('ZREMRANGEBYRANK', KEYS[2], 0, -(tonumber(ARGV[2]) + 1))
+return version
+"""
+
 class RedisManager:
     """
     Redis Manager Class untuk handle semua operasi Redis
@@ -159,6 +167,9 @@ class RedisManager:
             field (str): Field name dalam hash
             value (any): Value untuk field
             
+        Returns:
+            bool: True jika tersimpan (field baru maupun update), False jika Redis error
+            
         Fungsi: Simpan data dalam format hash (seperti object/dictionary)
         """
         if not self.redis_client:
@@ -166,22 +177,27 @@ class RedisManager:
             
         try:
             json_value = json.dumps(value) if not isinstance(value, str) else value
-            return self.redis_client.hset(hash_key, field, json_value)
+            self.redis_client.hset(hash_key, field, json_value)
+            return True
         except Exception as e:
             print(f"Redis HSET error: {e}")
             return False
     
-    def get_hash(self, hash_key, field=None):
+    def get_hash(self, hash_key, field=None, raise_errors=False):
         """
         Get hash field value atau semua hash
         
         Args:
             hash_key (str): Hash key name
             field (str): Field name (None = get all fields)
+            raise_errors (bool): Raise error Redis / koneksi tidak tersedia, bukan return None
+                (caller yang harus membedakan "field tidak ada" dari "Redis gagal")
             
         Fungsi: Ambil data dari hash structure
         """
         if not self.redis_client:
+            if raise_errors:
+                raise redis.ConnectionError('Redis not connected')
             return None
             
         try:
@@ -207,6 +223,84 @@ class RedisManager:
                 
         except Exception as e:
             print(f"Redis HGET error: {e}")
+            if raise_errors:
+                raise
+            return None
+    
+    def delete_hash_field(self, hash_key, field):
+        """
+        Hapus satu field dari hash
+        
+        Args:
+            hash_key (str): Hash key name
+            field (str): Field name yang mau dihapus
+            
+        Fungsi: Delete field dari hash structure
+        """
+        if not self.redis_client:
+            return False
+            
+        try:
+            return self.redis_client.hdel(hash_key, field) > 0
+        except Exception as e:
+            print(f"Redis HDEL error: {e}")
+            return False
+    
+    def append_versioned_entry(self, version_key, log_key, entry, max_entries=1000):
+        """
+        Bump version counter dan catat entry di change log secara atomic
+        
+        Args:
+            version_key (str): Key counter version
+            log_key (str): Sorted set change log (score = version)
+            entry (any): Data entry (akan diconvert ke JSON)
+            max_entries (int): Panjang maksimal change log (entry lama dibuang)
+            
+        Returns:
+            int: Version baru, atau None jika gagal
+            
+        Fungsi: INCR + ZADD dalam satu Lua script, sehingga reader tidak pernah
+        melihat version tanpa entry-nya
+        """
+        if not self.redis_client:
+            return None
+            
+        try:
+            json_value = json.dumps(entry) if not isinstance(entry, str) else entry
+            return int(self.redis_client.eval(
+                VERSIONED_ENTRY_SCRIPT, 2, version_key, log_key, json_value, max_entries))
+        except Exception as e:
+            print(f"Redis versioned entry error: {e}")
+            return None
+    
+    def get_entries_since(self, log_key, version):
+        """
+        Ambil entry change log dengan version > version
+        
+        Args:
+            log_key (str): Sorted set change log
+            version (int): Version terakhir yang sudah diproses
+            
+        Returns:
+            list: [(version, entry)] urut naik, atau None jika gagal
+            
+        Fungsi: Pasangan dari append_versioned_entry untuk incremental sync
+        """
+        if not self.redis_client:
+            return None
+            
+        try:
+            members = self.redis_client.zrangebyscore(log_key, f'({int(version)}', '+inf')
+            entries = []
+            for member in members:
+                entry_version, _, value = member.partition(':')
+                try:
+                    entries.append((int(entry_version), json.loads(value)))
+                except json.JSONDecodeError:
+                    entries.append((int(entry_version), value))
+            return entries
+        except Exception as e:
+            print(f"Redis ZRANGEBYSCORE error: {e}")
             return None
 
 # Global Redis instance
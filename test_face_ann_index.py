@@ -0,0 +1,61 @@
+# Test IVF face ANN index: gallery yang tumbuh incremental dari kosong
+# Jalankan: python -m pytest -q test_face_ann_index.py
+import numpy as np
+
+import face_models
+from face_models import FaceEncodingIndex, ENCODING_DIM
+from face_ann_index import IVFFlatIndex
+
+def make_gallery(count, clusters=64, seed=1):
+    """Encoding sintetis: cluster acak + noise kecil (mirip beberapa foto per orang)"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, ENCODING_DIM)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centers[labels] + 0.3 * rng.normal(size=(count, ENCODING_DIM)).astype(np.float32)
+    return vectors.astype(np.float32)
+
+def probed_rows(ann_index, query):
+    """Jumlah row yang discan satu query (isi n_probe list terdekat)"""
+    query = np.asarray(query, dtype=np.float32).reshape(1, ann_index.dim)
+    probes = np.atleast_1d(ann_index._nearest_centroids(query, count=ann_index.n_probe)[0])
+    return sum(len(ann_index.lists[int(i)]['face_ids']) for i in probes)
+
+def test_ann_index_retrains_while_growing_from_empty(tmp_path, monkeypatch):
+    monkeypatch.setattr(face_models, 'FACE_ANN_INDEX_PATH', str(tmp_path / 'face_ann_index.npz'))
+    index = FaceEncodingIndex(backend='ivf')
+    index.ann_index = IVFFlatIndex(dim=ENCODING_DIM, n_probe=face_models.FACE_ANN_NPROBE)
+    vectors = make_gallery(4000)
+
+    # Enrollment satu per satu; timer background disimulasikan setiap 250 encoding
+    for face_id, vector in enumerate(vectors):
+        index.upsert(face_id, face_id, vector)
+        if face_id % 250 == 249:
+            index.maintain_ann_index()
+
+    ann_index = index.ann_index
+    assert len(ann_index) == len(vectors)
+    assert not index.ann_index_needs_retrain(ann_index)
+    assert len(ann_index.lists) >= int(np.sqrt(len(vectors) / face_models.FACE_ANN_RETRAIN_GROWTH))
+
+    rng = np.random.default_rng(2)
+    queries = rng.choice(len(vectors), 200, replace=False)
+    hits, scanned = 0, []
+    for face_id in queries.tolist():
+        query = vectors[face_id] + 0.05 * rng.normal(size=ENCODING_DIM).astype(np.float32)
+        results = ann_index.search(query, k=1)
+        distances = np.linalg.norm(vectors - query, axis=1)
+        hits += results[0][0] == int(np.argmin(distances))
+        scanned.append(probed_rows(ann_index, query))
+
+    assert hits / len(queries) >= 0.95
+    assert np.mean(scanned) < 0.35 * len(vectors)
+
+def test_ann_index_without_retrain_scans_whole_gallery():
+    """Tanpa re-train, index yang mulai kosong hanya punya satu list"""
+    ann_index = IVFFlatIndex(dim=ENCODING_DIM, n_probe=8)
+    vectors = make_gallery(500)
+    for face_id, vector in enumerate(vectors):
+        ann_index.add(face_id, face_id, vector)
+    assert len(ann_index.lists) == 1
+    assert probed_rows(ann_index, vectors[0]) == len(vectors)
+    assert FaceEncodingIndex(backend='ivf').ann_index_needs_retrain(ann_index)
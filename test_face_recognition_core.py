@@ -0,0 +1,53 @@
+# Test DlibFaceEngine enrollment: satu FaceImageContext untuk validate -> encode -> save
+# Jalankan: python -m pytest -q test_face_recognition_core.py (butuh face_recognition + Pillow)
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+face_recognition_core = pytest.importorskip('face_recognition_core')
+
+FACES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'faces_data')
+
+@pytest.fixture
+def app(tmp_path):
+    from flask import Flask
+    from face_models import init_face_database
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'face.db'}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    init_face_database(app)
+    with app.app_context():
+        yield app
+
+def test_enroll_detects_faces_once(app, monkeypatch):
+    image = cv2.imread(os.path.join(FACES_DIR, 'elis_20250916_090710.jpg'))
+    height, width = image.shape[:2]
+    calls = []
+
+    # Wajah besar di tengah frame supaya lolos validate_face_quality (>= 10% area)
+    def face_locations(rgb, number_of_times_to_upsample=1, model='hog'):
+        calls.append(rgb.shape)
+        return [(height // 8, width * 7 // 8, height * 7 // 8, width // 8)]
+
+    def face_encodings(rgb, known_face_locations=None, num_jitters=1, model='small'):
+        assert known_face_locations is not None  # Encoding tidak boleh detect ulang
+        return [np.full(128, 0.05)]
+
+    monkeypatch.setattr(face_recognition_core.face_recognition, 'face_locations', face_locations)
+    monkeypatch.setattr(face_recognition_core.face_recognition, 'face_encodings', face_encodings)
+    saved = []
+    monkeypatch.setattr(face_recognition_core.face_audit_writer, 'submit_photo',
+                        lambda photo, path, quality=85: saved.append(path) or True)
+
+    engine = face_recognition_core.DlibFaceEngine(max_side=max(height, width))
+    result = engine.enroll_face('elis', cv2.imencode('.jpg', image)[1].tobytes())
+
+    assert result['success'], result
+    assert len(calls) == 1
+    assert len(saved) == 1
+
+    from face_models import FaceData
+    face = FaceData.query.one()
+    assert face.photo_filename == os.path.basename(saved[0])
@@ -0,0 +1,146 @@
+# CPU thread budget per process (gunicorn worker / face worker)
+#
+# OpenCV dan BLAS (OpenBLAS/MKL via numpy) default-nya spawn satu thread per core di
+# setiap process. Dengan beberapa gunicorn worker di box kecil, login wajah yang
+# bersamaan jadi oversubscribe CPU. Budget per worker = core tersedia / jumlah worker:
+#   - cv2.setNumThreads(budget)              (detectMultiScale, resize, ...)
+#   - thread pool sharded matching = budget  (opencv_face_system.score_rows)
+#   - BLAS/OMP = 1 thread per call           (matmul sudah diparalelkan per shard)
+#
+# BLAS membaca env var saat library di-load, jadi apply_thread_budget() harus dipanggil
+# sebelum numpy di-import (paling atas app.py / face_worker.py). Jika numpy sudah
+# ter-import, limit dipasang lewat threadpoolctl (optional) jika tersedia.
+#
+# Override (env):
+#   FACE_THREAD_BUDGET=0   disable (pakai default library)
+#   FACE_CPU_COUNT         jumlah core (default: cgroup quota / CPU affinity)
+#   FACE_WORKER_COUNT      jumlah process (default: --workers gunicorn / WEB_CONCURRENCY)
+#   FACE_THREADS           budget per process (langsung, abaikan perhitungan di atas)
+#   FACE_BLAS_THREADS      thread BLAS/OMP per process (default 1)
+#   OMP_NUM_THREADS dkk. yang sudah di-set eksplisit tidak di-override
+import os
+import sys
+import threading
+
+BLAS_THREAD_ENV_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                        'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS']
+
+_budget = None
+_budget_lock = threading.Lock()
+
+def available_cpus():
+    """
+    Jumlah core yang benar-benar boleh dipakai process ini
+    Fungsi: cgroup CPU quota (container Railway / Docker) dan CPU affinity,
+    bukan jumlah core host dari os.cpu_count()
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    quota = None
+    try:
+        # cgroup v2: "<quota> <period>" atau "max <period>"
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            limit, period = f.read().split()[:2]
+        if limit != 'max':
+            quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:
+            # cgroup v1
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+                limit = int(f.read())
+            with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota is not None:
+        cpus = min(cpus, max(1, int(quota)))
+    return max(1, cpus)
+
+def gunicorn_workers(argv=None):
+    """
+    Jumlah worker dari command line gunicorn (worker adalah fork master, sys.argv sama)
+    Returns: int, atau None jika bukan gunicorn / --workers tidak di-set
+    """
+    argv = sys.argv if argv is None else argv
+    if not argv or 'gunicorn' not in os.path.basename(argv[0]):
+        return None
+    for index, arg in enumerate(argv):
+        try:
+            if arg in ('-w', '--workers') and index + 1 < len(argv):
+                return int(argv[index + 1])
+            if arg.startswith('--workers='):
+                return int(arg.split('=', 1)[1])
+        except ValueError:
+            return None
+    return None
+
+def worker_count(default=1):
+    """Jumlah process yang berbagi CPU: FACE_WORKER_COUNT > --workers gunicorn > WEB_CONCURRENCY"""
+    for value in (os.environ.get('FACE_WORKER_COUNT'), gunicorn_workers(), os.environ.get('WEB_CONCURRENCY')):
+        try:
+            if value is not None and int(value) > 0:
+                return int(value)
+        except ValueError:
+            pass
+    return default
+
+def compute_thread_budget(workers=None):
+    """
+    Returns: dict {'enabled', 'cpus', 'workers', 'threads', 'blas_threads'}
+    threads = core / worker (minimal 1), kecuali FACE_THREADS di-set
+    """
+    cpus = int(os.environ.get('FACE_CPU_COUNT', 0)) or available_cpus()
+    workers = workers or worker_count()
+    threads = int(os.environ.get('FACE_THREADS', 0)) or max(1, cpus // workers)
+    return {
+        'enabled': os.environ.get('FACE_THREAD_BUDGET', '1') != '0',
+        'cpus': cpus,
+        'workers': workers,
+        'threads': threads,
+        'blas_threads': int(os.environ.get('FACE_BLAS_THREADS', 1)),
+    }
+
+def limit_blas_threads(blas_threads):
+    """
+    Pasang limit BLAS/OMP: env var jika numpy belum di-import, selain itu threadpoolctl
+    Returns: True jika limit efektif untuk process ini
+    """
+    if 'numpy' not in sys.modules:
+        for name in BLAS_THREAD_ENV_VARS:
+            os.environ.setdefault(name, str(blas_threads))
+        return True
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        print("[WARNING] Thread budget: numpy already imported, BLAS thread limit not applied "
+              "(install threadpoolctl or apply the budget before importing numpy)")
+        return False
+    threadpool_limits(limits=blas_threads)
+    return True
+
+def apply_thread_budget(workers=None):
+    """
+    Hitung dan pasang thread budget untuk process ini (sekali; panggilan berikutnya
+    mengembalikan budget yang sama). Panggil sebelum numpy di-import.
+    workers: jumlah process yang berbagi CPU (default: dari gunicorn / env)
+    Returns: budget dict (lihat compute_thread_budget)
+    """
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            budget = compute_thread_budget(workers)
+            if budget['enabled']:
+                limit_blas_threads(budget['blas_threads'])
+                print(f"[OK] Thread budget: {budget['threads']} threads/process "
+                      f"({budget['cpus']} CPUs / {budget['workers']} workers, BLAS {budget['blas_threads']})")
+            _budget = budget
+        return _budget
+
+def configure_opencv_threads(cv2):
+    """cv2.setNumThreads sesuai budget (dipanggil setelah cv2 di-import). Returns: thread count atau None"""
+    budget = apply_thread_budget()
+    if not budget['enabled']:
+        return None
+    cv2.setNumThreads(budget['threads'])
+    return budget['threads']